@@ -0,0 +1,220 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module implementing the aggregation of raw detections per device over a time
+window.
+"""
+
+import threading
+import time
+
+class RawAggregator(object):
+    """
+    Aggregates raw detection records per key (e.g. device and frequency)
+    during a window starting at the first record of that key. When the window
+    has passed, a single record is emitted, carrying the number of records,
+    the mean, minimum and maximum signal strength and the timestamps of the
+    first and last record.
+
+    Windows are closed when a newer record arrives, with expired windows of
+    other keys checked at most once per second. Once started, a timer closes
+    expired windows too when no records arrive, so each record is emitted
+    within a second, or a window when shorter, after its window has passed.
+    Call stop() or flush() to emit all pending records.
+    """
+    def __init__(self, window, emit, key, signal):
+        """
+        Initialisation.
+
+        @param   window   The aggregation window in seconds. Each record is
+                            emitted as is when 0.
+        @param   emit     Function to call with each emitted record.
+        @param   key      Function returning the aggregation key of a record.
+        @param   signal   Name of the signal strength attribute of records.
+        """
+        self.window = window
+        self.emit = emit
+        self.key = key
+        self.signal = signal
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.checked = 0
+        self.timer = None
+
+    def start(self):
+        """
+        Start the timer closing expired windows. Windows are compared with the
+        current time, so records should be timestamped with it.
+        """
+        if self.window > 0 and self.timer is None:
+            self.timer = AggregationTimer(self, min(self.window, 1))
+            self.timer.start()
+
+    def stop(self):
+        """
+        Stop the timer, if started, and emit all pending records.
+        """
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer = None
+        self.flush()
+
+    def add(self, record):
+        """
+        Add a detection record.
+
+        @param   record   The detection record, it is used as the aggregate
+                            record when it is the first one of its window.
+        """
+        if not self.window > 0:
+            self.emit(record)
+            return
+
+        timestamp = record.timestamp
+        key = self.key(record)
+        emit = []
+        self.lock.acquire()
+        try:
+            entry = self.pending.get(key)
+            if entry is not None and timestamp - entry[0].timestamp >= \
+                self.window:
+                emit.append(self.pending.pop(key))
+                entry = None
+
+            signal = getattr(record, self.signal)
+            if entry is None:
+                if isinstance(signal, int):
+                    self.pending[key] = [record, 1, timestamp, 1, signal,
+                        signal, signal]
+                else:
+                    self.pending[key] = [record, 1, timestamp, 0, 0, None,
+                        None]
+            else:
+                entry[1] += 1
+                entry[2] = timestamp
+                if isinstance(signal, int):
+                    entry[3] += 1
+                    entry[4] += signal
+                    if entry[5] is None or signal < entry[5]:
+                        entry[5] = signal
+                    if entry[6] is None or signal > entry[6]:
+                        entry[6] = signal
+
+            if timestamp - self.checked >= 1:
+                self.checked = timestamp
+                emit.extend(self._expired(timestamp))
+        finally:
+            self.lock.release()
+
+        for entry in emit:
+            self._emit(entry)
+
+    def expire(self, now):
+        """
+        Emit the records of the windows that have passed at the given time.
+
+        @param   now   UNIX timestamp.
+        """
+        self.lock.acquire()
+        try:
+            emit = self._expired(now)
+        finally:
+            self.lock.release()
+
+        for entry in sorted(emit, key=lambda e: e[0].timestamp):
+            self._emit(entry)
+
+    def _expired(self, now):
+        """
+        Remove the entries of the windows that have passed at the given time.
+        Should be called with the lock held.
+
+        @param   now   UNIX timestamp.
+        @return        List of the removed entries.
+        """
+        expired = []
+        for k, e in self.pending.items():
+            if now - e[0].timestamp >= self.window:
+                expired.append(self.pending.pop(k))
+        return expired
+
+    def flush(self):
+        """
+        Emit all pending records.
+        """
+        self.lock.acquire()
+        try:
+            emit = self.pending.values()
+            self.pending = {}
+        finally:
+            self.lock.release()
+
+        for entry in sorted(emit, key=lambda e: e[0].timestamp):
+            self._emit(entry)
+
+    def _emit(self, entry):
+        """
+        Complete the aggregate record of the given entry and emit it.
+        """
+        record, count, last, signals, total, minimum, maximum = entry
+        record.count = count
+        record.last = last
+        if signals > 0:
+            setattr(record, self.signal, int(round(float(total) / signals)))
+            record.signal_min = minimum
+            record.signal_max = maximum
+        else:
+            record.signal_min = record.signal_max = ''
+        self.emit(record)
+
+class AggregationTimer(threading.Thread):
+    """
+    Thread closing the expired windows of a RawAggregator at a regular
+    interval.
+    """
+    def __init__(self, aggregator, interval):
+        """
+        Initialisation of the thread.
+
+        @param   aggregator   Reference to the RawAggregator.
+        @param   interval     The time between two checks, in seconds.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.aggregator = aggregator
+        self.interval = interval
+        self._running = True
+
+    def run(self):
+        """
+        Start the thread. Close the expired windows at a regular interval
+        until stopped.
+        """
+        while self._running:
+            time.sleep(self.interval)
+            if self._running:
+                self.aggregator.expire(time.time())
+
+    def stop(self):
+        """
+        Stop the thread.
+        """
+        self._running = False
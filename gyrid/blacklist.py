@@ -0,0 +1,80 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module implementing the blacklist of MAC-addresses excluded from registration.
+"""
+
+class Blacklist(object):
+    """
+    Prefix index of blacklisted MAC-addresses. Entries are stored as packed
+    integers in a set per prefix length (in octets), so matching an address
+    takes one set lookup per distinct prefix length, regardless of the number
+    of entries.
+    """
+    def __init__(self):
+        """
+        Initialisation of an empty blacklist.
+        """
+        self.prefixes = {}
+        self.index = []
+
+    def add(self, prefix):
+        """
+        Add the given MAC-address or start of a MAC-address to the blacklist.
+
+        @param   prefix   The (start of the) MAC-address, in colon-separated
+                            format. A trailing colon is allowed.
+        """
+        octets = prefix.strip().rstrip(':').split(':')
+        self.prefixes.setdefault(len(octets), set()).add(
+            int(''.join(octets), 16))
+        self.index = [(8 * (6 - length), self.prefixes[length]) for length in \
+            sorted(self.prefixes)]
+
+    def clear(self):
+        """
+        Remove all entries from the blacklist.
+        """
+        self.prefixes.clear()
+        self.index = []
+
+    def match(self, address):
+        """
+        Check if the given MAC-address is blacklisted.
+
+        @param   address   The MAC-address to check, in colon-separated format.
+        @return            True if it is blacklisted, else False.
+        """
+        if not self.index:
+            return False
+
+        try:
+            value = int(address.replace(':', ''), 16)
+        except ValueError:
+            return False
+
+        for shift, prefixes in self.index:
+            if value >> shift in prefixes:
+                return True
+        return False
+
+    def __len__(self):
+        return sum(len(i) for i in self.prefixes.values())
@@ -112,6 +112,66 @@ class Configuration(object):
             values = {},
             default = None)
 
+        bluetooth_event_loop = _Option(name = 'bluetooth_event_loop',
+            description = 'Handle the inquiries of all Bluetooth adapters ' +
+                'in a single thread, waiting for the HCI events of all ' +
+                'adapters at once, instead of using a thread per adapter.',
+            type = '"%s".lower().strip() in ["true", "yes", "y", "1"]',
+            values = {True: 'Use a single event loop.', False: \
+                'Use a thread per adapter.'},
+            default = False)
+
+        bluetooth_periodic_inquiry = _Option(
+            name = 'bluetooth_periodic_inquiry',
+            description = 'Let the Bluetooth adapters start their inquiries ' +
+                'themselves using periodic inquiry mode, instead of ' +
+                'sending an inquiry command for each inquiry. An inquiry ' +
+                'then lasts 2.56s less than the inquiry time defined by ' +
+                'buffer_size, and the next one starts 1.28s to 2.56s after ' +
+                'it has ended. Adapters that don\'t support it use ' +
+                'separate inquiries.',
+            type = '"%s".lower().strip() in ["true", "yes", "y", "1"]',
+            values = {True: 'Use periodic inquiry mode.', False: \
+                'Use separate inquiries.'},
+            default = False)
+
+        bluetooth_inquiry_mode = _Option(name = 'bluetooth_inquiry_mode',
+            description = 'How Bluetooth adapters choose the length of ' +
+                'their inquiries. Not used in periodic inquiry mode.',
+            values = {'fixed': 'Use the inquiry time defined by ' +
+                    'buffer_size for each inquiry.',
+                'adaptive': 'Use the inquiry time that finds the most ' +
+                    'devices per second, between the minimum and maximum ' +
+                    'inquiry time. Devices disappear from the pool no ' +
+                    'sooner than an inquiry takes.'},
+            default = 'fixed')
+
+        bluetooth_min_inquiry_time = _Option(
+            name = 'bluetooth_min_inquiry_time',
+            description = 'The minimum inquiry time in seconds in adaptive ' +
+                'inquiry mode, rounded up to a multiple of 1.28s.',
+            type = 'float("%s")',
+            values = {},
+            default = 2.56)
+
+        bluetooth_max_inquiry_time = _Option(
+            name = 'bluetooth_max_inquiry_time',
+            description = 'The maximum inquiry time in seconds in adaptive ' +
+                'inquiry mode, rounded up to a multiple of 1.28s.',
+            type = 'float("%s")',
+            values = {},
+            default = 15.36)
+
+        raw_aggregation_window = _Option(name = 'raw_aggregation_window',
+            description = 'Aggregate the raw Bluetooth and WiFi device ' +
+                'detections per device (and frequency) over this number of ' +
+                'seconds. A single line is logged and sent per window, ' +
+                'containing the mean, minimum and maximum RSSI, the number ' +
+                'of detections and the time of the last one. Disable when 0.',
+            type = 'self._parse_int(%s)',
+            values = {},
+            default = 0)
+
         blacklist_file = _Option(name = 'blacklist_file',
             description = 'Path to the blacklist file containing Bluetooth ' +
                 'MAC-addresses excluded from registration.',
@@ -131,6 +191,15 @@ class Configuration(object):
             values = {},
             default = "")
 
+        hash_cache_size = _Option(name = 'hash_cache_size',
+            description = 'The maximum number of digests to keep in ' +
+                'memory, so frequently seen addresses aren\'t hashed over ' +
+                'and over again. The cache is flushed when the salt ' +
+                'changes. Disable caching when 0.',
+            type = 'self._parse_int(%s)',
+            values = {},
+            default = 4096)
+
         arduino_conffile = _Option(name = 'arduino_conffile',
             description = 'Path to the Arduino rotating platform ' +
                 'configuration file. This should be in CSV format, ' +
@@ -174,11 +243,112 @@ class Configuration(object):
             values = {},
             default = 250)
 
+        wifi_capture_mode = _Option(name = 'wifi_capture_mode',
+            description = 'How WiFi frames are captured and decoded. The ' +
+                'native mode reads raw frames from the monitor interface ' +
+                'and only decodes the header fields that are logged, ' +
+                'scapy dissects each frame completely and is much slower. ' +
+                'Native mode falls back to scapy when it is unavailable.',
+            values = {'native': 'Use the native decoder.',
+                'scapy': 'Use scapy.'},
+            default = 'native')
+
+        wifi_capture_filter = _Option(name = 'wifi_capture_filter',
+            description = 'Which WiFi frames are filtered in the kernel ' +
+                'when using the native capture mode, so they never reach ' +
+                'Gyrid. Capture statistics are written to the info log.',
+            values = {'logged': 'Drop frames with a bad FCS and frames of ' +
+                    'a kind that is not logged.',
+                'devices': 'Drop frames that are not logged, and frames ' +
+                    'without a unicast, globally unique transmitter. ' +
+                    'These are left out of the raw WiFi log too.',
+                'none': 'Don\'t filter frames.'},
+            default = 'logged')
+
+        wifi_ring_adapters = _Option(name = 'wifi_ring_adapters',
+            description = 'Comma-separated list of WiFi adapters, by ' +
+                'MAC-address or interface name, that capture through a ' +
+                'memory-mapped ring buffer (TPACKET_V3) when using the ' +
+                'native capture mode. Frames are then read from the ring ' +
+                'a block at a time instead of one system call per frame. ' +
+                'Use all to enable it for every adapter, disable when None.',
+            type = '[i.strip().lower() for i in "%s".split(",") if ' + \
+                'i.strip() not in ("", "None")]',
+            values = {},
+            default = None)
+
+        wifi_capture_process = _Option(name = 'wifi_capture_process',
+            description = 'Capture and decode WiFi frames of each adapter ' +
+                'in a separate process when using the native capture mode, ' +
+                'so multiple adapters make use of multiple CPU cores.',
+            type = '"%s".lower().strip() in ["true", "yes", "y", "1"]',
+            values = {True: 'Capture in a separate process.', False: \
+                'Capture in a thread of the main process.'},
+            default = False)
+
+        wifi_hop_mode = _Option(name = 'wifi_hop_mode',
+            description = 'How WiFi adapters divide their time over the ' +
+                'frequencies they loop over.',
+            values = {'fixed': 'Dwell equally long on each frequency.',
+                'adaptive': 'Dwell longer on frequencies where more ' +
+                    'frames and new devices are seen, with a minimum dwell ' +
+                    'time per frequency.'},
+            default = 'fixed')
+
+        wifi_dwell_time = _Option(name = 'wifi_dwell_time',
+            description = 'The average time in milliseconds to dwell on ' +
+                'each WiFi frequency.',
+            type = 'self._parse_int(%s)',
+            values = {},
+            default = 1000)
+
+        wifi_min_dwell_time = _Option(name = 'wifi_min_dwell_time',
+            description = 'The minimum time in milliseconds to dwell on ' +
+                'each WiFi frequency in adaptive mode.',
+            type = 'self._parse_int(%s)',
+            values = {},
+            default = 200)
+
+        wifi_queue_size = _Option(name = 'wifi_queue_size',
+            description = 'The maximum number of captured WiFi frames ' +
+                'waiting to be processed. Frames are captured and processed ' +
+                'in separate threads, so slow log writes don\'t stall ' +
+                'capturing. Process frames in the capture thread when 0.',
+            type = 'self._parse_int(%s)',
+            values = {},
+            default = 10000)
+
+        wifi_queue_overflow = _Option(name = 'wifi_queue_overflow',
+            description = 'Which frames are dropped when the queue of ' +
+                'WiFi frames waiting to be processed is full. Queue ' +
+                'statistics are written to the info log.',
+            values = {'drop-oldest': 'Drop the oldest queued frame.',
+                'drop-newest': 'Drop the newly captured frame.'},
+            default = 'drop-oldest')
+
+        wifi_raw_sampling = _Option(name = 'wifi_raw_sampling',
+            description = 'Comma-separated list of sampling rates for the ' +
+                'raw WiFi frame log and network stream, per frame type, ' +
+                'e.g. mgmt:1,ctrl:0.1,data:0.01. Devices are sampled by ' +
+                'their MAC-address, so either all or none of the frames of ' +
+                'a device are logged. The rates are written in the header ' +
+                'of the logfile and sent as state message. Frame types ' +
+                'not listed are logged completely. Disable when None.',
+            type = 'self._parse_rates("%s")',
+            values = {},
+            default = None)
+
         self.options.extend([buffer_size, alix_led_support, time_format,
             enable_rssi_log, enable_inquiry_log, minimum_rssi, excluded_devices,
             blacklist_file, network_server_host, network_server_port,
             network_ssl_client_crt, network_ssl_client_key, network_cache_limit,
-            arduino_conffile, enable_hashing, hash_salt])
+            arduino_conffile, enable_hashing, hash_salt, hash_cache_size,
+            wifi_capture_mode, wifi_capture_filter, wifi_ring_adapters,
+            wifi_capture_process, wifi_hop_mode, wifi_dwell_time,
+            wifi_min_dwell_time, wifi_queue_size, wifi_queue_overflow,
+            wifi_raw_sampling, raw_aggregation_window, bluetooth_event_loop,
+            bluetooth_periodic_inquiry, bluetooth_inquiry_mode,
+            bluetooth_min_inquiry_time, bluetooth_max_inquiry_time])
 
     def _get_option_by_name(self, name):
         """
@@ -241,6 +411,26 @@ class Configuration(object):
         except (ValueError, TypeError):
             return None
 
+    def _parse_rates(self, rates):
+        """
+        Parse the argument as a comma-separated list of type:rate pairs.
+        Return a dictionary mapping the uppercase type to the rate, a float
+        between 0 and 1.
+
+        @param  rates   (str)    The list of rates.
+        @return         (dict)   The rates by type, empty when disabled.
+        """
+        result = {}
+        for i in rates.split(','):
+            if i.strip() in ('', 'None'):
+                continue
+            type, rate = i.split(':')
+            rate = float(rate)
+            if not 0 <= rate <= 1:
+                raise ValueError("Sampling rate out of range: %s" % i)
+            result[type.strip().upper()] = rate
+        return result
+
 class _ConfigurationParser(ConfigParser.ConfigParser, object):
     """
     Handles interaction with the configuration file.
@@ -25,10 +25,12 @@ def threaded(f):
     Wrapper to start a function within a new thread.
 
     @param  f   The function to run inside the thread.
+    @return     The wrapped function, which returns the started thread.
     """
     def wrapper(*args):
         t = threading.Thread(target=f, args=args)
         t.start()
+        return t
     return wrapper
 
 class ScanProtocol(object):
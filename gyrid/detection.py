@@ -0,0 +1,183 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module defining the detection records passed from the scanners to the
+loggers and the network. Each sink formats a record itself, and only when it
+is enabled.
+"""
+
+class Detection(object):
+    """
+    Base class of detection records. Subclasses implement two methods:
+    log_line, formatting the record as a line for the logfile given a function
+    to format timestamps with, and net_line, formatting it as a line for the
+    networking component.
+    """
+    __slots__ = ()
+
+class Aggregate(Detection):
+    """
+    Base class of raw records that can be aggregated over a time window, see
+    aggregation.RawAggregator. For aggregate records, the number of records,
+    the minimum and maximum signal strength and the timestamp of the last
+    record are appended to the lines.
+    """
+    __slots__ = ('count', 'last', 'signal_min', 'signal_max')
+
+    def _aggregate_log(self, format_time):
+        if self.count is None:
+            return ''
+        return ",%s,%s,%s,%s" % (self.count, self.signal_min, self.signal_max,
+            format_time(self.last))
+
+class WiFiRaw(Detection):
+    """
+    A captured WiFi frame.
+    """
+    __slots__ = ('sensor', 'timestamp', 'frequency', 'type', 'subtype',
+                 'hwid1', 'hwid2', 'ssi', 'retry', 'pw_mgt', 'info')
+
+    def __init__(self, sensor, timestamp, frequency, type, subtype, hwid1,
+            hwid2, ssi, retry, pw_mgt, info):
+        self.sensor = sensor
+        self.timestamp = timestamp
+        self.frequency = frequency
+        self.type = type
+        self.subtype = subtype
+        self.hwid1 = hwid1
+        self.hwid2 = hwid2
+        self.ssi = ssi
+        self.retry = retry
+        self.pw_mgt = pw_mgt
+        self.info = info
+
+    def log_line(self, format_time):
+        return "%s,%s,%s,%s,%s,%s,%s,%s,%s" % (format_time(self.timestamp),
+            self.frequency, self.type, self.subtype, self.hwid1, self.hwid2,
+            self.ssi, self.retry, self.info)
+
+    def net_line(self):
+        return "WIFI_RAW,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s" % (self.sensor,
+            self.timestamp, self.frequency, self.type.lower(), self.subtype,
+            self.hwid1, self.hwid2, self.ssi, self.retry, self.pw_mgt,
+            self.info)
+
+class WiFiDevRaw(Aggregate):
+    """
+    A WiFi frame of a device.
+    """
+    __slots__ = ('sensor', 'timestamp', 'hwid', 'frequency', 'ssi')
+
+    def __init__(self, sensor, timestamp, hwid, frequency, ssi):
+        self.sensor = sensor
+        self.timestamp = timestamp
+        self.hwid = hwid
+        self.frequency = frequency
+        self.ssi = ssi
+        self.count = None
+
+    def log_line(self, format_time):
+        return "%s,%s,%s,%s" % (format_time(self.timestamp), self.frequency,
+            self.hwid, self.ssi) + self._aggregate_log(format_time)
+
+    def net_line(self):
+        line = "WIFI_DEVRAW,%s,%s,%s,%s,%s" % (self.timestamp, self.sensor,
+            self.hwid, self.frequency, self.ssi)
+        if self.count is not None:
+            line += ",%s,%s,%s,%s" % (self.count, self.signal_min,
+                self.signal_max, self.last)
+        return line
+
+class WiFiIO(Detection):
+    """
+    A WiFi device or access point moving in or out of range.
+    """
+    __slots__ = ('sensor', 'timestamp', 'hwid', 'devtype', 'move')
+
+    def __init__(self, sensor, timestamp, hwid, devtype, move):
+        self.sensor = sensor
+        self.timestamp = timestamp
+        self.hwid = hwid
+        self.devtype = devtype
+        self.move = move
+
+    def log_line(self, format_time):
+        return "%s,%s,%s" % (format_time(self.timestamp), self.hwid,
+            self.move)
+
+    def net_line(self):
+        return "WIFI_IO,%s,%s,%s,%s,%s" % (self.sensor, self.timestamp,
+            self.hwid, self.devtype, self.move)
+
+class BluetoothRaw(Aggregate):
+    """
+    A Bluetooth inquiry response. The extended inquiry response data, if
+    any, is available to sinks but not part of the lines.
+    """
+    __slots__ = ('sensor', 'timestamp', 'hwid', 'device_class', 'tx_power',
+                 'rssi', 'eir')
+
+    def __init__(self, sensor, timestamp, hwid, device_class, tx_power, rssi,
+            eir=None):
+        self.sensor = sensor
+        self.timestamp = timestamp
+        self.hwid = hwid
+        self.device_class = device_class
+        self.tx_power = tx_power
+        self.rssi = rssi
+        self.eir = eir
+        self.count = None
+
+    def log_line(self, format_time):
+        return "%s,%s,%s,%s,%s" % (format_time(self.timestamp), self.hwid,
+            self.device_class, self.tx_power, self.rssi) + \
+            self._aggregate_log(format_time)
+
+    def net_line(self):
+        line = "BLUETOOTH_RAW,%s,%0.3f,%s,%s,%s,%s" % (
+            self.sensor.replace(':', ''), self.timestamp, self.hwid,
+            self.device_class, self.tx_power, self.rssi)
+        if self.count is not None:
+            line += ",%s,%s,%s,%0.3f" % (self.count, self.signal_min,
+                self.signal_max, self.last)
+        return line
+
+class BluetoothIO(Detection):
+    """
+    A Bluetooth device moving in or out of range.
+    """
+    __slots__ = ('sensor', 'timestamp', 'hwid', 'device_class', 'move')
+
+    def __init__(self, sensor, timestamp, hwid, device_class, move):
+        self.sensor = sensor
+        self.timestamp = timestamp
+        self.hwid = hwid
+        self.device_class = device_class
+        self.move = move
+
+    def log_line(self, format_time):
+        return "%s,%s,%s,%s" % (format_time(self.timestamp), self.hwid,
+            self.device_class, self.move)
+
+    def net_line(self):
+        return "BLUETOOTH_IO,%s,%0.3f,%s,%s,%s" % (
+            self.sensor.replace(':', ''), self.timestamp, self.hwid,
+            self.device_class, self.move)
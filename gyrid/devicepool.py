@@ -0,0 +1,199 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Module implementing the pool of recently seen devices of a logger.
+
+Device ids are interned into integer slots. The timestamps and device
+classes are kept in arrays indexed on the slot, instead of in a Python object
+per device.
+"""
+
+import array
+import heapq
+
+class DevicePool(object):
+    """
+    Dictionary-like pool mapping device ids to the entry of their last
+    detection: a (timestamp, device class) tuple when the pool keeps device
+    classes, else the timestamp. The devices are indexed in buckets on the
+    time they were last seen too, so the devices that have disappeared can be
+    removed without looking at the other devices in the pool.
+    """
+    def __init__(self, device_class=False, resolution=1.0):
+        """
+        Initialisation.
+
+        @param   device_class   Whether to keep the device class of the
+                                  devices.
+        @param   resolution     The width of the buckets, in seconds.
+        """
+        self.device_class = device_class
+        self.resolution = resolution
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all devices from the pool.
+        """
+        self.slots = {}
+        self.devices = []
+        self.free = []
+        self.timestamps = array.array('d')
+        self.classes = array.array('i')
+        self.positions = array.array('I')
+
+        self.buckets = {}
+        self.heap = []
+
+    def _allocate(self, device):
+        """
+        Get a free slot for the given device.
+        """
+        if len(self.free) > 0:
+            slot = self.free.pop()
+            self.devices[slot] = device
+        else:
+            slot = len(self.devices)
+            self.devices.append(device)
+            self.timestamps.append(0)
+            self.classes.append(0)
+            self.positions.append(0)
+        self.slots[device] = slot
+        return slot
+
+    def _release(self, slot):
+        """
+        Free the given slot.
+        """
+        del(self.slots[self.devices[slot]])
+        self.devices[slot] = None
+        self.free.append(slot)
+
+    def _index(self, slot, bucket):
+        """
+        Add the slot to the given bucket, creating it when necessary.
+        """
+        if bucket not in self.buckets:
+            self.buckets[bucket] = array.array('I')
+            heapq.heappush(self.heap, bucket)
+        slots = self.buckets[bucket]
+        self.positions[slot] = len(slots)
+        slots.append(slot)
+
+    def _unindex(self, slot, bucket):
+        """
+        Remove the slot from the given bucket, moving the last slot of the
+        bucket in its place.
+        """
+        slots = self.buckets[bucket]
+        last = slots.pop()
+        if last != slot:
+            position = self.positions[slot]
+            slots[position] = last
+            self.positions[last] = position
+
+    def _entry(self, slot):
+        if self.device_class:
+            return self.timestamps[slot], self.classes[slot]
+        return self.timestamps[slot]
+
+    def __contains__(self, device):
+        return device in self.slots
+
+    def __getitem__(self, device):
+        return self._entry(self.slots[device])
+
+    def __setitem__(self, device, entry):
+        if self.device_class:
+            timestamp, device_class = entry
+        else:
+            timestamp, device_class = entry, 0
+        bucket = int(timestamp // self.resolution)
+
+        slot = self.slots.get(device)
+        if slot == None:
+            slot = self._allocate(device)
+            self._index(slot, bucket)
+        else:
+            previous = int(self.timestamps[slot] // self.resolution)
+            if previous != bucket:
+                self._unindex(slot, previous)
+                self._index(slot, bucket)
+        self.timestamps[slot] = timestamp
+        self.classes[slot] = device_class
+
+    def __delitem__(self, device):
+        slot = self.slots[device]
+        self._unindex(slot, int(self.timestamps[slot] // self.resolution))
+        self._release(slot)
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def get(self, device, default=None):
+        if device in self.slots:
+            return self._entry(self.slots[device])
+        return default
+
+    def update(self, other):
+        """
+        Update the pool with the entries of the given dictionary.
+
+        @param   other   Dictionary mapping device ids to entries.
+        """
+        for device in other:
+            self[device] = other[device]
+
+    def expire(self, limit):
+        """
+        Remove the devices that have last been seen before the given time.
+        Only the buckets up to that time are visited.
+
+        @param   limit   UNIX timestamp.
+        @return          List of (device id, entry) tuples of the removed
+                           devices, the oldest first.
+        """
+        expired = []
+        last = int(limit // self.resolution)
+        while len(self.heap) > 0 and self.heap[0] <= last:
+            bucket = self.heap[0]
+            slots = self.buckets[bucket]
+            if bucket < last:
+                gone = slots.tolist()
+                del(slots[:])
+            else:
+                gone = [s for s in slots if self.timestamps[s] < limit]
+                for slot in gone:
+                    self._unindex(slot, bucket)
+            gone.sort(key=self.timestamps.__getitem__)
+            for slot in gone:
+                expired.append((self.devices[slot], self._entry(slot)))
+                self._release(slot)
+            if len(slots) == 0:
+                heapq.heappop(self.heap)
+                del(self.buckets[bucket])
+            else:
+                break
+        return expired
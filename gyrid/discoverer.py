@@ -18,12 +18,49 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import bluetooth
-import bluetooth._bluetooth as bluez
 import math
 import struct
 import time
 
+import aggregation
+import detection
+import hci
+import scheduling
+
+try:
+    import bluetooth._bluetooth as bluez
+except ImportError:
+    # PyBluez is only needed to talk to an adapter, not to replay traces.
+    bluez = None
+
+# Capabilities of the adapters that have been initialised, keyed on their
+# MAC-address, so an adapter that is plugged in again isn't queried again.
+_capabilities = {}
+
+# Socket filters, keyed on the opcode of the command they pass the Command
+# Complete events of, or None for the filter passing all events. Built once
+# and shared by all discoverers.
+_filters = {}
+
+def _socket_filter(opcode=None):
+    """
+    Get the socket filter for the given command.
+
+    @param   opcode   The opcode of the command to receive the Command
+                        Complete event of, None to receive all events.
+    @return           The socket filter.
+    """
+    if opcode not in _filters:
+        flt = bluez.hci_filter_new()
+        bluez.hci_filter_set_ptype(flt, bluez.HCI_EVENT_PKT)
+        if opcode == None:
+            bluez.hci_filter_all_events(flt)
+        else:
+            bluez.hci_filter_set_event(flt, bluez.EVT_CMD_COMPLETE)
+            bluez.hci_filter_set_opcode(flt, opcode)
+        _filters[opcode] = flt
+    return _filters[opcode]
+
 class Discoverer(object):
     """
     Bluetooth discover, this class provides device discovery. Heavily based on
@@ -53,13 +90,29 @@ class Discoverer(object):
             self.mgr.config.get_value('buffer_size')/1.28))
         self.minimum_rssi = self.mgr.config.get_value('minimum_rssi')
         self.done = False
+        self.filter = None
+        self.capabilities = {}
+        self.raw_aggregator = aggregation.RawAggregator(
+            self.mgr.config.get_value('raw_aggregation_window'),
+            self.logger_rssi.write, lambda r: r.hwid, 'rssi')
 
         self.preferred_inquiry_modes = [0x02, 0x01, 0x00]
 
-        self.eir_datatypes = {
-            0x0a: ('tx_power_level', 'b', lambda x: x.__getitem__(0))
-            #0x09: ('complete_local_name', 'c', lambda x: "".join(x))
-        }
+        self.periodic = self.mgr.config.get_value(
+            'bluetooth_periodic_inquiry')
+        self.periodic_active = False
+        self.periodic_length = self.buffer_size - 2
+
+        self.scheduler = scheduling.InquiryScheduler(self.buffer_size,
+            self.mgr.config.get_value('bluetooth_inquiry_mode'),
+            int(math.ceil(self.mgr.config.get_value(
+                'bluetooth_min_inquiry_time')/1.28)),
+            int(math.ceil(self.mgr.config.get_value(
+                'bluetooth_max_inquiry_time')/1.28)))
+        self.pool_buffer = self.mgr.config.get_value('buffer_size')
+        self.inquiry_length = self.buffer_size
+        self.inquiry_start = None
+        self.inquiry_devices = set()
 
     def init(self):
         """
@@ -75,8 +128,14 @@ class Discoverer(object):
             self.mgr.debug(s)
             return 1
 
+        self.capabilities = self._read_capabilities()
+        self.mgr.log_info("%s: Adapter capabilities: %s" % (self.mac,
+            ', '.join('%s %s' % (c, 'yes' if self.capabilities[c] else 'no') \
+            for c in sorted(self.capabilities))))
+
         # Check support for reading and writing inquiry mode
-        if self._check_command_support(12, 0b11000000):
+        if self.capabilities['read_inquiry_mode'] and \
+            self.capabilities['write_inquiry_mode']:
             for imode in self.preferred_inquiry_modes:
                 try:
                     result = self._write_inquiry_mode(imode)
@@ -99,65 +158,80 @@ class Discoverer(object):
         if r == 0:
             self.mgr.log_info("%s: Inquiry TX power set to 0" % self.mac)
 
+        # Check support for (exiting) periodic inquiry mode
+        if self.periodic:
+            if self.periodic_length < 1:
+                self.periodic = False
+                self.mgr.log_info("%s: Buffer size too small for " % self.mac +
+                    "periodic inquiry mode")
+            elif not (self.capabilities['periodic_inquiry'] and \
+                self.capabilities['exit_periodic_inquiry']):
+                self.periodic = False
+                self.mgr.log_info("%s: Adapter does not support " % self.mac +
+                    "periodic inquiry mode")
+            else:
+                self.mgr.log_info("%s: Using periodic inquiry mode" % self.mac)
+
+        self.raw_aggregator.start()
         return 0
 
-    def _read_inquiry_mode(self):
+    def _set_filter(self, flt):
         """
-        Returns the current mode, or -1 on failure.
+        Set the socket filter, unless it is set already.
+
+        @param  flt   The socket filter, as returned by _socket_filter.
         """
-        # save current filter
-        old_filter = self.sock.getsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, 14)
+        if flt is not self.filter:
+            self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, flt)
+            self.filter = flt
 
-        # Setup socket filter to receive only events related to the
-        # read_inquiry_mode command
-        flt = bluez.hci_filter_new()
-        opcode = bluez.cmd_opcode_pack(bluez.OGF_HOST_CTL,
-                bluez.OCF_READ_INQUIRY_MODE)
-        bluez.hci_filter_set_ptype(flt, bluez.HCI_EVENT_PKT)
-        bluez.hci_filter_set_event(flt, bluez.EVT_CMD_COMPLETE);
-        bluez.hci_filter_set_opcode(flt, opcode)
-        self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, flt)
+    def _send_command(self, opcode, parameters=''):
+        """
+        Send an HCI command and wait for its Command Complete event.
 
-        # first read the current inquiry mode.
-        bluez.hci_send_cmd(self.sock, bluez.OGF_HOST_CTL,
-                bluez.OCF_READ_INQUIRY_MODE)
+        @param  opcode       The opcode of the command.
+        @param  parameters   The packed command parameters.
+        @return              Tuple of the status of the command and the
+                               remaining return parameters.
+        """
+        self._set_filter(_socket_filter(opcode))
+        bluez.hci_send_cmd(self.sock, opcode >> 10, opcode & 0x03ff,
+            parameters)
 
         pkt = self.sock.recv(255)
+        return ord(pkt[6]), pkt[7:]
+
+    def _read_capabilities(self):
+        """
+        Read the commands supported by the adapter, unless they are known
+        from an earlier initialisation of the adapter.
 
-        status,mode = struct.unpack("xxxxxxBB", pkt)
-        if status != 0: mode = -1
+        @return  Dictionary mapping the names in hci.COMMANDS to whether the
+                   command is supported.
+        """
+        if self.mac in _capabilities:
+            return _capabilities[self.mac]
+
+        status, commands = self._send_command(hci.OPCODE_READ_LOCAL_COMMANDS)
+        if status != 0:
+            return hci.supported_commands('')
+        _capabilities[self.mac] = hci.supported_commands(commands[:64])
+        return _capabilities[self.mac]
 
-        # restore old filter
-        self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, old_filter)
-        return mode
+    def _read_inquiry_mode(self):
+        """
+        Returns the current mode, or -1 on failure.
+        """
+        status, mode = self._send_command(hci.OPCODE_READ_INQUIRY_MODE)
+        if status != 0: return -1
+        return ord(mode[0])
 
     def _write_inquiry_mode(self, mode):
         """
         Returns 0 on success, -1 on failure.
         """
-        # save current filter
-        old_filter = self.sock.getsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, 14)
-
-        # Setup socket filter to receive only events related to the
-        # write_inquiry_mode command
-        flt = bluez.hci_filter_new()
-        opcode = bluez.cmd_opcode_pack(bluez.OGF_HOST_CTL,
-                bluez.OCF_WRITE_INQUIRY_MODE)
-        bluez.hci_filter_set_ptype(flt, bluez.HCI_EVENT_PKT)
-        bluez.hci_filter_set_event(flt, bluez.EVT_CMD_COMPLETE);
-        bluez.hci_filter_set_opcode(flt, opcode)
-        self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, flt)
-
-        # send the command!
-        bluez.hci_send_cmd(self.sock, bluez.OGF_HOST_CTL,
-                bluez.OCF_WRITE_INQUIRY_MODE, struct.pack("B", mode))
-
-        pkt = self.sock.recv(255)
-
-        status = struct.unpack("xxxxxxB", pkt)[0]
-
-        # restore old filter
-        self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, old_filter)
+        status = self._send_command(hci.OPCODE_WRITE_INQUIRY_MODE,
+            struct.pack("B", mode))[0]
         if status != 0: return -1
         return 0
 
@@ -165,170 +239,194 @@ class Discoverer(object):
         """
         Returns 0 on success, error status code or -1 on failure.
         """
-        if not self._check_command_support(18, 0b10):
+        if not self.capabilities['write_inquiry_tx_power']:
             return -1
 
-        # save current filter
-        old_filter = self.sock.getsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, 14)
+        return self._send_command(hci.OPCODE_WRITE_INQUIRY_TX_POWER,
+            struct.pack("b", power))[0]
 
-        # Setup socket filter to receive only events related to the
-        # read_inquiry_mode command
-        flt = bluez.hci_filter_new()
-        opcode = bluez.cmd_opcode_pack(bluez.OGF_HOST_CTL, 0x0059)
-        bluez.hci_filter_set_ptype(flt, bluez.HCI_EVENT_PKT)
-        bluez.hci_filter_set_event(flt, bluez.EVT_CMD_COMPLETE);
-        bluez.hci_filter_set_opcode(flt, opcode)
-        self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, flt)
+    def start_inquiry(self):
+        """
+        Start a Bluetooth inquiry with RSSI reception. The events received
+        during the inquiry should be passed to handle_event. In periodic
+        inquiry mode, the controller is put in periodic inquiry mode instead.
+        """
+        if self.periodic:
+            self._start_periodic_inquiry()
+            return
 
-        # first read the current inquiry mode.
-        bluez.hci_send_cmd(self.sock, bluez.OGF_HOST_CTL,
-                0x0059, struct.pack("b", power))
+        self._set_filter(_socket_filter())
 
-        pkt = self.sock.recv(255)
+        length = self.scheduler.schedule()
+        if length != self.inquiry_length:
+            self.inquiry_length = length
+            self.mgr.debug("%s: Inquiry time set to %0.2fs" % (self.mac,
+                length*1.28))
+
+        max_responses = 0 # unlimited number of responses
+        self.cnt_responses = 0
+        self.inquiry_devices.clear()
+        cmd_pkt = struct.pack("BBBBB", 0x33, 0x8b, 0x9e, self.inquiry_length,
+            max_responses)
 
-        status = struct.unpack("xxxxxxB", pkt)[0]
+        self.inquiry_start = time.time()
+        self.logger_inquiry.new_inquiry(self.inquiry_start,
+            self.inquiry_length*1.28)
+        self.mgr.debug("%s: New inquiry" % self.mac)
 
-        # restore old filter
-        self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, old_filter)
-        return status
+        bluez.hci_send_cmd(self.sock, bluez.OGF_LINK_CTL, bluez.OCF_INQUIRY,
+            cmd_pkt)
 
-    def _check_command_support(self, octet, mask):
+    def _start_periodic_inquiry(self):
         """
-        Checks if a certain command is supported by the Bluetooth sensor.
-
-        @param  octet   The octet of the command.
-        @param  mask    The bitmask of the command.
-                           Both as defined in the Bluetooth specification v4.0 pp. 447 (pdf 693).
+        Put the controller in periodic inquiry mode, starting an inquiry of
+        periodic_length every buffer_size - 1 to buffer_size units of 1.28s.
+        The events received should be passed to handle_event until
+        stop_inquiry is called.
         """
-        # save current filter
-        old_filter = self.sock.getsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, 14)
+        self._set_filter(_socket_filter())
 
-        # Setup socket filter to receive only events related to the
-        # read_inquiry_mode command
-        flt = bluez.hci_filter_new()
-        opcode = bluez.cmd_opcode_pack(0x04, 0x0002)
-        bluez.hci_filter_set_ptype(flt, bluez.HCI_EVENT_PKT)
-        bluez.hci_filter_set_event(flt, bluez.EVT_CMD_COMPLETE);
-        bluez.hci_filter_set_opcode(flt, opcode)
-        self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, flt)
+        max_responses = 0 # unlimited number of responses
+        self.cnt_responses = 0
+        cmd_pkt = struct.pack("<HHBBBBB", self.buffer_size,
+            self.buffer_size - 1, 0x33, 0x8b, 0x9e, self.periodic_length,
+            max_responses)
 
-        # Send the Read Local Supported Commands command
-        bluez.hci_send_cmd(self.sock, 0x04, 0x0002)
+        self.periodic_active = True
+        self.mgr.debug("%s: Started periodic inquiry mode" % self.mac)
 
-        pkt = self.sock.recv(65)
+        bluez.hci_send_cmd(self.sock, bluez.OGF_LINK_CTL,
+            hci.OPCODE_PERIODIC_INQUIRY & 0x03ff, cmd_pkt)
 
-        status = struct.unpack("65B", pkt)
-        status = status[6:]
+    def stop_inquiry(self):
+        """
+        Take the controller out of periodic inquiry mode, if active.
+        """
+        if self.periodic_active:
+            self.periodic_active = False
+            bluez.hci_send_cmd(self.sock, bluez.OGF_LINK_CTL,
+                hci.OPCODE_EXIT_PERIODIC_INQUIRY & 0x03ff)
+            self.mgr.debug("%s: Stopped periodic inquiry mode" % self.mac)
 
-        # restore old filter
-        self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, old_filter)
+    def _periodic_inquiry_done(self, timestamp):
+        """
+        Log the inquiry that has completed in periodic inquiry mode. As the
+        controller doesn't report when it starts an inquiry, its start is
+        derived from the inquiry length.
 
-        # Check if the requested bit is set.
-        if len(status) >= octet+1:
-            return status[octet+1] & mask == mask
-        return False
+        @param   timestamp   The time the inquiry completed.
+        """
+        duration = self.periodic_length*1.28
+        self.logger_inquiry.new_inquiry(timestamp - duration, duration)
+        self.logger_inquiry.inquiry_done(timestamp, duration,
+            self.cnt_responses)
+        self.cnt_responses = 0
+        self.inquiry_devices.clear()
+
+    def receive(self):
+        """
+        Receive the next HCI event.
 
-    def _device_inquiry_with_with_rssi(self):
+        @return  The event packet, None on failure. When the adapter was lost,
+                   the logger is stopped and done is set.
         """
-        Perform a Bluetooth inquiry with RSSI reception.
+        try:
+            return self.sock.recv(255)
+        except bluez.error, e:
+            if e[0] == 32:
+                self.logger.stop()
+                self.done = True
+            return None
+
+    def handle_event(self, pkt, timestamp=None):
         """
-        # save current filter
-        old_filter = self.sock.getsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, 14)
+        Handle an HCI event received during the inquiry.
 
-        flt = bluez.hci_filter_new()
-        bluez.hci_filter_all_events(flt)
-        bluez.hci_filter_set_ptype(flt, bluez.HCI_EVENT_PKT)
-        self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, flt)
+        @param   pkt         The event packet.
+        @param   timestamp   The time the event was received, now when None.
+        @return              True when the inquiry has ended and a new one
+                               should be started. In periodic inquiry mode,
+                               the controller starts new inquiries itself.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        done = False
+        completed = False
+        event, data = hci.decode(pkt)
+        if event in hci.INQUIRY_RESULTS:
+            self.cnt_responses += len(data)
+            if len(data) > 1:
+                self.mgr.debug("%s: Processing %i responses queued into a single result event" % (self.mac, len(data)))
+            self.devices_discovered(timestamp, data)
+        elif event == hci.EVT_INQUIRY_COMPLETE:
+            if self.periodic_active:
+                self._periodic_inquiry_done(timestamp)
+            else:
+                done = True
+                completed = True
+        elif event == hci.EVT_CMD_COMPLETE:
+            ncmd, opcode, status = data
+            if opcode == hci.OPCODE_PERIODIC_INQUIRY and status != 0 and \
+                self.periodic_active:
+                self.mgr.log_info("%s: Failed to start periodic " % self.mac +
+                    "inquiry mode, falling back to inquiries")
+                self.periodic = False
+                self.periodic_active = False
+                return True
+        elif event == hci.EVT_CMD_STATUS:
+            status, ncmd, opcode = data
+            if status != 0:
+                self.mgr.debug('Non-zero Bluetooth status packet received')
+                done = True
+        else:
+            self.mgr.debug('Unrecognized Bluetooth packet type received')
+
+        if done:
+            self.periodic_active = False
+            self.logger_inquiry.inquiry_done(timestamp,
+                self.inquiry_length*1.28, self.cnt_responses)
+            if completed:
+                self._inquiry_completed(timestamp)
+        return done
+
+    def _inquiry_completed(self, timestamp):
+        """
+        Let the scheduler learn from the inquiry that has completed. In
+        adaptive inquiry mode, devices are kept in the pool for at least as
+        long as the inquiry took, so they don't disappear between two
+        inquiries.
 
-        max_responses = 0 # unlimited number of responses
-        cnt_responses = 0
-        cmd_pkt = struct.pack("BBBBB", 0x33, 0x8b, 0x9e, self.buffer_size,
-            max_responses)
+        @param   timestamp   The time the inquiry completed.
+        """
+        if self.inquiry_start == None:
+            # The inquiry was started before we were listening.
+            return
 
-        self.logger_inquiry.new_inquiry(time.time(), self.buffer_size*1.28)
-        self.mgr.debug("%s: New inquiry" % self.mac)
+        elapsed = timestamp - self.inquiry_start
+        self.scheduler.finish(self.inquiry_length, len(self.inquiry_devices),
+            elapsed)
+        if self.scheduler.mode == scheduling.ADAPTIVE:
+            self.logger.set_buffer(max(self.pool_buffer, elapsed))
 
-        bluez.hci_send_cmd(self.sock, bluez.OGF_LINK_CTL, bluez.OCF_INQUIRY,
-            cmd_pkt)
+    def _device_inquiry_with_with_rssi(self):
+        """
+        Perform a Bluetooth inquiry with RSSI reception.
+
+        @return  "adapter lost" when the adapter was lost, else None.
+        """
+        self.start_inquiry()
 
         done = False
         while not done:
-            try:
-                pkt = self.sock.recv(255)
-            except bluetooth._bluetooth.error, e:
-                if e[0] == 32:
-                    self.logger.stop()
-                    done = True
-                    self.done = True
-                    self.scanner.stopped_scanning(self, "adapter lost")
-                    return
-            ptype, event, plen = struct.unpack("BBB", pkt[:3])
-            timestamp = time.time()
-            if event == bluez.EVT_INQUIRY_RESULT_WITH_RSSI:
-                pkt = pkt[3:]
-                nrsp = struct.unpack("B", pkt[0])[0]
-                cnt_responses += nrsp
-                if nrsp > 1:
-                    self.mgr.log_info("%s: Discarding %i responses queued into a single result event" % (self.mac, nrsp))
-                    continue
-                for i in range(nrsp):
-                    addr = bluez.ba2str(pkt[1+6*i:1+6*i+6])
-                    rssi = struct.unpack("b", pkt[1+13*nrsp+i])[0]
-                    devclass_raw = pkt[1+8*nrsp+3*i:1+8*nrsp+3*i+3]
-                    devclass = struct.unpack ("I", "%s\0" % devclass_raw)[0]
-                    self.device_discovered(timestamp, addr, devclass, None, rssi)
-            elif event == 0x2f: # EVT_EXTENDED_INQUIRY_RESULT
-                cnt_responses += 1
-                pkt = pkt[3:]
-                addr = bluez.ba2str(pkt[1:1+6])
-                rssi = struct.unpack("b", pkt[14])[0]
-                devclass_raw = pkt[9:9+3]
-                devclass = struct.unpack ("I", "%s\0" % devclass_raw)[0]
-                eir_data = {}
-
-                eir = pkt[15:]
-                eir_idx = 0
-                while eir_idx < len(eir):
-                    l = struct.unpack("B", eir[eir_idx])[0]
-                    eir_idx += 1
-                    if l > 0:
-                        data_type = struct.unpack("B", eir[eir_idx])[0]
-                        eir_idx += 1
-                        data = None
-                        if data_type in self.eir_datatypes:
-                            dt = self.eir_datatypes[data_type]
-                            eir_data[dt[0]] = dt[2](struct.unpack("%i%s" % ((l-1), dt[1]), eir[eir_idx:eir_idx+l-1]))
-                        eir_idx += (l-1)
-                self.device_discovered(timestamp, addr, devclass, eir_data.get('tx_power_level', None), rssi)
-            elif event == bluez.EVT_INQUIRY_RESULT:
-                pkt = pkt[3:]
-                nrsp = struct.unpack("B", pkt[0])[0]
-                cnt_responses += nrsp
-                if nrsp > 1:
-                    self.mgr.log_info("%s: Discarding %i responses queued into a single result event" % (self.mac, nrsp))
-                    continue
-                for i in range(nrsp):
-                    addr = bluez.ba2str(pkt[1+6*i:1+6*i+6])
-                    devclass_raw = struct.unpack("BBB",
-                            pkt[1+9*nrsp+3*i:1+9*nrsp+3*i+3])
-                    devclass = (devclass_raw[2] << 16) | \
-                            (devclass_raw[1] << 8) | \
-                            devclass_raw[0]
-                    self.device_discovered(timestamp, addr, devclass, None, None)
-            elif event == bluez.EVT_INQUIRY_COMPLETE:
-                done = True
-            elif event == bluez.EVT_CMD_STATUS:
-                status, ncmd, opcode = struct.unpack("BBH", pkt[3:7])
-                if status != 0:
-                    self.mgr.debug('Non-zero Bluetooth status packet received')
-                    done = True
-            else:
-                self.mgr.debug('Unrecognized Bluetooth packet type received')
-
-        self.logger_inquiry.inquiry_done(time.time(), self.buffer_size*1.28, cnt_responses)
-
-        # restore old filter
-        self.sock.setsockopt(bluez.SOL_HCI, bluez.HCI_FILTER, old_filter)
+            if self.periodic_active and self.mgr.main.stopping:
+                self.stop_inquiry()
+                return
+            pkt = self.receive()
+            if pkt is None:
+                if self.done:
+                    return "adapter lost"
+                continue
+            done = self.handle_event(pkt)
 
     def find(self):
         """
@@ -343,9 +441,18 @@ class Discoverer(object):
             if self.mgr.main.stopping:
                 end = "Shutting down"
 
+        self.flush()
         return " (%s)" % end
 
-    def device_discovered(self, timestamp, address, device_class, tx_pwr, rssi):
+    def flush(self):
+        """
+        Stop aggregating, flushing the raw detections that are still being
+        aggregated.
+        """
+        self.raw_aggregator.stop()
+
+    def device_discovered(self, timestamp, address, device_class, tx_pwr, rssi,
+            eir=None):
         """
         Called when discovered a device. Get a UNIX timestamp and call the
         update method of Logger to update the timestamp, the address and
@@ -357,11 +464,30 @@ class Discoverer(object):
         @param  tx_pwr         The TX power level of the inquiry packet.
         @param  rssi           The RSSI (RX power level) value of the
                                 discovery. None when none recorded.
+        @param  eir            The hci.ExtendedInquiryResponse of the
+                                discovery. None when none received.
         """
-        if (rssi == None or \
-            not (self.minimum_rssi != None and rssi < self.minimum_rssi)) \
-            and (True not in (address.upper().startswith(
-                black_mac) for black_mac in self.mgr.blacklist)):
+        self.devices_discovered(timestamp, [(address, device_class, tx_pwr,
+            rssi, eir)])
+
+    def devices_discovered(self, timestamp, responses):
+        """
+        Called when discovered one or more devices in a single inquiry result
+        event. The devices are updated in the pool of the Logger as a single
+        batch.
+
+        @param  timestamp      Timestamp of the inquiry result event.
+        @param  responses      List of (address, device class, TX power, RSSI,
+                                 EIR) tuples, as passed to
+                                 device_discovered.
+        """
+        devices = []
+        records = []
+        for address, device_class, tx_pwr, rssi, eir in responses:
+            if not (rssi == None or \
+                not (self.minimum_rssi != None and rssi < self.minimum_rssi)) \
+                or self.mgr.blacklist.match(address):
+                continue
 
             try:
                 device_class = int(device_class)
@@ -380,16 +506,29 @@ class Discoverer(object):
                     device_class))])
                 rssi_s = ' with RSSI %d' % rssi if rssi != None else ''
                 txpwr_s = ', TX power %d' % tx_pwr if tx_pwr != None else ''
+                eir_s = ''
+                manufacturer = eir.get('manufacturer_data') if eir != None \
+                    else None
+                if manufacturer is not None:
+                    eir_s = ', manufacturer 0x%04x' % manufacturer[0]
 
                 d = {'hwid': hwid, 'dc': device, 'time': str(timestamp),
-                     'rssi': rssi_s, 'txpwr': txpwr_s, 'sc': self.mac}
+                     'rssi': rssi_s, 'txpwr': txpwr_s, 'sc': self.mac,
+                     'eir': eir_s}
 
                 self.mgr.debug(
                     "%(sc)s: Found device %(hwid)s [%(dc)s]" % d + \
-                    "%(rssi)s%(txpwr)s" % d, force=True)
+                    "%(rssi)s%(txpwr)s%(eir)s" % d, force=True)
 
-            self.logger.update_device(timestamp, hwid, device_class)
+            devices.append((hwid, device_class))
+            self.inquiry_devices.add(hwid)
 
             tx_pwr = '' if tx_pwr == None else tx_pwr
             if rssi != None:
-                self.logger_rssi.write(timestamp, hwid, device_class, tx_pwr, rssi)
+                records.append(detection.BluetoothRaw(self.mac, timestamp,
+                    hwid, device_class, tx_pwr, rssi, eir))
+
+        if len(devices) > 0:
+            self.logger.update_devices(timestamp, devices)
+        for record in records:
+            self.raw_aggregator.add(record)
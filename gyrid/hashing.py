@@ -24,11 +24,18 @@ Module that handles hashing various data.
 
 import hashlib
 import os
+import threading
 import time
 
 class Hashing(object):
     """
     Class that can interact with the Gyrid network component.
+
+    Digests are memoized in a bounded cache, which is flushed as soon as the
+    rendered salt changes. The cache consists of two generations: entries are
+    added to the recent one, when that is full it replaces the old one. Hits
+    in the old generation are promoted, so frequently hashed data stays
+    cached.
     """
     def __init__(self, mgr):
         """
@@ -39,7 +46,86 @@ class Hashing(object):
         self.mgr = mgr
         self.hasher = hashlib.sha256
         self.salt = self.mgr.config.get_value("hash_salt")
+        self.cache_size = self.mgr.config.get_value("hash_cache_size") or 0
+        self.timebased = '%' in self.salt
+
+        self.lock = threading.Lock()
+        self.second = None
+        self.salt_rendered = time.strftime(self.salt)
+        self.recent = {}
+        self.old = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _render_salt(self):
+        """
+        Render the salt, flushing the cache when it has changed. As strftime
+        has a resolution of one second, the salt is rendered at most once per
+        second. Should be called with the lock held.
+
+        @return   The rendered salt.
+        """
+        if self.timebased:
+            second = int(time.time())
+            if second != self.second:
+                self.second = second
+                salt = time.strftime(self.salt, time.localtime(second))
+                if salt != self.salt_rendered:
+                    self.salt_rendered = salt
+                    if self.recent or self.old:
+                        self.log_statistics(
+                            "Hashing cache flushed on salt change")
+                    self.recent = {}
+                    self.old = {}
+                    self.hits = self.misses = 0
+        return self.salt_rendered
 
     def hash(self, data):
-        salt = time.strftime(self.salt)
-        return self.hasher(salt + data).hexdigest()
+        """
+        Hash the given data with the current salt.
+
+        @param   data   The data to hash.
+        @return         The hexadecimal digest.
+        """
+        self.lock.acquire()
+        try:
+            salt = self._render_salt()
+            if self.cache_size < 1:
+                return self.hasher(salt + data).hexdigest()
+
+            digest = self.recent.get(data)
+            if digest is not None:
+                self.hits += 1
+                return digest
+
+            digest = self.old.get(data)
+            if digest is None:
+                self.misses += 1
+                digest = self.hasher(salt + data).hexdigest()
+            else:
+                self.hits += 1
+            if len(self.recent) >= self.cache_size / 2:
+                self.old = self.recent
+                self.recent = {}
+            self.recent[data] = digest
+            return digest
+        finally:
+            self.lock.release()
+
+    def statistics(self):
+        """
+        @return   Tuple of the number of cache hits and misses since the salt
+                    last changed.
+        """
+        return self.hits, self.misses
+
+    def log_statistics(self, message):
+        """
+        Write the cache statistics to the info log.
+
+        @param   message   The message preceding the statistics.
+        """
+        hits, misses = self.statistics()
+        total = hits + misses
+        self.mgr.log_info("%s: %i hits, %i misses (%.1f%% hit rate)" % (
+            message, hits, misses, 100.0 * hits / total if total else 0))
@@ -0,0 +1,357 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module implementing the decoding of the HCI events received while scanning
+for Bluetooth devices.
+
+Events are decoded in place from a memoryview of the received packet, using
+precompiled struct.Struct objects, through a table of decoders keyed on the
+event code.
+"""
+
+import binascii
+import struct
+
+HCI_EVENT_PKT = 0x04
+
+EVT_INQUIRY_COMPLETE = 0x01
+EVT_INQUIRY_RESULT = 0x02
+EVT_CMD_COMPLETE = 0x0e
+EVT_CMD_STATUS = 0x0f
+EVT_INQUIRY_RESULT_WITH_RSSI = 0x22
+EVT_EXTENDED_INQUIRY_RESULT = 0x2f
+
+OPCODE_INQUIRY = 0x0401
+OPCODE_PERIODIC_INQUIRY = 0x0403
+OPCODE_EXIT_PERIODIC_INQUIRY = 0x0404
+OPCODE_READ_INQUIRY_MODE = 0x0c44
+OPCODE_WRITE_INQUIRY_MODE = 0x0c45
+OPCODE_WRITE_INQUIRY_TX_POWER = 0x0c59
+OPCODE_READ_LOCAL_COMMANDS = 0x1002
+
+# Octet and bit mask of the commands in the return parameters of the Read
+# Local Supported Commands command, as defined in the Bluetooth
+# specification v4.0 pp. 447 (pdf 693).
+COMMANDS = {
+    'periodic_inquiry': (0, 0b100),
+    'exit_periodic_inquiry': (0, 0b1000),
+    'read_inquiry_mode': (12, 0b1000000),
+    'write_inquiry_mode': (12, 0b10000000),
+    'read_inquiry_tx_power': (18, 0b1),
+    'write_inquiry_tx_power': (18, 0b10),
+}
+
+INQUIRY_RESULTS = frozenset([EVT_INQUIRY_RESULT,
+    EVT_INQUIRY_RESULT_WITH_RSSI, EVT_EXTENDED_INQUIRY_RESULT])
+
+EVENT_HEADER = struct.Struct('<BBB')
+EVENT_HEADER_LENGTH = EVENT_HEADER.size
+UINT8 = struct.Struct('<B')
+INT8 = struct.Struct('<b')
+ADDRESS = struct.Struct('<6B')
+DEVICE_CLASS = struct.Struct('<HB')
+CMD_STATUS = struct.Struct('<BBH')
+CMD_COMPLETE = struct.Struct('<BH')
+EIR_HEADER = struct.Struct('<BB')
+
+ADDRESS_FORMAT = ':'.join(['%02X'] * 6)
+
+# Sizes of the responses in inquiry result events, and offsets relative to
+# the start of a response.
+INQUIRY_INFO_SIZE = 14
+INQUIRY_INFO_CLASS = 9
+INQUIRY_INFO_RSSI_SIZE = 14
+INQUIRY_INFO_RSSI_PSCAN_SIZE = 15
+INQUIRY_INFO_RSSI_CLASS = 8
+INQUIRY_INFO_RSSI_RSSI = 13
+
+# Offsets in an extended inquiry result, relative to the start of the
+# event parameters.
+EXTENDED_ADDRESS = 1
+EXTENDED_DEVICE_CLASS = 9
+EXTENDED_RSSI = 14
+EXTENDED_EIR = 15
+
+EIR_FLAGS = 0x01
+EIR_UUID16_INCOMPLETE = 0x02
+EIR_UUID16 = 0x03
+EIR_UUID32_INCOMPLETE = 0x04
+EIR_UUID32 = 0x05
+EIR_UUID128_INCOMPLETE = 0x06
+EIR_UUID128 = 0x07
+EIR_SHORT_NAME = 0x08
+EIR_NAME = 0x09
+EIR_TX_POWER_LEVEL = 0x0a
+EIR_MANUFACTURER_DATA = 0xff
+
+UUID128_LENGTH = 16
+COMPANY_ID = struct.Struct('<H')
+
+def address(data, offset):
+    """
+    Format the Bluetooth device address at the given offset, like
+    bluez.ba2str.
+
+    @param   data     The buffer containing the address.
+    @param   offset   The offset of the address in the buffer.
+    @return           The address as uppercase colon-separated hex string.
+    """
+    return ADDRESS_FORMAT % ADDRESS.unpack_from(data, offset)[::-1]
+
+def supported_commands(data):
+    """
+    Decode the supported commands bitmask returned by the Read Local
+    Supported Commands command.
+
+    @param   data   The 64 octet bitmask.
+    @return         Dictionary mapping the names in COMMANDS to whether the
+                      command is supported.
+    """
+    octets = bytearray(data)
+    return dict((name, octet < len(octets) and octets[octet] & mask == mask) \
+        for name, (octet, mask) in COMMANDS.iteritems())
+
+def device_class(data, offset):
+    """
+    Decode the 24 bit device class at the given offset.
+
+    @param   data     The buffer containing the device class.
+    @param   offset   The offset of the device class in the buffer.
+    @return           The device class as integer.
+    """
+    low, high = DEVICE_CLASS.unpack_from(data, offset)
+    return (high << 16) | low
+
+def _uuids(s):
+    """
+    Build a decoder of a list of UUIDs, each unpacked with the given Struct.
+    """
+    def decode(data):
+        return [s.unpack_from(data, i)[0] for i in xrange(0,
+            len(data) - s.size + 1, s.size)]
+    return decode
+
+def _uuids128(data):
+    """
+    Decode a list of 128 bit UUIDs, stored little-endian, to strings.
+    """
+    result = []
+    for i in xrange(0, len(data) - UUID128_LENGTH + 1, UUID128_LENGTH):
+        u = binascii.hexlify(data[i:i + UUID128_LENGTH].tobytes()[::-1])
+        result.append('-'.join((u[:8], u[8:12], u[12:16], u[16:20], u[20:])))
+    return result
+
+def _manufacturer_data(data):
+    """
+    Decode manufacturer specific data.
+
+    @return   Tuple of the company identifier and the data as string.
+    """
+    return (COMPANY_ID.unpack_from(data, 0)[0],
+        data[COMPANY_ID.size:].tobytes())
+
+# Decoders of the EIR data types: the name of the field and a function
+# decoding the data of the field from a memoryview.
+EIR_DECODERS = {
+    EIR_FLAGS: ('flags', lambda data: UINT8.unpack_from(data, 0)[0]),
+    EIR_UUID16_INCOMPLETE: ('uuid16', _uuids(struct.Struct('<H'))),
+    EIR_UUID16: ('uuid16', _uuids(struct.Struct('<H'))),
+    EIR_UUID32_INCOMPLETE: ('uuid32', _uuids(struct.Struct('<I'))),
+    EIR_UUID32: ('uuid32', _uuids(struct.Struct('<I'))),
+    EIR_UUID128_INCOMPLETE: ('uuid128', _uuids128),
+    EIR_UUID128: ('uuid128', _uuids128),
+    EIR_SHORT_NAME: ('short_name', lambda data: data.tobytes()),
+    EIR_NAME: ('name', lambda data: data.tobytes()),
+    EIR_TX_POWER_LEVEL: ('tx_power_level',
+        lambda data: INT8.unpack_from(data, 0)[0]),
+    EIR_MANUFACTURER_DATA: ('manufacturer_data', _manufacturer_data)
+}
+
+class ExtendedInquiryResponse(object):
+    """
+    Extended inquiry response data. The data is scanned once for the
+    location of its fields, which are only decoded when asked for.
+    """
+    __slots__ = ('data', 'fields', 'values')
+
+    def __init__(self, data):
+        """
+        Initialisation. Scan the data for fields.
+
+        @param   data   Memoryview of the EIR data.
+        """
+        self.data = data
+        self.fields = {}
+        self.values = {}
+
+        offset = 0
+        end = len(data)
+        while offset + EIR_HEADER.size <= end:
+            length, datatype = EIR_HEADER.unpack_from(data, offset)
+            if length == 0 or offset + 1 + length > end:
+                break
+            if datatype in EIR_DECODERS:
+                self.fields[EIR_DECODERS[datatype][0]] = (datatype,
+                    offset + EIR_HEADER.size, offset + 1 + length)
+            offset += 1 + length
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def names(self):
+        """
+        Return the names of the fields present in the data.
+        """
+        return self.fields.keys()
+
+    def get(self, name, default=None):
+        """
+        Get the value of the field with the given name, decoding it when it
+        is asked for the first time.
+
+        @param   name      The name of the field, see EIR_DECODERS.
+        @param   default   The value returned when the field is not present
+                             or cannot be decoded.
+        @return            The decoded value of the field.
+        """
+        if name in self.values:
+            return self.values[name]
+        if name not in self.fields:
+            return default
+        datatype, start, end = self.fields[name]
+        try:
+            value = EIR_DECODERS[datatype][1](self.data[start:end])
+        except struct.error:
+            value = default
+        self.values[name] = value
+        return value
+
+def _responses(data, size):
+    """
+    Get the number of responses in an inquiry result event, leaving out
+    responses that are cut off.
+
+    @param   size   The size of a response in the event.
+    """
+    nrsp = UINT8.unpack_from(data, 0)[0]
+    return min(nrsp, (len(data) - 1) // size)
+
+def _inquiry_result(data):
+    """
+    Decode an inquiry result event. The responses are consecutive records of
+    the address, the page scan repetition, period and mode, the device class
+    and the clock offset, like the Linux kernel reads them.
+
+    @return   List of (address, device class, TX power, RSSI, EIR) tuples.
+    """
+    return [(address(data, 1 + INQUIRY_INFO_SIZE * i), device_class(data,
+        1 + INQUIRY_INFO_SIZE * i + INQUIRY_INFO_CLASS), None, None, None)
+        for i in xrange(_responses(data, INQUIRY_INFO_SIZE))]
+
+def _inquiry_result_with_rssi(data):
+    """
+    Decode an inquiry result with RSSI event. The responses are consecutive
+    records of the address, the page scan repetition and period mode, the
+    device class, the clock offset and the RSSI, like the Linux kernel reads
+    them. Some controllers include the page scan mode too, which is detected
+    from the length of the event.
+
+    @return   List of (address, device class, TX power, RSSI, EIR) tuples.
+    """
+    nrsp = UINT8.unpack_from(data, 0)[0]
+    size = INQUIRY_INFO_RSSI_SIZE
+    offset = 0
+    if nrsp > 0 and len(data) - 1 == nrsp * INQUIRY_INFO_RSSI_PSCAN_SIZE:
+        size = INQUIRY_INFO_RSSI_PSCAN_SIZE
+        offset = 1
+    return [(address(data, 1 + size * i), device_class(data, 1 + size * i +
+        INQUIRY_INFO_RSSI_CLASS + offset), None, INT8.unpack_from(data,
+        1 + size * i + INQUIRY_INFO_RSSI_RSSI + offset)[0], None) for i in
+        xrange(_responses(data, size))]
+
+def _extended_inquiry_result(data):
+    """
+    Decode an extended inquiry result event, which always contains a single
+    response.
+
+    @return   List of one (address, device class, TX power, RSSI, EIR) tuple,
+                the EIR being an ExtendedInquiryResponse.
+    """
+    eir = ExtendedInquiryResponse(data[EXTENDED_EIR:])
+    return [(address(data, EXTENDED_ADDRESS),
+        device_class(data, EXTENDED_DEVICE_CLASS),
+        eir.get('tx_power_level', None),
+        INT8.unpack_from(data, EXTENDED_RSSI)[0], eir)]
+
+def _inquiry_complete(data):
+    """
+    Decode an inquiry complete event.
+
+    @return   The status.
+    """
+    return UINT8.unpack_from(data, 0)[0]
+
+def _cmd_status(data):
+    """
+    Decode a command status event.
+
+    @return   Tuple of the status, the number of allowed commands and the
+                opcode.
+    """
+    return CMD_STATUS.unpack_from(data, 0)
+
+def _cmd_complete(data):
+    """
+    Decode a command complete event.
+
+    @return   Tuple of the number of allowed commands, the opcode and the
+                status, which is None when the event has no return
+                parameters.
+    """
+    ncmd, opcode = CMD_COMPLETE.unpack_from(data, 0)
+    status = None
+    if len(data) > CMD_COMPLETE.size:
+        status = UINT8.unpack_from(data, CMD_COMPLETE.size)[0]
+    return ncmd, opcode, status
+
+DECODERS = {
+    EVT_INQUIRY_COMPLETE: _inquiry_complete,
+    EVT_INQUIRY_RESULT: _inquiry_result,
+    EVT_CMD_COMPLETE: _cmd_complete,
+    EVT_CMD_STATUS: _cmd_status,
+    EVT_INQUIRY_RESULT_WITH_RSSI: _inquiry_result_with_rssi,
+    EVT_EXTENDED_INQUIRY_RESULT: _extended_inquiry_result
+}
+
+def decode(pkt):
+    """
+    Decode the given HCI event packet.
+
+    @param   pkt   The packet as received from the HCI socket, starting with
+                     the packet type.
+    @return        Tuple of the event code and the decoded event. The decoded
+                     event is None when the event is not supported.
+    """
+    event = UINT8.unpack_from(pkt, 1)[0]
+    decoder = DECODERS.get(event)
+    if decoder is None:
+        return event, None
+    return event, decoder(memoryview(pkt)[EVENT_HEADER_LENGTH:])
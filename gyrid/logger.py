@@ -18,12 +18,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
 import logging
 import logging.handlers
 import os
 import threading
 import time
 
+import detection
+import devicepool
 import zippingfilehandler
 
 class InfoLogger(object):
@@ -70,15 +73,18 @@ class InfoLogger(object):
                 info]))
 
 class WiFiRawLogger(InfoLogger):
-    def __init__(self, mgr, mac):
+    def __init__(self, mgr, mac, header=None):
         """
         Initialisation of the logfile.
 
-        @param  mgr   Reference to Scanmanager instance.
-        @param  mac   The MAC-address of the adapter used for scanning.
+        @param  mgr      Reference to Scanmanager instance.
+        @param  mac      The MAC-address of the adapter used for scanning.
+        @param  header   Line written each time the logfile is opened, None
+                           for no header.
         """
         self.mgr = mgr
         self.mac = mac
+        self.header = header
         InfoLogger.__init__(self, mgr, self._get_log_location())
 
         self.enable = True
@@ -92,26 +98,19 @@ class WiFiRawLogger(InfoLogger):
     def _get_logger(self):
         logger = logging.getLogger(self._get_log_id())
         handler = zippingfilehandler.CompressingRotatingFileHandler(self.mgr,
-            self._get_log_location())
+            self._get_log_location(), self.header)
         handler.setFormatter(logging.Formatter("%(message)s"))
         logger.addHandler(handler)
         return logger
 
-    def write(self, timestamp, frequency, type, subtype, hwid1, hwid2, rssi, retry, info):
+    def write(self, record):
         """
-        Append the parameters to the logfile on a new line and flush the file.
-        Try sending the data over the network.
+        Append the record to the logfile on a new line and flush the file.
 
-        @param  timestamp      UNIX timestamp.
-        @param  mac_address    Hardware address of the Bluetooth device.
-        @param  device_class   Device class of the Bluetooth device.
-        @param  rssi           The RSSI value of the received Bluetooth signal.
+        @param  record   The detection.WiFiRaw record.
         """
         if self.enable and not (self.mgr.debug_mode and self.mgr.debug_silent):
-            a = [self.mgr.format_time(timestamp)]
-            a.extend([str(i) for i in [frequency, type, subtype, hwid1, hwid2, rssi, retry, info]])
-
-            self.logger.info(",".join(a))
+            self.logger.info(record.log_line(self.mgr.format_time))
 
 class WiFiDevRawLogger(InfoLogger):
     def __init__(self, mgr, mac):
@@ -141,21 +140,14 @@ class WiFiDevRawLogger(InfoLogger):
         logger.addHandler(handler)
         return logger
 
-    def write(self, timestamp, frequency, hwid, rssi):
+    def write(self, record):
         """
-        Append the parameters to the logfile on a new line and flush the file.
-        Try sending the data over the network.
+        Append the record to the logfile on a new line and flush the file.
 
-        @param  timestamp      UNIX timestamp.
-        @param  mac_address    Hardware address of the Bluetooth device.
-        @param  device_class   Device class of the Bluetooth device.
-        @param  rssi           The RSSI value of the received Bluetooth signal.
+        @param  record   The detection.WiFiDevRaw record.
         """
         if self.enable and not (self.mgr.debug_mode and self.mgr.debug_silent):
-            a = [self.mgr.format_time(timestamp)]
-            a.extend([str(i) for i in [frequency, hwid, rssi]])
-
-            self.logger.info(",".join(a))
+            self.logger.info(record.log_line(self.mgr.format_time))
 
 class RSSILogger(InfoLogger):
     """
@@ -188,30 +180,16 @@ class RSSILogger(InfoLogger):
         logger.addHandler(handler)
         return logger
 
-    def write(self, timestamp, hwid, device_class, tx_pwr, rssi):
+    def write(self, record):
         """
-        Append the parameters to the logfile on a new line and flush the file.
+        Append the record to the logfile on a new line and flush the file.
         Try sending the data over the network.
 
-        @param  timestamp      UNIX timestamp.
-        @param  hwid           Hardware id of the Bluetooth device.
-        @param  device_class   Device class of the Bluetooth device.
-        @param  tx_pwr         The TX power level of the inquiry response packet.
-        @param  rssi           The RSSI value of the received Bluetooth signal.
+        @param  record   The detection.BluetoothRaw record.
         """
         if self.enable and not (self.mgr.debug_mode and self.mgr.debug_silent):
-            self.logger.info(",".join([self.mgr.format_time(timestamp),
-                str(hwid),
-                str(device_class),
-                str(tx_pwr),
-                str(rssi)]))
-        self.mgr.net_send_line(",".join(['BLUETOOTH_RAW',
-            str(self.mac.replace(':','')),
-            "%0.3f" % timestamp,
-            str(hwid),
-            str(device_class),
-            str(tx_pwr),
-            str(rssi)]))
+            self.logger.info(record.log_line(self.mgr.format_time))
+        self.mgr.net_send(record)
 
 class InquiryLogger(RSSILogger):
     """
@@ -294,8 +272,9 @@ class ScanLogger(RSSILogger):
             'alix_led_support') and (False not in [os.path.exists(
             '/sys/class/leds/alix:%i' % i) for i in [2, 3]]))
 
-        self.pool = {}
-        self.temp_pool = {}
+        self.pool = devicepool.DevicePool(True)
+        self.pending = collections.deque()
+        self.buffer = None
         self.poolchecker = PoolChecker(self.mgr, self)
         self.lock = threading.Lock()
 
@@ -318,17 +297,11 @@ class ScanLogger(RSSILogger):
         @param  device_class   Device class of the Bluetooth device.
         @param  moving         Whether the device is moving 'in' or 'out'.
         """
+        record = detection.BluetoothIO(self.mac, timestamp, hwid,
+            device_class, moving)
         if not (self.mgr.debug_mode and self.mgr.debug_silent):
-            self.logger.info(",".join([self.mgr.format_time(timestamp),
-                str(hwid),
-                str(device_class),
-                str(moving)]))
-        self.mgr.net_send_line(",".join(['BLUETOOTH_IO',
-                str(self.mac.replace(':','')),
-                "%0.3f" % timestamp,
-                str(hwid),
-                str(device_class),
-                str(moving)]))
+            self.logger.info(record.log_line(self.mgr.format_time))
+        self.mgr.net_send(record)
 
     def update_device(self, timestamp, hwid, device_class):
         """
@@ -338,29 +311,76 @@ class ScanLogger(RSSILogger):
         @param  hwid           Hardware id of the Bluetooth device.
         @param  device_class   Device class of the Bluetooth device.
         """
-        if not self.lock.acquire(False):
-            #Failed to lock
-            self.temp_pool[hwid] = [timestamp, device_class]
-        else:
+        self.update_devices(timestamp, [(hwid, device_class)])
+
+    def update_devices(self, timestamp, devices):
+        """
+        Update the given devices in the pool. Never blocks: when another
+        thread holds the lock, the update is applied by the next thread to
+        get the lock.
+
+        @param  timestamp      UNIX timestamp.
+        @param  devices        List of (hwid, device class) tuples of the
+                                 Bluetooth devices.
+        """
+        self.pending.append((timestamp, devices))
+        self.process_pending()
+
+    def process_pending(self):
+        """
+        Apply the pending pool updates, unless another thread holds the lock.
+        The updates are applied in batches, releasing the lock in between, and
+        updates queued while releasing it are picked up by the next batch so
+        none are left behind. Threads that held the lock for other reasons
+        should call this method after releasing it.
+        """
+        while len(self.pending) > 0 and self.lock.acquire(False):
             try:
-                if len(self.temp_pool) > 0:
-                    for id in self.temp_pool:
-                        if id not in self.pool:
-                            self.write(timestamp, id, device_class, 'in')
-                    self.pool.update(self.temp_pool)
-                    self.mgr.debug("%s: " % self.mac + \
-                        "%i devices in temporary pool, merging" % \
-                        len(self.temp_pool))
-                    self.temp_pool.clear()
-                self.switch_led(3)
-
-                if hwid not in self.pool:
-                    self.write(timestamp, hwid, device_class, 'in')
-
-                self.pool[hwid] = [timestamp, device_class]
+                self.apply_pending(len(self.pending))
             finally:
                 self.lock.release()
 
+    def apply_pending(self, count=None):
+        """
+        Apply the pending pool updates in the order they were made. The lock
+        should be held.
+
+        @param  count   The maximum number of updates to apply, all when
+                          None.
+        """
+        if count == None:
+            count = len(self.pending)
+        for i in xrange(count):
+            timestamp, update = self.pending.popleft()
+            self._apply(timestamp, update)
+
+    def _apply(self, timestamp, devices):
+        """
+        Update the given devices in the pool, writing the new ones 'in'.
+
+        @param  timestamp      UNIX timestamp.
+        @param  devices        List of (hwid, device class) tuples of the
+                                 Bluetooth devices.
+        """
+        self.switch_led(3)
+
+        for hwid, device_class in devices:
+            if hwid not in self.pool:
+                self.write(timestamp, hwid, device_class, 'in')
+
+            self.pool[hwid] = [timestamp, device_class]
+
+    def set_buffer(self, buffer):
+        """
+        Change the amount of time a device may disappear before it is removed
+        from the pool.
+
+        @param  buffer   The new buffer length, in seconds.
+        """
+        self.buffer = buffer
+        if 'poolchecker' in self.__dict__:
+            self.poolchecker.buffer = buffer
+
     def start(self):
         """
         Start the poolchecker, which checks at regular intervals the pool for
@@ -368,9 +388,11 @@ class ScanLogger(RSSILogger):
         """
         if not 'poolchecker' in self.__dict__:
             self.poolchecker = PoolChecker(self.mgr, self)
+            if self.buffer != None:
+                self.poolchecker.buffer = self.buffer
         self.mgr.debug("%s: Started pool checker" % self.mac)
         self.pool.clear()
-        self.temp_pool.clear()
+        self.pending.clear()
         self.poolchecker.start()
 
     def stop(self):
@@ -417,7 +439,8 @@ class ScanLogger(RSSILogger):
 class PoolChecker(threading.Thread):
     """
     The PoolChecker checks the device_pool at regular intervals to delete
-    devices that have not been seen for x amount of time from the pool.
+    devices that have not been seen for x amount of time from the pool. Only
+    the devices that have disappeared are visited while holding the lock.
     It is a subclass of threading.Thread to start in a new thread automatically.
     """
     def __init__(self, mgr, logger, buffer=None):
@@ -445,36 +468,28 @@ class PoolChecker(threading.Thread):
         while self._running:
             self.logger.lock.acquire()
             try:
+                self.logger.apply_pending()
                 tijd = int(time.time())
 
-                to_delete = []
-                for device in self.logger.pool:
-                    if tijd - self.logger.pool[device][0] > self.buffer:
-                        self.logger.write(self.logger.pool[device][0],
-                                          device,
-                                          self.logger.pool[device][1],
-                                          'out')
-                        to_delete.append(device)
-
                 new = len(self.logger.pool) - previous
-                # Delete
-                for device in to_delete:
-                    del(self.logger.pool[device])
+                expired = self.logger.pool.expire(tijd - self.buffer)
+                for device, entry in expired:
+                    self.logger.write(entry[0], device, entry[1], 'out')
 
                 current = len(self.logger.pool)
-
-                d = {'current': current,
-                     'new': new if new > 0 else 0,
-                     'gone': len(to_delete)}
-                previous = current
-
-                self.mgr.debug("%s: " % self.logger.mac +
-                    "Device pool checked: %(current)i device" % d + \
-                    ("s " if current != 1 else " ") + \
-                    "(%(new)i new, %(gone)i disappeared)" % d)
-
             finally:
                 self.logger.lock.release()
+            self.logger.process_pending()
+
+            d = {'current': current,
+                 'new': new if new > 0 else 0,
+                 'gone': len(expired)}
+            previous = current
+
+            self.mgr.debug("%s: " % self.logger.mac +
+                "Device pool checked: %(current)i device" % d + \
+                ("s " if current != 1 else " ") + \
+                "(%(new)i new, %(gone)i disappeared)" % d)
 
             time.sleep(self.buffer)
 
@@ -488,7 +503,8 @@ class PoolChecker(threading.Thread):
 class WiFiPoolChecker(threading.Thread):
     """
     The PoolChecker checks the device_pool at regular intervals to delete
-    devices that have not been seen for x amount of time from the pool.
+    devices that have not been seen for x amount of time from the pool. Only
+    the devices that have disappeared are visited while holding the lock.
     It is a subclass of threading.Thread to start in a new thread automatically.
     """
     def __init__(self, mgr, logger):
@@ -513,35 +529,28 @@ class WiFiPoolChecker(threading.Thread):
         while self._running:
             self.logger.lock.acquire()
             try:
+                self.logger.apply_pending()
                 tijd = int(time.time())
 
-                to_delete = []
-                for device in self.logger.pool:
-                    if tijd - self.logger.pool[device] > self.buffer:
-                        self.logger.write(self.logger.pool[device],
-                                          device,
-                                          'out')
-                        to_delete.append(device)
-
                 new = len(self.logger.pool) - previous
-                # Delete
-                for device in to_delete:
-                    del(self.logger.pool[device])
+                expired = self.logger.pool.expire(tijd - self.buffer)
+                for device, timestamp in expired:
+                    self.logger.write(timestamp, device, 'out')
 
                 current = len(self.logger.pool)
-
-                d = {'current': current,
-                     'new': new if new > 0 else 0,
-                     'gone': len(to_delete)}
-                previous = current
-
-                self.mgr.debug("%s: " % self.logger.mac +
-                    "Device pool checked: %(current)i device" % d + \
-                    ("s " if current != 1 else " ") + \
-                    "(%(new)i new, %(gone)i disappeared)" % d)
-
             finally:
                 self.logger.lock.release()
+            self.logger.process_pending()
+
+            d = {'current': current,
+                 'new': new if new > 0 else 0,
+                 'gone': len(expired)}
+            previous = current
+
+            self.mgr.debug("%s: " % self.logger.mac +
+                "Device pool checked: %(current)i device" % d + \
+                ("s " if current != 1 else " ") + \
+                "(%(new)i new, %(gone)i disappeared)" % d)
 
             time.sleep(self.buffer)
 
@@ -557,6 +566,7 @@ class WiFiLogger(ScanLogger):
         self.type = type
         ScanLogger.__init__(self, mgr, mac)
 
+        self.pool = devicepool.DevicePool()
         self.poolchecker = WiFiPoolChecker(self.mgr, self)
 
     def _get_log_id(self):
@@ -574,7 +584,7 @@ class WiFiLogger(ScanLogger):
             self.poolchecker = WiFiPoolChecker(self.mgr, self)
         self.mgr.debug("%s: Started pool checker" % self.mac)
         self.pool.clear()
-        self.temp_pool.clear()
+        self.pending.clear()
         self.poolchecker.start()
 
     def write(self, timestamp, hwid, moving):
@@ -587,11 +597,10 @@ class WiFiLogger(ScanLogger):
         @param  moving         Whether the device is moving 'in' or 'out'.
         """
         if not (self.mgr.debug_mode and self.mgr.debug_silent):
-            self.logger.info(",".join([self.mgr.format_time(timestamp),
-                str(hwid),
-                str(moving)]))
-            self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_IO', self.mac, timestamp,
-                hwid, self.type, moving]))
+            record = detection.WiFiIO(self.mac, timestamp, hwid, self.type,
+                moving)
+            self.logger.info(record.log_line(self.mgr.format_time))
+            self.mgr.net_send(record)
 
     def seen_device(self, timestamp, hwid):
         if hwid in self.pool:
@@ -605,26 +614,23 @@ class WiFiLogger(ScanLogger):
 
         @param  timestamp      UNIX timestamp.
         @param  hwid           Hardware id of the WiFi device.
+        @return                True if the device was not in the pool yet.
         """
-        if not self.lock.acquire(False):
-            #Failed to lock
-            self.temp_pool[hwid] = timestamp
-        else:
-            try:
-                if len(self.temp_pool) > 0:
-                    for id in self.temp_pool:
-                        if id not in self.pool:
-                            self.write(timestamp, id, 'in')
-                    self.pool.update(self.temp_pool)
-                    self.mgr.debug("%s: " % self.mac + \
-                        "%i devices in temporary pool, merging" % \
-                        len(self.temp_pool))
-                    self.temp_pool.clear()
-                self.switch_led(3)
-
-                if hwid not in self.pool:
-                    self.write(timestamp, hwid, 'in')
-
-                self.pool[hwid] = timestamp
-            finally:
-                self.lock.release()
+        new = hwid not in self.pool
+        self.pending.append((timestamp, hwid))
+        self.process_pending()
+        return new
+
+    def _apply(self, timestamp, hwid):
+        """
+        Update the device in the pool, writing it 'in' when new.
+
+        @param  timestamp      UNIX timestamp.
+        @param  hwid           Hardware id of the WiFi device.
+        """
+        self.switch_led(3)
+
+        if hwid not in self.pool:
+            self.write(timestamp, hwid, 'in')
+
+        self.pool[hwid] = timestamp
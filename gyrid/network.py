@@ -61,6 +61,8 @@ class Network(threading.Thread):
             self.s.connect(('127.0.0.1', 25830))
             self.mgr.debug("Connected to the networking component")
             self.send_line("LOCAL,gyrid_uptime,%i" % self.mgr.startup_time)
+            for line in self.mgr.net_state.values():
+                self.send_line(line)
         except socket.error, e:
             if e[0] == 9:
                 self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -18,9 +18,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import bluetooth
-import dbus
-import dbus.mainloop.glib
 import os
 import re
 import subprocess
@@ -28,18 +25,16 @@ import sys
 import threading
 import time
 
+import blacklist
 import configuration
 import discoverer
 import hashing
 import logger
 import network
-import wigy
 
 import scanners.bluetooth
 import scanners.wifi
 
-import scapy.all
-
 def threaded(f):
     """
     Wrapper to start a function within a new thread.
@@ -63,6 +58,7 @@ class ScanManager(object):
         self.debug_mode = False
         self.debug_silent = False
         self.startup_time = int(time.time())
+        self.net_state = {}
 
         self.config = configuration.Configuration(self, self.main.configfile)
         self.info_logger = logger.InfoLogger(self, self.get_info_log_location())
@@ -74,6 +70,9 @@ class ScanManager(object):
         Full initialisation. Initialise everything, called when the program is
         starting up.
         """
+        import dbus
+        import dbus.mainloop.glib
+
         dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
         dbus.mainloop.glib.threads_init()
         self._dbus_systembus = dbus.SystemBus()
@@ -118,8 +117,8 @@ class ScanManager(object):
         When the file does not exist, the blacklist is cleared.
         """
         path = self.config.get_value('blacklist_file')
+        self.blacklist = blacklist.Blacklist()
         if os.path.isfile(path):
-            self.blacklist = set()
             file = open(path, 'r')
             macs_listed = 0
             for line in file:
@@ -133,8 +132,6 @@ class ScanManager(object):
                 self.log_info("Using blacklist file, detections " + \
                     "of %i " % macs_listed + \
                     "listed MAC-address(es) are ignored")
-        else:
-            self.blacklist = set()
 
     def net_send_line(self, line):
         """
@@ -147,6 +144,33 @@ class ScanManager(object):
         if 'network' in self.__dict__:
             self.network.send_line(line)
 
+    def net_send_state(self, key, line):
+        """
+        Send the given state line like net_send_line, and remember it so it is
+        resent every time the connection to the networking component is
+        (re)established.
+
+        @param   key    The key identifying the state, a later line with the
+                          same key replaces this one. None forgets the state.
+        @param   line   The line to send.
+        """
+        if line == None:
+            self.net_state.pop(key, None)
+        else:
+            self.net_state[key] = line
+            self.net_send_line(line)
+
+    def net_send(self, record):
+        """
+        Try sending the given detection record to the Gyrid networking
+        component. The record is only formatted when networking support is
+        enabled.
+
+        @param   record   The detection.Detection record to send.
+        """
+        if 'network' in self.__dict__:
+            self.network.send_line(record.net_line())
+
     def privacy_process(self, string, force=False):
         """
         Process given string to produce a more privacy robust output.
@@ -197,6 +221,8 @@ class ScanManager(object):
 
     @threaded
     def frequency_loop(self, interface):
+        import wigy
+
         freq = 2412
         endfreq = 2472
 
@@ -299,6 +325,10 @@ class ScanManager(object):
         if 'network' in self.__dict__:
             self.network.stop()
 
+        if 'hashing' in self.__dict__ and self.enable_hashing and \
+                self.hashing.cache_size > 0:
+            self.hashing.log_statistics("Hashing cache")
+
         if self.config.get_value('alix_led_support') and \
                 (False not in [os.path.exists('/sys/class/leds/alix:%i' % i) \
                 for i in [1, 2, 3]]):
@@ -22,11 +22,10 @@
 Module implementing the Bluetooth scanning functionality.
 """
 
-import dbus
-import dbus.mainloop.glib
 import time
 
 from gyrid import core, discoverer, logger
+from gyrid.scanners import hciloop
 
 
 class Bluetooth(core.ScanProtocol):
@@ -41,6 +40,8 @@ class Bluetooth(core.ScanProtocol):
         """
         core.ScanProtocol.__init__(self, mgr)
 
+        import dbus
+
         self.excluded_devices = self.mgr.config.get_value('excluded_devices')
 
         bluez_obj = self.mgr._dbus_systembus.get_object('org.bluez', '/')
@@ -55,6 +56,10 @@ class Bluetooth(core.ScanProtocol):
         self.loggers = {}
         self.scanners = {}
 
+        self.event_loop = None
+        if self.mgr.config.get_value('bluetooth_event_loop'):
+            self.event_loop = hciloop.HCIEventLoop(self.mgr)
+
         self.initialise_hardware()
 
     def is_excluded(self, dev_id, mac):
@@ -75,6 +80,8 @@ class Bluetooth(core.ScanProtocol):
         """
         Initialise the Bluetooth hardware already present on the system.
         """
+        import dbus
+
         for adapter in self._dbus_bluez_manager.ListAdapters():
             adap_obj = self.mgr._dbus_systembus.get_object('org.bluez', adapter)
             adap_iface = dbus.Interface(adap_obj, 'org.bluez.Adapter')
@@ -90,6 +97,8 @@ class Bluetooth(core.ScanProtocol):
 
         @param  path   The path of the adapter, as specified by DBus.
         """
+        import dbus
+
         device_obj = self.mgr._dbus_systembus.get_object("org.bluez", path)
         device = dbus.Interface(device_obj, "org.bluez.Adapter")
         self.mgr.debug("Found Bluetooth adapter with address %s" %
@@ -169,13 +178,30 @@ class BluetoothScanner(core.Scanner):
                     self.mgr.net_send_line("STATE,bluetooth,%s,%0.3f,started_scanning" % (
                         self.mac.replace(':',''), time.time()))
                     _logger.start()
+                    if self.protocol.event_loop is not None:
+                        self.protocol.event_loop.add(_discoverer,
+                            lambda end_cause: self.stopped_scanning(_logger,
+                            end_cause))
+                        return
                     end_cause = _discoverer.find()
-                    _logger.stop()
-                    self.mgr.log_info("Stopped scanning with Bluetooth adapter %s%s" % \
-                        (self.mac, end_cause))
-                    self.mgr.net_send_line("STATE,bluetooth,%s,%0.3f,stopped_scanning" % (
-                        self.mac.replace(':',''), time.time()))
-
-                if self.mac in self.protocol.active_adapters:
+                    self.stopped_scanning(_logger, end_cause)
+                elif self.mac in self.protocol.active_adapters:
                     self.protocol.active_adapters.remove(self.mac)
                 del(_discoverer)
+
+    def stopped_scanning(self, _logger, end_cause):
+        """
+        Called when the Discoverer of this adapter has stopped scanning.
+
+        @param  _logger     The ScanLogger of this adapter.
+        @param  end_cause   The cause of the end of the scan, as returned by
+                              Discoverer.find.
+        """
+        _logger.stop()
+        self.mgr.log_info("Stopped scanning with Bluetooth adapter %s%s" % \
+            (self.mac, end_cause))
+        self.mgr.net_send_line("STATE,bluetooth,%s,%0.3f,stopped_scanning" % (
+            self.mac.replace(':',''), time.time()))
+
+        if self.mac in self.protocol.active_adapters:
+            self.protocol.active_adapters.remove(self.mac)
@@ -0,0 +1,172 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module generating BPF programs to filter WiFi frames in the kernel, before
+they are passed to Gyrid.
+"""
+
+import ctypes
+import socket
+import struct
+
+SO_ATTACH_FILTER = 26
+
+SOCK_FILTER = struct.Struct('HBBI')
+SOCK_FPROG = struct.Struct('HL')
+
+# Instruction classes, sizes, modes and operations.
+LD, LDX, ST, ALU, JMP, RET, MISC = 0x00, 0x01, 0x02, 0x04, 0x05, 0x06, 0x07
+W, B = 0x00, 0x10
+IMM, ABS, IND, MEM = 0x00, 0x20, 0x40, 0x60
+OR, AND, LSH, RSH = 0x40, 0x50, 0x60, 0x70
+JA, JEQ, JSET = 0x00, 0x10, 0x40
+K, X = 0x00, 0x08
+TAX = 0x00
+
+ACCEPT = 0xffff
+
+def assemble(program):
+    """
+    Assemble the given program, resolving jump labels.
+
+    @param   program   List of instructions, each either a label (str) or a
+                         tuple of (code, k, jt, jf) where jt and jf are labels
+                         or None to continue with the next instruction.
+    @return            List of (code, jt, jf, k) tuples.
+    """
+    labels = {}
+    instructions = []
+    for i in program:
+        if isinstance(i, str):
+            labels[i] = len(instructions)
+        else:
+            instructions.append(i)
+
+    def offset(label, pc):
+        return 0 if label is None else labels[label] - pc - 1
+
+    assembled = []
+    for pc, (code, k, jt, jf) in enumerate(instructions):
+        if code == JMP | JA:
+            assembled.append((code, 0, 0, offset(k, pc)))
+        else:
+            assembled.append((code, offset(jt, pc), offset(jf, pc), k))
+    return assembled
+
+def compile_filter(kinds, devices_only=False):
+    """
+    Generate a filter program that only accepts frames of the given kinds
+    that are not known to be bad. Management and data frames with the power
+    management bit set are always accepted, as they update the device pool
+    regardless of their kind.
+
+    @param   kinds          Iterable of (type, subtype, ds-bits) tuples of the
+                              frames that are logged.
+    @param   devices_only   Also reject frames without a unicast, globally
+                              unique transmitter address.
+    @return                 List of (code, jt, jf, k) instructions.
+    """
+    masks = [0, 0, 0, 0]
+    for type, subtype, ds in kinds:
+        if devices_only and type == 1 and subtype not in (10, 11, 14, 15):
+            continue # control frames without transmitter address
+        masks[type] |= 1 << subtype
+
+    program = [
+        # M[0] = radiotap header length (little-endian)
+        (LD | B | ABS, 3, None, None),
+        (ALU | LSH | K, 8, None, None),
+        (MISC | TAX, 0, None, None),
+        (LD | B | ABS, 2, None, None),
+        (ALU | OR | X, 0, None, None),
+        (ST, 0, None, None),
+        # Radiotap flags, only checked without extended present bitmasks.
+        (LD | B | ABS, 7, None, None),
+        (JMP | JSET | K, 0x80, 'frame', None),
+        (LD | B | ABS, 4, None, None),
+        (JMP | JSET | K, 0x02, None, 'frame'),
+        (JMP | JSET | K, 0x01, None, 'flags'),
+        (LD | B | ABS, 16, None, None),
+        (JMP | JA, 'badfcs', None, None),
+        'flags',
+        (LD | B | ABS, 8, None, None),
+        'badfcs',
+        (ALU | AND | K, 0x50, None, None),
+        (JMP | JEQ | K, 0x50, 'drop', 'frame'),
+        # M[1] = frame control, the power management bit is only checked for
+        # frames other than control frames.
+        'frame',
+        (LDX | W | MEM, 0, None, None),
+        (LD | B | IND, 0, None, None),
+        (ST, 1, None, None),
+        (ALU | AND | K, 0x0c, None, None),
+        (JMP | JEQ | K, 0x04, 'kind', None),
+        (LD | B | IND, 1, None, None),
+        (JMP | JSET | K, 0x10, 'addr', None),
+        'kind',
+        (LD | W | MEM, 1, None, None),
+        (ALU | RSH | K, 4, None, None),
+        (MISC | TAX, 0, None, None),
+        (LD | W | MEM, 1, None, None),
+        (ALU | AND | K, 0x0c, None, None),
+        (JMP | JEQ | K, 0x00, 'mgmt', None),
+        (JMP | JEQ | K, 0x04, 'ctrl', None),
+        (JMP | JEQ | K, 0x08, 'data', None),
+        (LD | IMM, masks[3], None, None),
+        (JMP | JA, 'subtype', None, None),
+        'mgmt',
+        (LD | IMM, masks[0], None, None),
+        (JMP | JA, 'subtype', None, None),
+        'ctrl',
+        (LD | IMM, masks[1], None, None),
+        (JMP | JA, 'subtype', None, None),
+        'data',
+        (LD | IMM, masks[2], None, None),
+        'subtype',
+        (ALU | RSH | X, 0, None, None),
+        (JMP | JSET | K, 0x01, 'addr', 'drop'),
+        'addr']
+
+    if devices_only:
+        program.extend([
+            (LDX | W | MEM, 0, None, None),
+            (LD | B | IND, 10, None, None),
+            (JMP | JSET | K, 0x03, 'drop', 'accept')])
+
+    program.extend([
+        'accept',
+        (RET | K, ACCEPT, None, None),
+        'drop',
+        (RET | K, 0, None, None)])
+
+    return assemble(program)
+
+def attach(sock, program):
+    """
+    Attach the given filter program to the socket.
+
+    @param   sock      The socket to attach the filter to.
+    @param   program   List of (code, jt, jf, k) instructions.
+    """
+    buf = ctypes.create_string_buffer(''.join(SOCK_FILTER.pack(*i) for i in \
+        program))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, SOCK_FPROG.pack(
+        len(program), ctypes.addressof(buf)))
@@ -0,0 +1,222 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module running the native capture of a WiFi adapter in a child process, so
+capturing and decoding on multiple adapters scales over multiple cores.
+
+The child sends compact records of the decoded frames back to the parent
+over a pipe, in batches. The parent keeps the pools, logs and network
+connection.
+"""
+
+import multiprocessing
+import signal
+import threading
+import time
+
+from gyrid.scanners import dot11
+
+RADIOTAP_FIELDS = ('flags', 'rx_flags', 'channel_freq', 'ant_signal_dbm')
+
+BATCH_SIZE = 256
+BATCH_INTERVAL = 0.1
+
+FRAMES, INFO, DEBUG, DONE = 0, 1, 2, 3
+
+def to_record(frame, timestamp):
+    """
+    Pack the given frame in a compact tuple, keeping only the radiotap
+    fields that are used.
+
+    @param   frame       The decoded Frame.
+    @param   timestamp   The timestamp of the frame.
+    @return              Tuple representing the frame.
+    """
+    radiotap = frame.radiotap
+    return (timestamp, tuple(radiotap.get(i) for i in RADIOTAP_FIELDS),
+        frame.type, frame.subtype, frame.fcfield, frame.addr1, frame.addr2,
+        frame.ssid, frame.cap, frame.reason)
+
+def from_record(record):
+    """
+    Unpack a record created by to_record.
+
+    @param   record   The record tuple.
+    @return           Tuple of the Frame and its timestamp.
+    """
+    timestamp, values, type, subtype, fcfield, addr1, addr2, ssid, cap, \
+        reason = record
+    frame = dot11.Frame(dict((k, v) for k, v in zip(RADIOTAP_FIELDS,
+        values) if v is not None))
+    frame.type = type
+    frame.subtype = subtype
+    frame.fcfield = fcfield
+    frame.addr1 = addr1
+    frame.addr2 = addr2
+    frame.ssid = ssid
+    frame.cap = cap
+    frame.reason = reason
+    return frame, timestamp
+
+class _Main(object):
+    """
+    Stand-in for the Gyrid main object inside the child process.
+    """
+    def __init__(self, stop):
+        self._stop = stop
+
+    @property
+    def stopping(self):
+        return self._stop.is_set()
+
+class _ChildManager(object):
+    """
+    Stand-in for the scanmanager inside the child process, forwarding log
+    messages to the parent.
+    """
+    def __init__(self, conn, lock, stop):
+        self.conn = conn
+        self.lock = lock
+        self.main = _Main(stop)
+
+    def send(self, message):
+        self.lock.acquire()
+        try:
+            self.conn.send(message)
+        finally:
+            self.lock.release()
+
+    def log_info(self, message):
+        self.send((INFO, message))
+
+    def debug(self, message, force=False):
+        self.send((DEBUG, message, force))
+
+class CaptureProcess(object):
+    """
+    Native capture of a WiFiScanner, running in a child process.
+    """
+    def __init__(self, scanner):
+        """
+        Initialisation.
+
+        @param   scanner   The WiFiScanner to capture for.
+        """
+        self.scanner = scanner
+        self.stop = multiprocessing.Event()
+        self.reader, self.writer = multiprocessing.Pipe(False)
+        self.process = multiprocessing.Process(target=self._run,
+            name='gyrid-capture-%s' % scanner.iface)
+        self.process.daemon = True
+
+    def _run(self):
+        """
+        Entry point of the child process: capture until the parent stops us
+        and send the decoded frames back in batches.
+        """
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop.set())
+        self.reader.close()
+
+        lock = threading.Lock()
+        mgr = _ChildManager(self.writer, lock, self.stop)
+        self.scanner.mgr = mgr
+        batch = []
+
+        def flush():
+            # Called with the lock held.
+            if batch:
+                self.writer.send((FRAMES, batch[:]))
+                del batch[:]
+
+        def flusher():
+            while not self.stop.is_set():
+                time.sleep(BATCH_INTERVAL)
+                lock.acquire()
+                try:
+                    flush()
+                finally:
+                    lock.release()
+
+        def process(frame, timestamp):
+            lock.acquire()
+            try:
+                batch.append(to_record(frame, timestamp))
+                if len(batch) >= BATCH_SIZE:
+                    flush()
+            finally:
+                lock.release()
+            return True
+
+        t = threading.Thread(target=flusher)
+        t.daemon = True
+        t.start()
+
+        result = self.scanner.capture_native(process)
+        lock.acquire()
+        try:
+            flush()
+            self.writer.send((DONE, result))
+        finally:
+            lock.release()
+        self.writer.close()
+
+    def run(self, process):
+        """
+        Start the child process and hand the frames it captures to the given
+        function, until Gyrid stops.
+
+        @param   process   Function to call with each frame and its timestamp.
+        @return            The result of WiFiScanner.capture_native in the
+                             child: False when no raw socket could be opened.
+        """
+        mgr = self.scanner.mgr
+        self.process.start()
+        self.writer.close()
+
+        result = True
+        try:
+            while True:
+                if mgr.main.stopping:
+                    self.stop.set()
+                if not self.reader.poll(1):
+                    if not self.process.is_alive():
+                        break
+                    continue
+
+                message = self.reader.recv()
+                if message[0] == FRAMES:
+                    for record in message[1]:
+                        process(*from_record(record))
+                elif message[0] == INFO:
+                    mgr.log_info(message[1])
+                elif message[0] == DEBUG:
+                    mgr.debug(message[1], message[2])
+                elif message[0] == DONE:
+                    result = message[1]
+                    break
+        except EOFError:
+            pass
+        finally:
+            self.stop.set()
+            self.reader.close()
+            self.process.join()
+        return result
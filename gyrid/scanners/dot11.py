@@ -0,0 +1,332 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module implementing a lightweight decoder for captured 802.11 frames.
+
+Only the radiotap fields and the 802.11 header fields Gyrid actually uses are
+decoded, using precompiled struct.Struct objects. The decoded values mimic
+those of the corresponding scapy layers, so both capture modes yield identical
+output.
+"""
+
+import binascii
+import struct
+
+RADIOTAP_HEADER = struct.Struct('<BxHI')
+RADIOTAP_PRESENT = struct.Struct('<I')
+DOT11_HEADER = struct.Struct('<BB2x6s')
+DOT11_ADDR = struct.Struct('<6s')
+BEACON_CAP = struct.Struct('>H')
+REASON = struct.Struct('<H')
+ELT_HEADER = struct.Struct('<BB')
+
+DOT11_HEADER_LENGTH = 24
+BEACON_CAP_OFFSET = DOT11_HEADER_LENGTH + 10
+
+TYPE_MGMT = 0
+TYPE_CTRL = 1
+TYPE_DATA = 2
+TYPE_RESERVED = 3
+
+FC_TO_DS = 0x01
+FC_FROM_DS = 0x02
+FC_DS = FC_TO_DS | FC_FROM_DS
+FC_RETRY = 0x08
+FC_PW_MGT = 0x10
+
+SUBTYPE_ASSOREQ = 0
+SUBTYPE_ASSORESP = 1
+SUBTYPE_REASSOREQ = 2
+SUBTYPE_REASSORESP = 3
+SUBTYPE_PROBEREQ = 4
+SUBTYPE_PROBERESP = 5
+SUBTYPE_BEACON = 8
+SUBTYPE_ATIM = 9
+SUBTYPE_DISAS = 10
+SUBTYPE_PSPOLL = 10
+SUBTYPE_DEAUTH = 12
+
+# Control frames that carry a transmitter address, as dissected by scapy.
+CTRL_ADDR2_SUBTYPES = frozenset([10, 11, 14, 15])
+
+# Capability flags in the bit order scapy uses to render them.
+CAPABILITY_FLAGS = ["res8", "res9", "short-slot", "res11", "res12",
+    "DSSS-OFDM", "res14", "res15", "ESS", "IBSS", "CFP", "CFP-req", "privacy",
+    "short-preamble", "PBCC", "agility"]
+
+# Radiotap fields in the default namespace, by bit number: the alignment and
+# a tuple of value names and struct formats. Values named None are skipped.
+RADIOTAP_FIELDS = {
+    0: (8, (('tsft', 'Q'),)),
+    1: (1, (('flags', 'B'),)),
+    2: (1, (('rate', 'B'),)),
+    3: (2, (('channel_freq', 'H'), ('channel_type', 'H'))),
+    4: (2, (('fhss', 'B'), (None, 'x'))),
+    5: (1, (('ant_signal_dbm', 'b'),)),
+    6: (1, (('ant_noise_dbm', 'b'),)),
+    7: (2, (('lock_quality', 'H'),)),
+    8: (2, (('tx_attenuation', 'H'),)),
+    9: (2, (('tx_attenuation_db', 'H'),)),
+    10: (1, (('tx_power_dbm', 'b'),)),
+    11: (1, (('antenna', 'B'),)),
+    12: (1, (('ant_signal_db', 'B'),)),
+    13: (1, (('ant_noise_db', 'B'),)),
+    14: (2, (('rx_flags', 'H'),)),
+    15: (2, (('tx_flags', 'H'),)),
+    16: (1, (('rts_retries', 'B'),)),
+    17: (1, (('data_retries', 'B'),)),
+    18: (4, (('xchannel_flags', 'I'), ('xchannel_freq', 'H'),
+             ('xchannel_channel', 'B'), ('xchannel_maxpower', 'B'))),
+    19: (1, (('mcs_known', 'B'), ('mcs_flags', 'B'), ('mcs', 'B'))),
+    20: (4, (('ampdu_reference', 'I'), ('ampdu_flags', 'H'),
+             (None, 'x'), (None, 'x'))),
+    21: (2, (('vht_known', 'H'), (None, '10x'))),
+    22: (8, (('timestamp', 'Q'), (None, '4x'))),
+}
+
+RADIOTAP_NS_NEXT = 29
+RADIOTAP_VENDOR_NS_NEXT = 30
+RADIOTAP_EXT = 31
+
+MAC_FORMAT = ':'.join(['%s%s'] * 6)
+
+class Frame(object):
+    """
+    Decoded 802.11 frame, containing only the fields Gyrid uses.
+    """
+    __slots__ = ('radiotap', 'type', 'subtype', 'fcfield', 'addr1', 'addr2',
+                 'ssid', 'cap', 'reason')
+
+    def __init__(self, radiotap):
+        """
+        Initialisation.
+
+        @param   radiotap   Dictionary of decoded radiotap values.
+        """
+        self.radiotap = radiotap
+        self.type = None
+        self.subtype = None
+        self.fcfield = 0
+        self.addr1 = None
+        self.addr2 = None
+        self.ssid = None
+        self.cap = ''
+        self.reason = ''
+
+def mac(data):
+    """
+    Format the given 6 byte string as a colon-separated lowercase MAC address.
+
+    @param   data   The raw address.
+    @return         The formatted address.
+    """
+    return MAC_FORMAT % tuple(binascii.hexlify(data))
+
+def capabilities(cap):
+    """
+    Render the given beacon capability value like scapy's '%cap%' would.
+
+    @param   cap   The capability value, read as a big-endian short.
+    @return        The names of the set flags, joined with '+'.
+    """
+    return '+'.join(CAPABILITY_FLAGS[i] for i in range(16) if cap & (1 << i))
+
+class RadiotapDecoder(object):
+    """
+    Decoder for radiotap headers. Each distinct set of 'present' bitmasks is
+    compiled once into a single struct.Struct and a tuple of field names,
+    which are kept in a bounded cache.
+    """
+    def __init__(self, fields=RADIOTAP_FIELDS, size=64):
+        """
+        Initialisation.
+
+        @param   fields   Dictionary of radiotap field definitions by bit.
+        @param   size     The maximum number of cached layouts.
+        """
+        self.fields = fields
+        self.size = size
+        self.layouts = {}
+
+    def compile(self, words):
+        """
+        Compile the layout of a radiotap header with the given present words.
+        Fields are aligned relative to the start of the header. Only the first
+        occurrence of each field is named, f.ex. the global antenna signal is
+        kept when per-antenna namespaces follow. Decoding stops at the first
+        vendor namespace, as its length isn't known from the bitmasks alone.
+
+        @param   words   Tuple of 'present' bitmasks.
+        @return          Tuple of a struct.Struct, relative to the start of the
+                           header, and a tuple of field names.
+        """
+        offset = RADIOTAP_HEADER.size + 4 * (len(words) - 1)
+        fmt = ['<%ix' % offset]
+        names = []
+        base = 0
+        for present in words:
+            for bit in range(RADIOTAP_NS_NEXT):
+                if not present & (1 << bit):
+                    continue
+                if base + bit not in self.fields:
+                    # Offsets of any further fields are unknown.
+                    return struct.Struct(''.join(fmt)), tuple(names)
+                align, values = self.fields[base + bit]
+                padding = -offset % align
+                if padding:
+                    fmt.append('%ix' % padding)
+                for name, code in values:
+                    if name is None or name in names:
+                        fmt.append(code if 'x' in code else '%ix' % \
+                            struct.calcsize(code))
+                    else:
+                        fmt.append(code)
+                        names.append(name)
+                offset = struct.calcsize(''.join(fmt))
+            if present & (1 << RADIOTAP_NS_NEXT):
+                base = 0
+            elif present & (1 << RADIOTAP_VENDOR_NS_NEXT):
+                break
+            else:
+                base += 32
+        return struct.Struct(''.join(fmt)), tuple(names)
+
+    def decode(self, data, present, length):
+        """
+        Decode the radiotap header at the start of the given frame.
+
+        @param   data      The captured frame.
+        @param   present   The first 'present' bitmask.
+        @param   length    The length of the radiotap header.
+        @return            Dictionary of field names and their values.
+        """
+        if present & (1 << RADIOTAP_EXT):
+            end = RADIOTAP_HEADER.size
+            p = present
+            while p & (1 << RADIOTAP_EXT) and end + 4 <= length:
+                p = RADIOTAP_PRESENT.unpack_from(data, end)[0]
+                end += 4
+            key = data[4:end]
+        else:
+            key = present
+
+        try:
+            layout, names = self.layouts[key]
+        except KeyError:
+            if len(self.layouts) >= self.size:
+                self.layouts.clear()
+            if key == present:
+                words = (present,)
+            else:
+                words = struct.unpack('<%iI' % (len(key) / 4), key)
+            layout, names = self.compile(words)
+            self.layouts[key] = (layout, names)
+
+        if layout.size > length:
+            return {}
+        return dict(zip(names, layout.unpack_from(data)))
+
+def decode(data, radiotap):
+    """
+    Decode a raw frame as captured on a monitor mode interface.
+
+    @param   data       The captured frame, starting with the radiotap header.
+    @param   radiotap   The RadiotapDecoder to use.
+    @return             A Frame instance, None when the data can't be decoded.
+    """
+    if len(data) < RADIOTAP_HEADER.size:
+        return None
+    version, length, present = RADIOTAP_HEADER.unpack_from(data)
+    if version != 0 or len(data) < length + 10:
+        return None
+
+    frame = Frame(radiotap.decode(data, present, length))
+
+    fc, frame.fcfield, frame.addr1 = DOT11_HEADER.unpack_from(data, length)
+    frame.addr1 = mac(frame.addr1)
+    frame.type = (fc >> 2) & 0b11
+    frame.subtype = fc >> 4
+
+    if (frame.type != TYPE_CTRL or frame.subtype in CTRL_ADDR2_SUBTYPES) \
+        and len(data) >= length + 16:
+        frame.addr2 = mac(DOT11_ADDR.unpack_from(data, length + 10)[0])
+
+    if frame.type == TYPE_MGMT:
+        body = length + DOT11_HEADER_LENGTH
+        if frame.subtype == SUBTYPE_BEACON and \
+            len(data) >= length + BEACON_CAP_OFFSET + 2:
+            frame.cap = capabilities(BEACON_CAP.unpack_from(data,
+                length + BEACON_CAP_OFFSET)[0])
+        elif frame.subtype == SUBTYPE_PROBEREQ:
+            frame.ssid = ''
+            if len(data) >= body + 2:
+                id, l = ELT_HEADER.unpack_from(data, body)
+                if id == 0:
+                    frame.ssid = data[body+2:body+2+l]
+        elif frame.subtype in (SUBTYPE_DEAUTH, SUBTYPE_DISAS) and \
+            len(data) >= body + 2:
+            frame.reason = REASON.unpack_from(data, body)[0]
+
+    return frame
+
+def from_scapy(pkt, radiotap):
+    """
+    Convert a packet dissected by scapy to a Frame.
+
+    @param   pkt        The scapy packet.
+    @param   radiotap   The RadiotapDecoder to use.
+    @return             A Frame instance, None when there is no 802.11 layer.
+    """
+    import scapy.all
+
+    radiotap_values = {}
+    if pkt.haslayer(scapy.all.RadioTap):
+        f = pkt.getlayer(scapy.all.RadioTap).fields
+        header = RADIOTAP_HEADER.pack(f['version'], f['len'], f['present']) + \
+            f['notdecoded']
+        radiotap_values = radiotap.decode(header, f['present'], f['len'])
+
+    if not pkt.haslayer(scapy.all.Dot11):
+        return None
+
+    d11 = pkt.getlayer(scapy.all.Dot11)
+    frame = Frame(radiotap_values)
+    frame.type = d11.type
+    frame.subtype = d11.subtype
+    frame.fcfield = d11.FCfield
+    frame.addr1 = d11.addr1
+    frame.addr2 = d11.addr2
+
+    if pkt.haslayer(scapy.all.Dot11Beacon):
+        frame.cap = d11.getlayer(scapy.all.Dot11Beacon).sprintf("%cap%")
+    elif pkt.haslayer(scapy.all.Dot11ProbeReq):
+        elt = d11.getlayer(scapy.all.Dot11Elt)
+        frame.ssid = ''
+        if elt is not None and elt.fields['ID'] == 0:
+            frame.ssid = elt.fields['info']
+    elif pkt.haslayer(scapy.all.Dot11Deauth):
+        frame.reason = pkt.getlayer(scapy.all.Dot11Deauth).fields.get(
+            'reason', '')
+    elif pkt.haslayer(scapy.all.Dot11Disas):
+        frame.reason = pkt.getlayer(scapy.all.Dot11Disas).fields.get(
+            'reason', '')
+
+    return frame
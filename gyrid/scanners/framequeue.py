@@ -0,0 +1,129 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module implementing the bounded queue between capturing WiFi frames and
+processing them.
+"""
+
+import collections
+import threading
+
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+
+class FrameQueue(object):
+    """
+    Bounded, thread-safe FIFO queue. When it is full, either the oldest queued
+    item or the new item is dropped, so the producer never blocks.
+    """
+    def __init__(self, size, overflow=DROP_OLDEST):
+        """
+        Initialisation.
+
+        @param   size       The maximum number of queued items.
+        @param   overflow   What to drop when the queue is full, DROP_OLDEST
+                              or DROP_NEWEST.
+        """
+        self.size = size
+        self.overflow = overflow
+        self.items = collections.deque()
+        self.condition = threading.Condition(threading.Lock())
+        self.closed = False
+
+        self.max_depth = 0
+        self.dropped = 0
+
+    def put(self, item):
+        """
+        Add an item to the queue, waking up a waiting consumer.
+
+        @param   item   The item to add.
+        @return         False when the item was dropped, else True.
+        """
+        self.condition.acquire()
+        try:
+            if len(self.items) >= self.size:
+                self.dropped += 1
+                if self.overflow == DROP_NEWEST:
+                    return False
+                self.items.popleft()
+            self.items.append(item)
+            if len(self.items) > self.max_depth:
+                self.max_depth = len(self.items)
+            self.condition.notify()
+            return True
+        finally:
+            self.condition.release()
+
+    def get(self, timeout):
+        """
+        Remove and return the oldest item, waiting for one to become
+        available.
+
+        @param   timeout   The maximum time to wait, in seconds.
+        @return            The item, None on timeout or when the queue is
+                             closed and empty.
+        """
+        self.condition.acquire()
+        try:
+            if not self.items and not self.closed:
+                self.condition.wait(timeout)
+            if self.items:
+                return self.items.popleft()
+            return None
+        finally:
+            self.condition.release()
+
+    def close(self):
+        """
+        Mark the end of the input; consumers drain the remaining items.
+        """
+        self.condition.acquire()
+        try:
+            self.closed = True
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+    def is_done(self):
+        """
+        @return   True when the queue is closed and all items are consumed.
+        """
+        return self.closed and not self.items
+
+    def statistics(self):
+        """
+        Read and reset the queue statistics.
+
+        @return   Tuple of the current depth, the maximum depth and the number
+                    of items dropped since the previous call.
+        """
+        self.condition.acquire()
+        try:
+            stats = (len(self.items), self.max_depth, self.dropped)
+            self.max_depth = len(self.items)
+            self.dropped = 0
+            return stats
+        finally:
+            self.condition.release()
+
+    def __len__(self):
+        return len(self.items)
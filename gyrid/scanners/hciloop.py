@@ -0,0 +1,181 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module implementing a single event loop handling the inquiries of all
+Bluetooth adapters.
+"""
+
+import select
+import threading
+
+from gyrid import core
+
+POLL_TIMEOUT = 1
+
+class HCIEventLoop(object):
+    """
+    Drives the inquiries of multiple Discoverers from a single thread. The HCI
+    sockets of all Discoverers are registered with one epoll object; each
+    Discoverer starts a new inquiry as soon as its previous one has ended,
+    so every adapter keeps its own inquiry schedule.
+    """
+    def __init__(self, mgr):
+        """
+        Initialisation.
+
+        @param   mgr   Reference to ScanManager instance.
+        """
+        self.mgr = mgr
+        self.epoll = select.epoll()
+        self.lock = threading.Lock()
+        self.discoverers = {}
+        self.running = False
+
+    def add(self, discoverer, finish):
+        """
+        Start scanning with the given Discoverer. The loop is started when it
+        isn't running yet.
+
+        @param   discoverer   The initialised Discoverer.
+        @param   finish       Function called with the end cause, as returned
+                                by Discoverer.find, when the Discoverer has
+                                stopped scanning.
+        """
+        try:
+            discoverer.start_inquiry()
+        except Exception, e:
+            discoverer.done = True
+            discoverer.flush()
+            finish(" (%s)" % e.message)
+            return
+
+        self.lock.acquire()
+        try:
+            fd = discoverer.sock.fileno()
+            self.discoverers[fd] = (discoverer, finish)
+            self.epoll.register(fd, select.EPOLLIN | select.EPOLLERR |
+                select.EPOLLHUP)
+            if not self.running:
+                self.running = True
+                self.run()
+        finally:
+            self.lock.release()
+
+    def _remove(self, fd, end):
+        """
+        Stop handling the events of the Discoverer with the given socket and
+        call its finish function. Should be called with the lock held.
+
+        @param   fd    The file descriptor of the HCI socket.
+        @param   end   The cause of the end of the scan.
+        """
+        if fd not in self.discoverers:
+            return
+        discoverer, finish = self.discoverers.pop(fd)
+        try:
+            self.epoll.unregister(fd)
+        except (IOError, ValueError):
+            pass
+        discoverer.flush()
+        finish(" (%s)" % end)
+
+    def _handle(self, fd, mask):
+        """
+        Receive and handle the next event of the Discoverer with the given
+        socket, starting a new inquiry when the previous one has ended.
+        Should be called with the lock held.
+
+        @param   fd     The file descriptor of the HCI socket.
+        @param   mask   The epoll event mask of the socket.
+        """
+        discoverer = self.discoverers[fd][0]
+        pkt = discoverer.receive()
+        if pkt is None:
+            if discoverer.done or mask & (select.EPOLLERR | select.EPOLLHUP):
+                discoverer.done = True
+                self._remove(fd, "adapter lost")
+            return
+
+        try:
+            ended = discoverer.handle_event(pkt)
+            if self.mgr.main.stopping and (ended or
+                discoverer.periodic_active):
+                discoverer.stop_inquiry()
+                self._remove(fd, "Shutting down")
+            elif ended:
+                if discoverer.done:
+                    self._remove(fd, "Stopped")
+                else:
+                    discoverer.start_inquiry()
+        except Exception, e:
+            discoverer.done = True
+            self._remove(fd, e.message)
+
+    @core.threaded
+    def run(self):
+        """
+        Wait for events on the HCI sockets and handle them, until no
+        Discoverers are left.
+        """
+        stopped = False
+        try:
+            while not stopped:
+                try:
+                    events = self.epoll.poll(POLL_TIMEOUT)
+                except IOError:
+                    events = []
+
+                self.lock.acquire()
+                try:
+                    for fd, mask in events:
+                        if fd in self.discoverers:
+                            self._guarded_handle(fd, mask)
+                    if len(self.discoverers) == 0:
+                        self.running = False
+                        stopped = True
+                finally:
+                    self.lock.release()
+        finally:
+            if not stopped:
+                # Let the next call to add start a new loop.
+                self.lock.acquire()
+                self.running = False
+                self.lock.release()
+
+    def _guarded_handle(self, fd, mask):
+        """
+        Handle the next event of the Discoverer with the given socket, so a
+        failure of one adapter can't stop the loop for the others. A
+        Discoverer that fails is removed. Should be called with the lock
+        held.
+
+        @param   fd     The file descriptor of the HCI socket.
+        @param   mask   The epoll event mask of the socket.
+        """
+        try:
+            self._handle(fd, mask)
+        except Exception, e:
+            self.mgr.main.log_error('Error', "Bluetooth event loop: %s" % e)
+            try:
+                self._remove(fd, e.message)
+            except Exception, e:
+                self.mgr.main.log_error('Error',
+                    "Bluetooth event loop: %s" % e)
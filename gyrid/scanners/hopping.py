@@ -0,0 +1,146 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module implementing the channel hopping schedule of a WiFi adapter.
+"""
+
+import threading
+
+FIXED = 'fixed'
+ADAPTIVE = 'adaptive'
+
+# A new device counts as much as this many logged frames.
+DEVICE_WEIGHT = 100.0
+# Weight of the latest visit in the smoothed yield of a frequency.
+SMOOTHING = 0.3
+
+class ChannelScheduler(object):
+    """
+    Decides how long to dwell on each frequency. In fixed mode every
+    frequency gets the same dwell time. In adaptive mode the time available
+    for a loop over all frequencies is divided in proportion to the yield of
+    each frequency, i.e. the smoothed rate of logged frames and new devices,
+    while each frequency is still visited for at least the minimum dwell
+    time.
+    """
+    def __init__(self, frequencies, mode=FIXED, dwell=1.0, min_dwell=0.2):
+        """
+        Initialisation.
+
+        @param   frequencies   List of frequencies to loop over.
+        @param   mode          FIXED or ADAPTIVE.
+        @param   dwell         The average dwell time per frequency, in
+                                 seconds.
+        @param   min_dwell     The minimum dwell time per frequency in
+                                 adaptive mode, in seconds.
+        """
+        self.frequencies = frequencies[:]
+        self.mode = mode
+        self.dwell = dwell
+        self.min_dwell = min(min_dwell, dwell)
+
+        self.yields = dict((f, 0.0) for f in self.frequencies)
+        self.counts = dict((f, [0, 0]) for f in self.frequencies)
+        self.current = None
+        self.lock = threading.Lock()
+
+    def schedule(self):
+        """
+        Plan the next loop over all frequencies.
+
+        @return   List of (frequency, dwell time) tuples.
+        """
+        if self.mode != ADAPTIVE or not self.frequencies:
+            return [(f, self.dwell) for f in self.frequencies]
+
+        total = sum(self.yields[f] for f in self.frequencies)
+        if total <= 0:
+            return [(f, self.dwell) for f in self.frequencies]
+
+        spare = (self.dwell - self.min_dwell) * len(self.frequencies)
+        return [(f, self.min_dwell + spare * self.yields[f] / total) for f in \
+            self.frequencies]
+
+    def tune(self, frequency):
+        """
+        Start a visit of the given frequency.
+
+        @param   frequency   The frequency the adapter is tuned to.
+        """
+        self.current = frequency
+
+    def record(self, frequency, new_device=False):
+        """
+        Count a logged frame on the frequency it was received on. Called from
+        the frame processing path, which may lag behind the hopping.
+
+        @param   frequency    The frequency of the frame, from its radiotap
+                                header.
+        @param   new_device   Whether the frame revealed a new device.
+        """
+        self.lock.acquire()
+        try:
+            if frequency in self.counts:
+                counts = self.counts[frequency]
+                counts[0] += 1
+                if new_device:
+                    counts[1] += 1
+        finally:
+            self.lock.release()
+
+    def finish(self, elapsed):
+        """
+        End the visit of the current frequency and update its yield with the
+        frames counted for it since its previous visit ended.
+
+        @param   elapsed   The time spent on the frequency, in seconds.
+        """
+        frequency = self.current
+        self.current = None
+        self.lock.acquire()
+        try:
+            if frequency not in self.counts:
+                return
+            frames, devices = self.counts[frequency]
+            self.counts[frequency] = [0, 0]
+        finally:
+            self.lock.release()
+        if elapsed <= 0:
+            return
+
+        rate = (frames + DEVICE_WEIGHT * devices) / elapsed
+        self.yields[frequency] = SMOOTHING * rate + \
+            (1 - SMOOTHING) * self.yields[frequency]
+
+    def remove(self, frequency):
+        """
+        Stop visiting the given frequency.
+
+        @param   frequency   The frequency to remove.
+        """
+        if frequency in self.frequencies:
+            self.frequencies.remove(frequency)
+            del(self.yields[frequency])
+            self.lock.acquire()
+            try:
+                del(self.counts[frequency])
+            finally:
+                self.lock.release()
@@ -0,0 +1,151 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module implementing a memory-mapped PACKET_MMAP (TPACKET_V3) receive ring.
+
+The kernel fills blocks of frames in a ring shared with userspace, so frames
+are read in place without a system call or allocation per frame.
+"""
+
+import mmap
+import select
+import struct
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 0x1
+TP_STATUS_LOSING = 0x4
+
+TPACKET_REQ3 = struct.Struct('=7I')
+TPACKET_STATS_V3 = struct.Struct('=3I')
+BLOCK_STATUS = struct.Struct('=I')
+BLOCK_HEADER = struct.Struct('=III')
+PACKET_HEADER = struct.Struct('=IIIIIIH')
+
+BLOCK_STATUS_OFFSET = 8
+
+BLOCK_SIZE = 1 << 16
+BLOCK_NR = 32
+FRAME_SIZE = 1 << 11
+BLOCK_TIMEOUT = 100
+
+class PacketRing(object):
+    """
+    TPACKET_V3 receive ring attached to a packet socket.
+    """
+    def __init__(self, sock, block_size=BLOCK_SIZE, block_nr=BLOCK_NR,
+            frame_size=FRAME_SIZE, timeout=BLOCK_TIMEOUT):
+        """
+        Initialisation. Set up the ring and map it in memory.
+
+        @param   sock         The packet socket to attach the ring to.
+        @param   block_size   The size of a block in bytes, a multiple of the
+                                page size.
+        @param   block_nr     The number of blocks in the ring.
+        @param   frame_size   The nominal frame size in bytes.
+        @param   timeout      Time in ms after which the kernel hands over a
+                                block that isn't full yet.
+        """
+        self.sock = sock
+        self.block_size = block_size
+        self.block_nr = block_nr
+        self.block = 0
+        self.losing = 0
+
+        sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        sock.setsockopt(SOL_PACKET, PACKET_RX_RING, TPACKET_REQ3.pack(
+            block_size, block_nr, frame_size,
+            block_size / frame_size * block_nr, timeout, 0, 0))
+        self.map = mmap.mmap(sock.fileno(), block_size * block_nr,
+            mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+        self.poll = select.poll()
+        self.poll.register(sock, select.POLLIN | select.POLLERR)
+
+    def read(self, timeout):
+        """
+        Wait for the next block to be handed over by the kernel and return
+        the frames it contains. The block should be released after the frames
+        have been processed.
+
+        @param   timeout   The maximum time to wait, in seconds.
+        @return            List of (buffer, timestamp) tuples, referring to the
+                             frames in place. None when no block was ready.
+        """
+        offset = self.block * self.block_size
+        status = BLOCK_STATUS.unpack_from(self.map,
+            offset + BLOCK_STATUS_OFFSET)[0]
+        if not status & TP_STATUS_USER:
+            self.poll.poll(int(timeout * 1000))
+            status = BLOCK_STATUS.unpack_from(self.map,
+                offset + BLOCK_STATUS_OFFSET)[0]
+            if not status & TP_STATUS_USER:
+                return None
+
+        if status & TP_STATUS_LOSING:
+            self.losing += 1
+
+        num_pkts, first = BLOCK_HEADER.unpack_from(self.map,
+            offset + BLOCK_STATUS_OFFSET)[1:]
+        frames = []
+        position = offset + first
+        for i in xrange(num_pkts):
+            next, sec, nsec, snaplen, l, s, mac = PACKET_HEADER.unpack_from(
+                self.map, position)
+            frames.append((buffer(self.map, position + mac, snaplen),
+                sec + nsec / 1e9))
+            position += next
+        return frames
+
+    def release(self):
+        """
+        Hand the current block back to the kernel and move on to the next.
+        """
+        offset = self.block * self.block_size + BLOCK_STATUS_OFFSET
+        self.map[offset:offset + BLOCK_STATUS.size] = BLOCK_STATUS.pack(
+            TP_STATUS_KERNEL)
+        self.block = (self.block + 1) % self.block_nr
+
+    def statistics(self):
+        """
+        Read and reset the ring statistics.
+
+        @return   Tuple of the number of frames received, the number of frames
+                    dropped, the number of times the ring was full and the
+                    number of blocks flagged for losses.
+        """
+        packets, drops, freezes = TPACKET_STATS_V3.unpack(
+            self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS,
+            TPACKET_STATS_V3.size))
+        losing = self.losing
+        self.losing = 0
+        return packets, drops, freezes, losing
+
+    def close(self):
+        """
+        Unmap the ring.
+        """
+        self.map.close()
@@ -0,0 +1,73 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module implementing deterministic sampling of the raw WiFi frame stream.
+"""
+
+import zlib
+
+class FrameSampler(object):
+    """
+    Decides which raw frames are logged, given a sampling rate per frame
+    type. The decision is based on a hash of the device's MAC-address, so
+    either all or none of the frames of a device are logged and the same
+    devices are sampled by every sensor. Counts taken from the sampled
+    stream can be reweighted by dividing by the rate.
+    """
+    def __init__(self, rates):
+        """
+        Initialisation.
+
+        @param   rates   Dictionary mapping the frame type, as logged, to its
+                           sampling rate, between 0 and 1. Frame types that
+                           are not present are logged completely.
+        """
+        self.rates = rates or {}
+        self.thresholds = dict((type, int(rate * 0x100000000)) for (
+            type, rate) in self.rates.items() if rate < 1)
+
+    def enabled(self):
+        """
+        Whether any frames are left out.
+        """
+        return len(self.thresholds) > 0
+
+    def sample(self, type, addr):
+        """
+        Decide whether the frame is logged.
+
+        @param   type   The frame type, as logged.
+        @param   addr   The MAC-address of the device the frame belongs to.
+        @return         True when the frame is logged.
+        """
+        threshold = self.thresholds.get(type)
+        if threshold is None:
+            return True
+        return zlib.crc32(addr or '') & 0xffffffff < threshold
+
+    def describe(self):
+        """
+        Describe the sampling rates.
+
+        @return   The rates as semicolon-separated type:rate pairs.
+        """
+        return ';'.join('%s:%s' % (type.lower(), self.rates[type]) for type in
+            sorted(self.rates))
@@ -22,15 +22,115 @@
 Module implementing the WiFi scanning functionality.
 """
 
-import dbus
-import dbus.mainloop.glib
+import socket
 import struct
+import threading
 import time
 
-import scapy.all
+from gyrid import aggregation, core, detection, logger
+from gyrid.scanners import bpf, captureprocess, dot11, framequeue, hopping
+from gyrid.scanners import packetring, sampling
 
-from gyrid import core, logger
-import wigy
+# DBus, scapy and wigy are imported where they are used, so WiFi captures can
+# be replayed without them.
+
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+PACKET_STATS = struct.Struct('II')
+
+STATISTICS_INTERVAL = 300
+
+DEV = 'DEV'
+ACP = 'ACP'
+
+UPDATE = 'update_device'
+SEEN = 'seen_device'
+
+INFO_CAP = 'cap'
+INFO_SSID = 'ssid'
+INFO_REASON = 'reason'
+
+class FrameKind(object):
+    """
+    Defines how a kind of captured frame is logged.
+    """
+    __slots__ = ('type', 'subtype', 'info', 'actions', 'actions_first')
+
+    def __init__(self, type, subtype, info=None, actions=(),
+            actions_first=False):
+        """
+        Initialisation.
+
+        @param   type            The frame type, as logged.
+        @param   subtype         The frame subtype, as logged.
+        @param   info            Which extra information is logged: INFO_CAP,
+                                   INFO_SSID, INFO_REASON or None.
+        @param   actions         Tuple of (pool, method, devraw) tuples, defining
+                                   the transmitter's pool (DEV or ACP), how it
+                                   is updated (UPDATE or SEEN) and whether the
+                                   detection is added to the raw device stream.
+                                   A dictionary of such tuples by logged info
+                                   when the actions depend on it.
+        @param   actions_first   Whether the pools are updated before the frame
+                                   itself is logged.
+        """
+        self.type = type
+        self.subtype = subtype
+        self.info = info
+        self.actions = actions
+        self.actions_first = actions_first
+
+def _frame_kinds():
+    """
+    Build the dispatch table of frame kinds, keyed on the frame type, subtype
+    and distribution system bits.
+    """
+    dev_update = ((DEV, UPDATE, True),)
+    acp_update = ((ACP, UPDATE, False),)
+    acp_seen = ((ACP, SEEN, False),)
+    both_seen = ((ACP, SEEN, False), (DEV, SEEN, True))
+
+    data = {0: FrameKind('DATA', '', actions=dev_update),
+            dot11.FC_TO_DS: FrameKind('DATA', 'to-ds', actions=dev_update),
+            dot11.FC_FROM_DS: FrameKind('DATA', 'from-ds', actions=acp_update),
+            dot11.FC_DS: FrameKind('DATA', 'from-ds;to-ds', actions=acp_update)}
+
+    ctrl = FrameKind('CTRL', '', actions=both_seen)
+    ctrl_pspoll = FrameKind('CTRL', 'pspoll', actions=dev_update)
+
+    mgmt = {dot11.SUBTYPE_BEACON: FrameKind('MGMT', 'beacon', INFO_CAP,
+                {'IBSS': dev_update, 'ESS': acp_update}, actions_first=True),
+            dot11.SUBTYPE_PROBERESP: FrameKind('MGMT', 'proberesp',
+                actions=both_seen),
+            dot11.SUBTYPE_PROBEREQ: FrameKind('MGMT', 'probereq', INFO_SSID,
+                dev_update),
+            dot11.SUBTYPE_DEAUTH: FrameKind('MGMT', 'deauth', INFO_REASON,
+                both_seen),
+            dot11.SUBTYPE_DISAS: FrameKind('MGMT', 'disas', INFO_REASON,
+                both_seen),
+            dot11.SUBTYPE_ATIM: FrameKind('MGMT', 'atim', actions=dev_update),
+            dot11.SUBTYPE_ASSOREQ: FrameKind('MGMT', 'assoreq',
+                actions=dev_update),
+            dot11.SUBTYPE_ASSORESP: FrameKind('MGMT', 'assoresp',
+                actions=acp_seen),
+            dot11.SUBTYPE_REASSOREQ: FrameKind('MGMT', 'reassoreq',
+                actions=dev_update),
+            dot11.SUBTYPE_REASSORESP: FrameKind('MGMT', 'reassoresp',
+                actions=acp_seen)}
+
+    kinds = {}
+    for ds in range(4):
+        for subtype in range(16):
+            kinds[(dot11.TYPE_DATA, subtype, ds)] = data[ds]
+            kinds[(dot11.TYPE_RESERVED, subtype, ds)] = data[ds]
+            kinds[(dot11.TYPE_CTRL, subtype, ds)] = ctrl_pspoll \
+                if subtype == dot11.SUBTYPE_PSPOLL else ctrl
+            if subtype in mgmt:
+                kinds[(dot11.TYPE_MGMT, subtype, ds)] = mgmt[subtype]
+    return kinds
+
+FRAME_KINDS = _frame_kinds()
 
 
 class WiFi(core.ScanProtocol):
@@ -59,22 +159,6 @@ class WiFi(core.ScanProtocol):
                             2452, 2457, 2462, 2467, 2472]
 
 
-        self.radiotap_fields = [(2**0, 'tsft', 8, 'Q'),
-                                (2**1, 'flags', 1, 'B'),
-                                (2**2, 'rate', 1, 'B'),
-                                (2**3, 'channel_freq', 2, 'H'),
-                                (2**3, 'channel_type', 2, '2B'),
-                                (2**4, 'fhss', 2, '2B'),
-                                (2**5, 'ant_signal_dbm', 1, 'b'),
-                                (2**6, 'ant_noise_dbm', 1, 'b'),
-                                (2**7, 'lock_quality', 2, 'H'),
-                                (2**8, 'tx_attenuation', 2, 'H'),
-                                (2**9, 'tx_attenuation_db', 2, 'H'),
-                                (2**10, 'tx_power_dbm', 1, 'b'),
-                                (2**11, 'antenna', 1, 'B'),
-                                (2**12, 'ant_signal_db', 1, 'B'),
-                                (2**13, 'ant_noise_db', 1, 'B'),
-                                (2**14, 'rx_flags', 2, 'H')]
 
         self.scanners = {}
         self.loggers = {}
@@ -84,6 +168,8 @@ class WiFi(core.ScanProtocol):
         """
         Initialise the WiFi hardware already present on the system.
         """
+        import dbus
+
         o = self.mgr._dbus_systembus.get_object('org.freedesktop.NetworkManager',
                 '/org/freedesktop/NetworkManager')
         for dev in dbus.Interface(o, "org.freedesktop.NetworkManager").GetDevices():
@@ -95,6 +181,8 @@ class WiFi(core.ScanProtocol):
 
         @param   path   The path of the adapter, as specified by DBus.
         """
+        import dbus
+
         device_obj = self.mgr._dbus_systembus.get_object("org.freedesktop.NetworkManager", path)
         prop_iface = dbus.Interface(device_obj, "org.freedesktop.DBus.Properties")
         props = prop_iface.GetAll("org.freedesktop.NetworkManager.Device")
@@ -152,15 +240,14 @@ class WiFiScanner(core.Scanner):
         @param   wifidevice   DBus interface for the NetworkManager wireless device.
         @param   path         DBus path of the NetworkManager device.
         """
+        import wigy
+
         core.Scanner.__init__(self, mgr, protocol)
         self.v = self.protocol.valid
 
         self.mac = wifidevice['PermHwAddress']
         self.iface = str(device['Interface'])
-        self.running = True
-        self.fcs_support_logged = False
-
-        self.frequencies = self.protocol.frequencies[:]
+        self.init_capture()
 
         try:
             wigy.set_status(self.iface, 0)
@@ -173,45 +260,301 @@ class WiFiScanner(core.Scanner):
             self.start_scanning()
             self.loop_frequencies()
 
+    def init_capture(self):
+        """
+        Initialise the capture and processing settings from the configuration.
+        """
+        self.running = True
+        self.fcs_support_logged = False
+        self.capture_mode = self.mgr.config.get_value('wifi_capture_mode')
+        self.capture_filter = self.mgr.config.get_value('wifi_capture_filter')
+        self.capture_process = self.mgr.config.get_value(
+            'wifi_capture_process')
+        self.queue_size = self.mgr.config.get_value('wifi_queue_size')
+        self.queue_overflow = self.mgr.config.get_value('wifi_queue_overflow')
+        self.expire_aggregates = True
+        self.radiotap = dot11.RadiotapDecoder()
+        self.sampler = sampling.FrameSampler(self.mgr.config.get_value(
+            'wifi_raw_sampling'))
+        ring_adapters = self.mgr.config.get_value('wifi_ring_adapters') or []
+        self.capture_ring = len(set(['all', self.mac.lower(),
+            self.iface.lower()]).intersection(ring_adapters)) > 0
+
+        self.frequencies = self.protocol.frequencies[:]
+        self.hopper = hopping.ChannelScheduler(self.frequencies,
+            self.mgr.config.get_value('wifi_hop_mode'),
+            self.mgr.config.get_value('wifi_dwell_time') / 1000.0,
+            self.mgr.config.get_value('wifi_min_dwell_time') / 1000.0)
+
     @core.threaded
     def loop_frequencies(self):
         """
-        Loop over all available WiFi frequencies with a one second interval.
+        Loop over all available WiFi frequencies, dwelling on each of them as
+        long as the channel scheduler decides.
         """
-        cnt = 0
-        freq = 0
-        duration = 1
+        import wigy
+
+        schedule = []
         freqs_done = []
+        durations = []
         while self.running and not self.mgr.main.stopping:
             if len(self.frequencies) == 0:
                 self.running = False
-            elif cnt >= len(self.frequencies):
-                cnt = 0
-                self.mgr.net_send_line("STATE,wifi,%s,%0.3f,frequency_loop,%i,%s" %
-                    (self.mac.replace(':','').lower(), time.time(), duration*1000, ";".join(
-                        str(i) for i in freqs_done)))
-                if '_logger_freq' in self.__dict__:
-                    self._logger_freq.write(time.time(), str(duration), [str(i) for i in freqs_done])
+            elif len(schedule) == 0:
+                if len(durations) > 0:
+                    duration = sum(durations) / len(durations)
+                    self.mgr.net_send_line("STATE,wifi,%s,%0.3f,frequency_loop,%i,%s" %
+                        (self.mac.replace(':','').lower(), time.time(), duration*1000, ";".join(
+                            str(i) for i in freqs_done)))
+                    if '_logger_freq' in self.__dict__:
+                        self._logger_freq.write(time.time(), "%0.3f" % duration, [str(i) for i in freqs_done])
+                schedule = self.hopper.schedule()
                 freqs_done[:] = []
+                durations[:] = []
             else:
+                freq, dwell = schedule.pop(0)
                 try:
-                    if cnt < len(self.frequencies):
-                        freq = self.frequencies[cnt]
-                        wigy.set_frequency(self.iface, freq)
-                        self.mgr.debug("%s: Frequency set to %i Hz" % (self.mac, freq))
-                        freqs_done.append(freq)
-                        cnt += 1
+                    wigy.set_frequency(self.iface, freq)
+                    self.mgr.debug("%s: Frequency set to %i Hz" % (self.mac, freq))
                 except IOError:
                     self.mgr.debug("%s: Frequency of %i Hz is not supported" % (self.mac,
-                        self.frequencies[cnt]))
+                        freq))
                     self.mgr.main.log_error("%s: Frequency of %i Hz is not supported" % (self.mac,
-                        self.frequencies[cnt]), 'Warning')
-                    self.frequencies.pop(cnt)
+                        freq), 'Warning')
+                    self.frequencies.remove(freq)
+                    self.hopper.remove(freq)
                 else:
                     if self.running:
+                        started = time.time()
+                        self.hopper.tune(freq)
+                        time.sleep(dwell)
+                        elapsed = time.time() - started
+                        self.hopper.finish(elapsed)
+                        # Report the time actually spent on the frequency.
                         self.mgr.net_send_line("STATE,wifi,%s,%0.3f,frequency,%i,%i" %
-                            (self.mac.replace(':','').lower(), time.time(), freq, duration*1000))
-                        time.sleep(duration)
+                            (self.mac.replace(':','').lower(), started, freq, elapsed*1000))
+                        freqs_done.append(freq)
+                        durations.append(elapsed)
+
+    def capture(self, process):
+        """
+        Capture frames natively, in a child process when configured.
+
+        @param   process   Function to call with each decoded frame and its
+                             timestamp.
+        @return            False when no raw socket could be opened, True when
+                             capturing has stopped.
+        """
+        if self.capture_process:
+            return captureprocess.CaptureProcess(self).run(process)
+        return self.capture_native(process)
+
+    def capture_native(self, process):
+        """
+        Capture frames straight from the monitor interface through a raw
+        socket, decoding them without scapy. Unless disabled, a BPF filter
+        is attached to the socket so irrelevant frames are dropped in the
+        kernel.
+
+        @param   process   Function to call with each decoded frame and its
+                             timestamp. Should return True when the frame is
+                             logged or queued for processing.
+        @return            False when no raw socket could be opened, True when
+                             capturing has stopped.
+        """
+        try:
+            sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                socket.htons(ETH_P_ALL))
+            sock.bind((self.iface, ETH_P_ALL))
+            sock.settimeout(1)
+        except socket.error, e:
+            self.mgr.log_info("%s: Native capture unavailable (%s), " % (
+                self.mac, e) + "falling back to scapy")
+            return False
+
+        if self.capture_filter != 'none':
+            try:
+                bpf.attach(sock, bpf.compile_filter(FRAME_KINDS,
+                    self.capture_filter == 'devices'))
+            except socket.error, e:
+                self.mgr.log_info("%s: Failed to attach capture filter (%s)" % (
+                    self.mac, e))
+            else:
+                self.mgr.debug("%s: Attached %s capture filter" % (self.mac,
+                    self.capture_filter))
+
+        ring = None
+        if self.capture_ring:
+            try:
+                ring = packetring.PacketRing(sock)
+            except (socket.error, EnvironmentError), e:
+                self.mgr.log_info("%s: Failed to set up capture ring (%s)" % (
+                    self.mac, e))
+            else:
+                self.mgr.debug("%s: Capturing through memory-mapped ring" % \
+                    self.mac)
+
+        try:
+            if ring is not None:
+                self.capture_from_ring(sock, ring, process)
+            else:
+                self.capture_from_socket(sock, process)
+        finally:
+            if ring is not None:
+                ring.close()
+            sock.close()
+        return True
+
+    def capture_from_socket(self, sock, process):
+        """
+        Receive frames from the raw socket one by one, until Gyrid stops.
+
+        @param   sock      The capture socket.
+        @param   process   Function to call with each decoded frame and its
+                             timestamp.
+        """
+        received = 0
+        discarded = 0
+        reported = time.time()
+        try:
+            while not self.mgr.main.stopping:
+                try:
+                    data = sock.recv(65535)
+                except socket.timeout:
+                    data = None
+
+                timestamp = time.time()
+                if data is not None:
+                    received += 1
+                    frame = dot11.decode(data, self.radiotap)
+                    if frame is None or not process(frame, timestamp):
+                        discarded += 1
+
+                if timestamp - reported >= STATISTICS_INTERVAL:
+                    self.log_capture_statistics(sock, received, discarded)
+                    received = discarded = 0
+                    reported = timestamp
+        finally:
+            self.log_capture_statistics(sock, received, discarded)
+
+    def capture_from_ring(self, sock, ring, process):
+        """
+        Read frames a block at a time from the memory-mapped ring, until
+        Gyrid stops. Frames are decoded in place and carry the kernel's
+        receive timestamp.
+
+        @param   sock      The capture socket.
+        @param   ring      The PacketRing attached to the socket.
+        @param   process   Function to call with each decoded frame and its
+                             timestamp.
+        """
+        received = 0
+        discarded = 0
+        reported = time.time()
+        try:
+            while not self.mgr.main.stopping:
+                frames = ring.read(1)
+                if frames is not None:
+                    try:
+                        received += len(frames)
+                        for data, timestamp in frames:
+                            frame = dot11.decode(data, self.radiotap)
+                            if frame is None or not process(frame, timestamp):
+                                discarded += 1
+                    finally:
+                        ring.release()
+
+                if time.time() - reported >= STATISTICS_INTERVAL:
+                    self.log_capture_statistics(sock, received, discarded,
+                        ring)
+                    received = discarded = 0
+                    reported = time.time()
+        finally:
+            self.log_capture_statistics(sock, received, discarded, ring)
+
+    def log_capture_statistics(self, sock, received, discarded, ring=None):
+        """
+        Write the capture statistics since the previous call to the info log.
+
+        @param   sock        The capture socket. Reading its statistics resets
+                               the kernel counters.
+        @param   received    The number of frames received in userspace.
+        @param   discarded   The number of those frames that were not logged.
+        @param   ring        The PacketRing used for capturing, if any. Its
+                               block-level statistics are logged too.
+        """
+        freezes = losing = 0
+        try:
+            if ring is not None:
+                packets, drops, freezes, losing = ring.statistics()
+            else:
+                packets, drops = PACKET_STATS.unpack(sock.getsockopt(
+                    SOL_PACKET, PACKET_STATISTICS, PACKET_STATS.size))
+        except socket.error:
+            packets, drops = received, 0
+
+        if packets or received:
+            self.mgr.log_info("%s: Capture statistics: " % self.mac + \
+                "%i frames passed the kernel filter, " % packets + \
+                "%i dropped by the kernel, %i received " % (drops, received) + \
+                "and %i discarded by Gyrid" % discarded + (", ring full " + \
+                "%i times, %i blocks with losses" % (freezes, losing) if \
+                ring is not None else ""))
+
+    def process_queue(self, queue, process):
+        """
+        Process the frames in the queue until it is closed and drained. Queue
+        statistics are written to the info log periodically.
+
+        @param   queue     The FrameQueue to consume.
+        @param   process   Function to call with each frame and its timestamp.
+                             Should return True when the frame is logged.
+        """
+        processed = 0
+        discarded = 0
+        reported = time.time()
+        try:
+            while not queue.is_done():
+                item = queue.get(1)
+                if item is not None:
+                    processed += 1
+                    if not process(*item):
+                        discarded += 1
+
+                if time.time() - reported >= STATISTICS_INTERVAL:
+                    self.log_queue_statistics(queue, processed, discarded)
+                    processed = discarded = 0
+                    reported = time.time()
+        finally:
+            self.log_queue_statistics(queue, processed, discarded)
+
+    def log_queue_statistics(self, queue, processed, discarded):
+        """
+        Write the processing queue statistics since the previous call to the
+        info log.
+
+        @param   queue       The FrameQueue. Reading its statistics resets its
+                               counters.
+        @param   processed   The number of frames taken from the queue.
+        @param   discarded   The number of those frames that were not logged.
+        """
+        depth, max_depth, dropped = queue.statistics()
+        if processed or dropped:
+            self.mgr.log_info("%s: Queue statistics: " % self.mac + \
+                "%i frames processed, %i not logged, " % (processed,
+                discarded) + "depth %i (max %i of %i), " % (depth, max_depth,
+                queue.size) + "%i dropped (%s)" % (dropped, queue.overflow))
+
+    def interface_down(self):
+        """
+        Take the interface down after scanning has stopped.
+        """
+        import wigy
+
+        try:
+            wigy.set_status(self.iface, 0)
+        except IOError:
+            pass
 
     @core.threaded
     def start_scanning(self):
@@ -221,6 +564,13 @@ class WiFiScanner(core.Scanner):
         self.mgr.log_info("Started scanning with WiFi adapter %s" % self.mac)
         self.mgr.net_send_line("STATE,wifi,%s,%0.3f,started_scanning" % (
             self.mac.replace(':',''), time.time()))
+        if self.sampler.enabled():
+            self.mgr.log_info("Sampling raw WiFi frames of adapter %s: %s" % (
+                self.mac, self.sampler.describe()))
+            self.mgr.net_send_state((self.mac, 'raw_sampling'),
+                "STATE,wifi,%s,%0.3f,raw_sampling,%s" % (
+                self.mac.replace(':',''), time.time(),
+                self.sampler.describe()))
 
         def v(addr):
             return self.protocol.valid(addr)
@@ -239,208 +589,116 @@ class WiFiScanner(core.Scanner):
 
         def devraw(timestamp, sensorMac, addr, frequency, ssi):
             if addr and v(addr):
-                _logger_devraw.write(timestamp, frequency, h(addr), ssi)
-                self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_DEVRAW',
-                    timestamp, sensorMac, h(addr), frequency, ssi]))
+                aggregator.add(detection.WiFiDevRaw(sensorMac, timestamp,
+                    h(addr), frequency, ssi))
+
+        def emit_devraw(record):
+            _logger_devraw.write(record)
+            self.mgr.net_send(record)
+
+        def update_pools(actions, timestamp, addr, frequency, ssi):
+            """
+            Update the pools with the given actions. Returns True when a new
+            device was added to the device pool.
+            """
+            new_device = False
+            for pool, method, raw in actions:
+                result = f(getattr(pools[pool], method), timestamp, addr)
+                if raw and (method == UPDATE or result):
+                    devraw(timestamp, self.mac, addr, frequency, ssi)
+                if pool == DEV and method == UPDATE and result:
+                    new_device = True
+            return new_device
 
         def process(pkt):
             """
-            Process a captured packet.
+            Process a packet captured and dissected by scapy.
             """
             timestamp = time.time()
-            if pkt.haslayer(scapy.all.RadioTap):
-                pkt_radio = pkt.getlayer(scapy.all.RadioTap)
-                
-                radiotap_values = {}
-
-                offset = 0
-                for i in self.protocol.radiotap_fields:
-                    if pkt_radio.fields['present'] & i[0] == i[0]:
-                        offset += offset % i[2] # byte padding
-                        radiotap_values[i[1]] = struct.unpack_from('%ix%s' % (offset, i[3]),
-                            pkt_radio.fields['notdecoded'])[0]
-                        offset += i[2]
-
-                if 'flags' in radiotap_values:
-                    fl = radiotap_values['flags']
-                    if fl & 0b10000 == 0b10000 and fl & 0b1000000 == 0b1000000:
-                        return # we don't process packets that are known to be bad
-                    elif fl & 0b10000 != 0b10000:
-                        if not self.fcs_support_logged:
-                            self.fcs_support_logged = True
-                            self.mgr.main.log_error("%s: FCS not supported" % self.mac, 'Warning')
-
-                if 'rx_flags' in radiotap_values and radiotap_values['rx_flags'] & 0b10 == 0b10:
-                    self.mgr.debug("%s: Bad PLCP packet received" % self.mac)
-
-            if pkt.haslayer(scapy.all.Dot11):
-                d11 = pkt.getlayer(scapy.all.Dot11)
-                fcfield = d11.sprintf('%FCfield%')
-
-                if d11.addr1 and (True in (d11.addr1.upper().startswith(b) for b in self.mgr.blacklist)):
-                    return
-
-                if d11.addr2 and (True in (d11.addr2.upper().startswith(b) for b in self.mgr.blacklist)):
-                    return
-
-                retry = ''
-                if 'retry' in fcfield:
-                    retry = 'R'
-
-                frequency = radiotap_values.get('channel_freq', '')
-                ssi = radiotap_values.get('ant_signal_dbm', '')
-
-                pw_mgt = ''
-                if 'pw-mgt' in fcfield:
-                    pw_mgt = 'P'
-                if 'pw-mgt' in fcfield and d11.addr2:
-                    f(_logger_dev.update_device, timestamp, d11.addr2)
-
-                if d11.type & 0b10 == 0b10: # data frame
-                    if 'from-DS' in fcfield and 'to-DS' in fcfield:
-                        _rawlogger.write(timestamp, frequency, 'DATA', 'from-ds;to-ds',
-                            h(d11.addr1), h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'data', 'from-ds;to-ds', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_acp.update_device, timestamp, d11.addr2)
-                    elif 'from-DS' in fcfield:
-                        _rawlogger.write(timestamp, frequency, 'DATA', 'from-ds', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'data', 'from-ds', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_acp.update_device, timestamp, d11.addr2)
-                    elif 'to-DS' in fcfield:
-                        _rawlogger.write(timestamp, frequency, 'DATA', 'to-ds', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'data', 'to-ds', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_dev.update_device, timestamp, d11.addr2)
-                        devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-                    elif 'from-DS' not in fcfield and 'to-DS' not in fcfield:
-                        _rawlogger.write(timestamp, frequency, 'DATA', '', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'data', '', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_dev.update_device, timestamp, d11.addr2)
-                        devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-
-                elif d11.type & 0b01 == 0b01: # control frame
-                    if d11.subtype == 10: # PS-Poll
-                        _rawlogger.write(timestamp, frequency, 'CTRL', 'pspoll', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'ctrl', 'pspoll', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_dev.update_device, timestamp, d11.addr2)
-                        devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-                    else:
-                        _rawlogger.write(timestamp, frequency, 'CTRL', '', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'ctrl', '', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_acp.seen_device, timestamp, d11.addr2)
-                        if f(_logger_dev.seen_device, timestamp, d11.addr2):
-                            devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-
-                elif d11.type & 0b00 == 0b00: # management frame
-                    if pkt.haslayer(scapy.all.Dot11Beacon):
-                        tpe = d11.getlayer(scapy.all.Dot11Beacon).sprintf("%cap%")
-                        if 'IBSS' in tpe:
-                            tpe = 'IBSS'
-                            f(_logger_dev.update_device, timestamp, d11.addr2)
-                            devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-                        elif 'ESS' in tpe:
-                            tpe = 'ESS'
-                            f(_logger_acp.update_device, timestamp, d11.addr2)
-                        _rawlogger.write(timestamp, frequency, 'MGMT', 'beacon', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, tpe)
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'mgmt', 'beacon', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, tpe]))
-                    elif pkt.haslayer(scapy.all.Dot11ProbeResp):
-                        _rawlogger.write(timestamp, frequency, 'MGMT', 'proberesp', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'mgmt', 'proberesp', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_acp.seen_device, timestamp, d11.addr2)
-                        if f(_logger_dev.seen_device, timestamp, d11.addr2):
-                            devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-                    elif pkt.haslayer(scapy.all.Dot11ProbeReq):
-                        elt = d11.getlayer(scapy.all.Dot11Elt)
-                        ssid = ''
-                        if elt.fields['ID'] == 0:
-                            ssid = elt.fields['info']
-                        _rawlogger.write(timestamp, frequency, 'MGMT', 'probereq', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, h(ssid, force=True))
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'mgmt', 'probereq', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, h(ssid, force=True)]))
-                        f(_logger_dev.update_device, timestamp, d11.addr2)
-                        devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-                    elif pkt.haslayer(scapy.all.Dot11Deauth): 
-                        reason = pkt.getlayer(scapy.all.Dot11Deauth).fields.get('reason', '')
-                        _rawlogger.write(timestamp, frequency, 'MGMT', 'deauth', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, reason)
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'mgmt', 'deauth', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, reason]))
-                        f(_logger_acp.seen_device, timestamp, d11.addr2)
-                        if f(_logger_dev.seen_device, timestamp, d11.addr2):
-                            devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-                    elif pkt.haslayer(scapy.all.Dot11Disas): 
-                        reason = pkt.getlayer(scapy.all.Dot11Disas).fields.get('reason', '')
-                        _rawlogger.write(timestamp, frequency, 'MGMT', 'disas', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, reason)
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'mgmt', 'disas', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, reason]))
-                        f(_logger_acp.seen_device, timestamp, d11.addr2)
-                        if f(_logger_dev.seen_device, timestamp, d11.addr2):
-                            devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-                    elif pkt.haslayer(scapy.all.Dot11ATIM):
-                        _rawlogger.write(timestamp, frequency, 'MGMT', 'atim', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'mgmt', 'atim', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_dev.update_device, timestamp, d11.addr2)
-                        devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-                    elif pkt.haslayer(scapy.all.Dot11AssoReq):
-                        _rawlogger.write(timestamp, frequency, 'MGMT', 'assoreq', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'mgmt', 'assoreq', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_dev.update_device, timestamp, d11.addr2)
-                        devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-                    elif pkt.haslayer(scapy.all.Dot11AssoResp):
-                        _rawlogger.write(timestamp, frequency, 'MGMT', 'assoresp', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'mgmt', 'assoresp', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_acp.seen_device, timestamp, d11.addr2)
-                    elif pkt.haslayer(scapy.all.Dot11ReassoReq):
-                        _rawlogger.write(timestamp, frequency, 'MGMT', 'reassoreq', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'mgmt', 'reassoreq', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_dev.update_device, timestamp, d11.addr2)
-                        devraw(timestamp, self.mac, d11.addr2, frequency, ssi)
-                    elif pkt.haslayer(scapy.all.Dot11ReassoResp):
-                        _rawlogger.write(timestamp, frequency, 'MGMT', 'reassoresp', h(d11.addr1),
-                            h(d11.addr2), ssi, retry, '')
-                        self.mgr.net_send_line(','.join(str(i) for i in ['WIFI_RAW', self.mac, timestamp,
-                            frequency, 'mgmt', 'reassoresp', h(d11.addr1), h(d11.addr2), ssi,
-                            retry, pw_mgt, '']))
-                        f(_logger_acp.seen_device, timestamp, d11.addr2)
+            frame = dot11.from_scapy(pkt, self.radiotap)
+            if frame is not None:
+                handle(frame, timestamp)
+
+        def process_frame(d11, timestamp):
+            """
+            Process a decoded frame. Returns True when the frame is logged.
+            """
+            radiotap_values = d11.radiotap
+
+            if 'flags' in radiotap_values:
+                fl = radiotap_values['flags']
+                if fl & 0b10000 == 0b10000 and fl & 0b1000000 == 0b1000000:
+                    return # we don't process packets that are known to be bad
+                elif fl & 0b10000 != 0b10000:
+                    if not self.fcs_support_logged:
+                        self.fcs_support_logged = True
+                        self.mgr.main.log_error("%s: FCS not supported" % self.mac, 'Warning')
+
+            if 'rx_flags' in radiotap_values and radiotap_values['rx_flags'] & 0b10 == 0b10:
+                self.mgr.debug("%s: Bad PLCP packet received" % self.mac)
+
+            fcfield = d11.fcfield
+
+            if d11.addr1 and self.mgr.blacklist.match(d11.addr1):
+                return
+
+            if d11.addr2 and self.mgr.blacklist.match(d11.addr2):
+                return
+
+            retry = ''
+            if fcfield & dot11.FC_RETRY:
+                retry = 'R'
+
+            frequency = radiotap_values.get('channel_freq', '')
+            ssi = radiotap_values.get('ant_signal_dbm', '')
+
+            pw_mgt = ''
+            if fcfield & dot11.FC_PW_MGT:
+                pw_mgt = 'P'
+            new_device = False
+            if fcfield & dot11.FC_PW_MGT and d11.addr2:
+                new_device = f(_logger_dev.update_device, timestamp, d11.addr2)
+
+            kind = FRAME_KINDS.get((d11.type, d11.subtype,
+                fcfield & dot11.FC_DS))
+            if kind is None:
+                return
+
+            info = ''
+            if kind.info == INFO_CAP:
+                info = d11.cap
+                if 'IBSS' in info:
+                    info = 'IBSS'
+                elif 'ESS' in info:
+                    info = 'ESS'
+            elif kind.info == INFO_SSID:
+                info = h(d11.ssid, force=True)
+            elif kind.info == INFO_REASON:
+                info = d11.reason
+
+            actions = kind.actions
+            if isinstance(actions, dict):
+                actions = actions.get(info, ())
+
+            if kind.actions_first:
+                new_device = update_pools(actions, timestamp, d11.addr2,
+                    frequency, ssi) or new_device
+
+            if self.sampler.sample(kind.type, d11.addr2 or d11.addr1):
+                hwid1 = h(d11.addr1)
+                hwid2 = h(d11.addr2)
+                record = detection.WiFiRaw(self.mac, timestamp, frequency,
+                    kind.type, kind.subtype, hwid1, hwid2, ssi, retry, pw_mgt,
+                    info)
+                _rawlogger.write(record)
+                self.mgr.net_send(record)
+
+            if not kind.actions_first:
+                new_device = update_pools(actions, timestamp, d11.addr2,
+                    frequency, ssi) or new_device
+
+            self.hopper.record(frequency, new_device)
+            return True
 
         def stoppercheck(pkt):
             """
@@ -449,7 +707,10 @@ class WiFiScanner(core.Scanner):
             return self.mgr.main.stopping
 
         if self.mac not in self.protocol.loggers:
-            _rawlogger = logger.WiFiRawLogger(self.mgr, self.mac)
+            header = None
+            if self.sampler.enabled():
+                header = "# raw_sampling,%s" % self.sampler.describe()
+            _rawlogger = logger.WiFiRawLogger(self.mgr, self.mac, header)
             _logger_devraw = logger.WiFiDevRawLogger(self.mgr, self.mac)
             _logger_dev = logger.WiFiLogger(self.mgr, self.mac, 'DEV')
             _logger_acp = logger.WiFiLogger(self.mgr, self.mac, 'ACP')
@@ -458,21 +719,44 @@ class WiFiScanner(core.Scanner):
         else:
             _rawlogger, _logger_devraw, _logger_dev, _logger_acp, self._logger_freq = self.protocol.loggers[self.mac]
 
+        pools = {DEV: _logger_dev, ACP: _logger_acp}
+        aggregator = aggregation.RawAggregator(self.mgr.config.get_value(
+            'raw_aggregation_window'), emit_devraw,
+            lambda r: (r.hwid, r.frequency), 'ssi')
+        if self.expire_aggregates:
+            aggregator.start()
+
         _logger_dev.start()
         _logger_acp.start()
-        stations = {}
+
+        queue = None
+        handle = process_frame
+        if self.queue_size > 0:
+            queue = framequeue.FrameQueue(self.queue_size, self.queue_overflow)
+            worker = threading.Thread(target=self.process_queue,
+                args=(queue, process_frame))
+            worker.start()
+            handle = lambda frame, timestamp: queue.put((frame, timestamp))
+
         try:
-            scapy.all.sniff(iface=self.iface, prn=process, store=0, stop_filter=stoppercheck)
+            if self.capture_mode != 'native' or \
+                not self.capture(handle):
+                import scapy.all
+                scapy.all.sniff(iface=self.iface, prn=process, store=0,
+                    stop_filter=stoppercheck)
         except IOError:
             pass
+        finally:
+            if queue is not None:
+                queue.close()
+                worker.join()
+            aggregator.stop()
 
         self.running = False
-        try:
-            wigy.set_status(self.iface, 0)
-        except IOError:
-            pass
+        self.interface_down()
         _logger_dev.stop()
         _logger_acp.stop()
         self.mgr.log_info("Stopped scanning with WiFi adapter %s" % self.mac)
+        self.mgr.net_send_state((self.mac, 'raw_sampling'), None)
         self.mgr.net_send_line("STATE,wifi,%s,%0.3f,stopped_scanning" % (
             self.mac.replace(':',''), time.time()))
@@ -0,0 +1,108 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Module implementing the inquiry length schedule of a Bluetooth adapter.
+"""
+
+FIXED = 'fixed'
+ADAPTIVE = 'adaptive'
+
+# Try a neighbouring inquiry length once every this many inquiries.
+EXPLORE_INTERVAL = 4
+# Weight of the latest inquiry in the smoothed yield of an inquiry length.
+SMOOTHING = 0.3
+
+class InquiryScheduler(object):
+    """
+    Decides how long each inquiry lasts, in units of 1.28s. In fixed mode
+    every inquiry has the same length. In adaptive mode the length with the
+    highest yield, i.e. the smoothed number of distinct devices found per
+    second of inquiry, is used, while once every few inquiries a length one
+    unit shorter or longer is tried to follow changes in the environment.
+    """
+    def __init__(self, length, mode=FIXED, minimum=1, maximum=48):
+        """
+        Initialisation.
+
+        @param   length    The initial inquiry length, in units of 1.28s.
+        @param   mode      FIXED or ADAPTIVE.
+        @param   minimum   The minimum inquiry length in adaptive mode, in
+                             units of 1.28s.
+        @param   maximum   The maximum inquiry length in adaptive mode, in
+                             units of 1.28s.
+        """
+        self.mode = mode
+        self.minimum = max(1, min(minimum, maximum))
+        self.maximum = min(48, max(minimum, maximum))
+        if self.mode == ADAPTIVE:
+            length = max(self.minimum, min(length, self.maximum))
+        self.length = length
+        self.best = length
+
+        self.yields = {}
+        self.inquiries = 0
+        self.explore_up = True
+
+    def schedule(self):
+        """
+        Plan the next inquiry.
+
+        @return   The length of the next inquiry, in units of 1.28s.
+        """
+        if self.mode != ADAPTIVE:
+            return self.length
+
+        self.inquiries += 1
+        self.length = self.best
+        if self.inquiries % EXPLORE_INTERVAL == 0:
+            step = 1 if self.explore_up else -1
+            self.explore_up = not self.explore_up
+            if not self.minimum <= self.best + step <= self.maximum:
+                step = -step
+            if self.minimum <= self.best + step <= self.maximum:
+                self.length = self.best + step
+        return self.length
+
+    def finish(self, length, devices, elapsed):
+        """
+        Update the yield of the given inquiry length with the outcome of an
+        inquiry.
+
+        @param   length    The length of the inquiry, in units of 1.28s.
+        @param   devices   The number of distinct devices found.
+        @param   elapsed   The time the inquiry took, in seconds.
+        """
+        if self.mode != ADAPTIVE or elapsed <= 0:
+            return
+
+        rate = devices / elapsed
+        if length in self.yields:
+            self.yields[length] = SMOOTHING * rate + \
+                (1 - SMOOTHING) * self.yields[length]
+        else:
+            self.yields[length] = rate
+
+        best = self.yields.get(self.best, 0)
+        for l in self.yields:
+            if self.yields[l] > best:
+                self.best = l
+                best = self.yields[l]
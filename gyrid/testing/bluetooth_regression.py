@@ -0,0 +1,198 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Regression check for the Bluetooth replay, replaying a small known HCI trace
+and comparing the resulting logs with the lines expected for it.
+
+Usage: python -m gyrid.testing.bluetooth_regression
+
+The trace is written as a btsnoop file of both the H4 and the unencapsulated
+HCI datalink type, and as an hcidump file. Each is replayed with
+bluetooth_replay in a child process, in UTC.
+"""
+
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+
+from gyrid import hci
+from gyrid.testing import btsnoop, hci_benchmark
+
+START = 1500000000.0
+
+# Configuration of the replay, logging the addresses without hashing them.
+CONFIGURATION = """[Gyrid]
+enable_hashing = False
+time_format = %Y%m%d-%H%M%S-%Z
+"""
+
+ADDRESSES = ['\x01\x00\x00\x00\x00\x0a', '\x02\x00\x00\x00\x00\x0a',
+    '\x03\x00\x00\x00\x00\x0a', '\x04\x00\x00\x00\x00\x0a',
+    '\x05\x00\x00\x00\x00\x0a']
+
+def inquiry(length):
+    """
+    Build an inquiry command packet, with the general inquiry access code.
+    """
+    return struct.pack('<BHB3sBB', btsnoop.HCI_COMMAND_PKT,
+        hci.OPCODE_INQUIRY, 5, '\x33\x8b\x9e', length, 0)
+
+def inquiry_result(address, devclass):
+    """
+    Build an inquiry result event containing a single response.
+    """
+    return hci_benchmark.event(hci.EVT_INQUIRY_RESULT, struct.pack(
+        '<B6sBBB3sH', 1, address, 1, 0, 0, struct.pack('<I', devclass)[:3],
+        0x1234))
+
+# The trace: tuples of the time relative to START, whether the packet was
+# received from the controller and the packet, starting with its type.
+TRACE = [
+    (0.0, False, inquiry(8)),
+    (0.1, True, hci_benchmark.inquiry_result_with_rssi([(ADDRESSES[0],
+        0x5a020c, -60)])),
+    (0.2, True, hci_benchmark.inquiry_result_with_rssi([(ADDRESSES[1],
+        0x7a020c, -70), (ADDRESSES[2], 0x240404, -80)])),
+    (0.3, True, hci_benchmark.extended_inquiry_result(ADDRESSES[3], 0x1f00,
+        -50, 'Gyrid', 4)),
+    (0.4, True, inquiry_result(ADDRESSES[4], 0x5a020c)),
+    (10.24, True, hci_benchmark.event(hci.EVT_INQUIRY_COMPLETE, '\0')),
+    (10.3, False, inquiry(8)),
+    (10.4, True, hci_benchmark.inquiry_result_with_rssi([(ADDRESSES[0],
+        0x5a020c, -65)])),
+    (20.54, True, hci_benchmark.event(hci.EVT_INQUIRY_COMPLETE, '\0')),
+]
+
+# The expected lines of each log.
+EXPECTED = {
+    'scan.log': [
+        '20170714-024000-UTC,0A0000000001,5898764,in',
+        '20170714-024000-UTC,0A0000000002,7995916,in',
+        '20170714-024000-UTC,0A0000000003,2360324,in',
+        '20170714-024000-UTC,0A0000000004,7936,in',
+        '20170714-024000-UTC,0A0000000005,5898764,in'],
+    'rssi.log': [
+        '20170714-024000-UTC,0A0000000001,5898764,,-60',
+        '20170714-024000-UTC,0A0000000002,7995916,,-70',
+        '20170714-024000-UTC,0A0000000003,2360324,,-80',
+        '20170714-024000-UTC,0A0000000004,7936,4,-50',
+        '20170714-024010-UTC,0A0000000001,5898764,,-65'],
+    'inquiry.log': [
+        '20170714-024010-UTC,10.24,5',
+        '20170714-024020-UTC,10.24,1'],
+}
+
+def write_btsnoop(filename, datalink):
+    """
+    Write the trace as a btsnoop file of the given datalink type.
+    """
+    f = open(filename, 'wb')
+    f.write(btsnoop.BTSNOOP_HEADER.pack(btsnoop.BTSNOOP_MAGIC, 1, datalink))
+    for offset, received, pkt in TRACE:
+        flags = btsnoop.FLAG_COMMAND_EVENT
+        if received:
+            flags |= btsnoop.FLAG_RECEIVED
+        if datalink == btsnoop.DATALINK_HCI:
+            pkt = pkt[1:]
+        f.write(btsnoop.BTSNOOP_RECORD.pack(len(pkt), len(pkt), flags, 0,
+            int(round((START + offset) * 1e6)) + btsnoop.BTSNOOP_EPOCH) + pkt)
+    f.close()
+
+def write_hcidump(filename):
+    """
+    Write the trace as a file like hcidump -w writes.
+    """
+    f = open(filename, 'wb')
+    for offset, received, pkt in TRACE:
+        timestamp = START + offset
+        f.write(btsnoop.HCIDUMP_HEADER.pack(len(pkt), int(received),
+            int(timestamp), int(round((timestamp % 1) * 1e6))) + pkt)
+    f.close()
+
+def replay(filename, output, config):
+    """
+    Replay the given capture file with bluetooth_replay.
+
+    @return   Dictionary of the lines of each log, by file name.
+    """
+    env = dict(os.environ)
+    env['TZ'] = 'UTC'
+    # The output, including warnings about the options missing from the
+    # configuration, is only shown when the replay fails.
+    process = subprocess.Popen([sys.executable, '-m',
+        'gyrid.testing.bluetooth_replay', '-o', output, '-c', config,
+        filename], env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    out = process.communicate()[0]
+    if process.returncode != 0:
+        sys.stdout.write(out)
+        raise RuntimeError("Replay of %s failed" % filename)
+    logs = {}
+    location = os.path.join(output, '000000000000')
+    for name in sorted(EXPECTED):
+        path = os.path.join(location, name)
+        logs[name] = []
+        if os.path.isfile(path):
+            logs[name] = open(path).read().splitlines()
+    return logs
+
+def check(name, filename, output, config):
+    """
+    Replay the given capture file and compare the logs with the expected
+    lines.
+
+    @return   True when all logs match, False otherwise.
+    """
+    logs = replay(filename, output, config)
+    ok = True
+    for log in sorted(EXPECTED):
+        if logs[log] != EXPECTED[log]:
+            ok = False
+            sys.stdout.write("FAIL %s, %s\n  expected %r\n  logged   %r\n" % (
+                name, log, EXPECTED[log], logs[log]))
+    if ok:
+        sys.stdout.write("ok   %s\n" % name)
+    return ok
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp(prefix='gyrid-regression-')
+    try:
+        captures = [('btsnoop H4', 'h4.btsnoop'),
+            ('btsnoop HCI', 'hci.btsnoop'), ('hcidump', 'trace.hcidump')]
+        write_btsnoop(os.path.join(directory, 'h4.btsnoop'),
+            btsnoop.DATALINK_H4)
+        write_btsnoop(os.path.join(directory, 'hci.btsnoop'),
+            btsnoop.DATALINK_HCI)
+        write_hcidump(os.path.join(directory, 'trace.hcidump'))
+        config = os.path.join(directory, 'gyrid.conf')
+        f = open(config, 'w')
+        f.write(CONFIGURATION)
+        f.close()
+        ok = True
+        for name, filename in captures:
+            ok = check(name, os.path.join(directory, filename),
+                os.path.join(directory, 'output-' + filename), config) and ok
+    finally:
+        shutil.rmtree(directory)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,251 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Replay HCI traces from btsnoop, hcidump or pcap files through the Bluetooth
+event decoding and logging, without a Bluetooth adapter, BlueZ or DBus. Used
+for benchmarking and regression testing.
+
+Inquiries are started by the inquiry and periodic inquiry mode commands in
+the trace, the events received from the controller are passed to the
+Discoverer. When replaying as
+fast as possible, the original timestamps are used so the resulting scan,
+rssi and inquiry logs can be diffed between runs. As these timestamps don't
+follow the clock, the pool is then not checked for disappeared devices.
+
+Usage: python -m gyrid.testing.bluetooth_replay [options] file [file ...]
+"""
+
+import optparse
+import os
+import struct
+import sys
+import time
+
+from gyrid import discoverer, hci, logger
+from gyrid.testing import btsnoop
+from gyrid.testing.wifi_replay import ReplayMain, ReplayScanManager
+
+COMMAND_HEADER = struct.Struct('<BHB')
+INQUIRY_LENGTH = 4
+PERIODIC_INQUIRY_LENGTH = 8
+
+class ReplaySocket(object):
+    """
+    Stand-in for the HCI socket, ignoring socket filters.
+    """
+    def setsockopt(self, level, option, value):
+        pass
+
+class ReplayScanLogger(logger.ScanLogger):
+    """
+    Scan logger that doesn't check for disappeared devices.
+    """
+    def start(self):
+        self.pool.clear()
+        self.pending.clear()
+
+    def stop(self):
+        pass
+
+class ReplayDiscoverer(discoverer.Discoverer):
+    """
+    Discoverer reading the HCI events from capture files. The time spent
+    reading and handling the events is measured.
+    """
+    def __init__(self, mgr, logger, logger_rssi, logger_inquiry, filenames,
+            speed=0, mac='00:00:00:00:00:00'):
+        """
+        Initialisation.
+
+        @param   mgr              Reference to ScanManager instance.
+        @param   logger           Reference to a ScanLogger instance.
+        @param   logger_rssi      Reference to a RSSILogger instance.
+        @param   logger_inquiry   Reference to an InquiryLogger instance.
+        @param   filenames        List of capture files to replay, in order.
+        @param   speed            Replay speed relative to real time, 0 to
+                                    replay as fast as possible.
+        @param   mac              The MAC-address to log the detections for.
+        """
+        discoverer.Discoverer.__init__(self, mgr, logger, logger_rssi,
+            logger_inquiry, -1, mac)
+        self.filenames = filenames
+        self.speed = speed
+        self.events = 0
+        self.inquiries = 0
+        self.times = {'read': 0.0, 'handle': 0.0}
+
+    def init(self):
+        """
+        Initialise the replay.
+
+        @return  0 on success.
+        """
+        self.sock = ReplaySocket()
+        self.cnt_responses = 0
+        if self.speed > 0:
+            self.raw_aggregator.start()
+        return 0
+
+    def replay_inquiry(self, timestamp, pkt):
+        """
+        Start an inquiry for the inquiry command in the trace.
+
+        @param   timestamp   The time the command was sent.
+        @param   pkt         The command packet.
+        """
+        self.inquiry_length = ord(pkt[COMMAND_HEADER.size +
+            INQUIRY_LENGTH - 1])
+        self.cnt_responses = 0
+        self.inquiry_devices.clear()
+        self.inquiry_start = timestamp
+        self.inquiries += 1
+        self.logger_inquiry.new_inquiry(timestamp, self.inquiry_length*1.28)
+
+    def replay_periodic_inquiry(self, pkt):
+        """
+        Enter periodic inquiry mode for the periodic inquiry mode command in
+        the trace.
+
+        @param   pkt         The command packet.
+        """
+        self.periodic_length = ord(pkt[COMMAND_HEADER.size +
+            PERIODIC_INQUIRY_LENGTH - 1])
+        self.periodic_active = True
+        self.cnt_responses = 0
+
+    def _periodic_inquiry_done(self, timestamp):
+        self.inquiries += 1
+        discoverer.Discoverer._periodic_inquiry_done(self, timestamp)
+
+    def replay_command(self, timestamp, pkt):
+        """
+        Handle the inquiry related commands in the trace.
+
+        @param   timestamp   The time the command was sent.
+        @param   pkt         The command packet.
+        """
+        ptype, opcode, length = COMMAND_HEADER.unpack_from(pkt)
+        if opcode == hci.OPCODE_INQUIRY and length >= INQUIRY_LENGTH:
+            self.replay_inquiry(timestamp, pkt)
+        elif opcode == hci.OPCODE_PERIODIC_INQUIRY and \
+            length >= PERIODIC_INQUIRY_LENGTH:
+            self.replay_periodic_inquiry(pkt)
+        elif opcode == hci.OPCODE_EXIT_PERIODIC_INQUIRY:
+            self.periodic_active = False
+
+    def find(self):
+        """
+        Replay the HCI packets of all capture files, pacing them according
+        to the replay speed.
+
+        @return   The cause of the end of the replay.
+        """
+        clock = time.time
+        times = self.times
+        first = None
+        end = "Replay done"
+        for filename in self.filenames:
+            packets = btsnoop.read(filename)
+            while True:
+                if self.mgr.main.stopping:
+                    end = "Shutting down"
+                    break
+                t0 = clock()
+                try:
+                    timestamp, received, pkt = packets.next()
+                except StopIteration:
+                    break
+                t1 = clock()
+                times['read'] += t1 - t0
+
+                ptype = ord(pkt[0])
+                if self.speed > 0:
+                    if first is None:
+                        first = timestamp
+                        started = t1
+                    timestamp = started + (timestamp - first) / self.speed
+                    delay = timestamp - clock()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                t2 = clock()
+                if not received and ptype == btsnoop.HCI_COMMAND_PKT and \
+                    len(pkt) >= COMMAND_HEADER.size:
+                    self.replay_command(timestamp, pkt)
+                elif received and ptype == hci.HCI_EVENT_PKT:
+                    self.handle_event(pkt, timestamp)
+                    self.events += 1
+                times['handle'] += clock() - t2
+
+        self.flush()
+        return " (%s)" % end
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] file [file ...]")
+    parser.add_option('-o', '--output', default='/tmp/gyrid-replay',
+        help="directory to write the logs to [default: %default]")
+    parser.add_option('-c', '--config', help="configuration file to use " +
+        "[default: gyrid.conf in the output directory]")
+    parser.add_option('-s', '--speed', type='float', default=0,
+        help="replay speed relative to real time, 0 for as fast as " + \
+            "possible [default: %default]")
+    parser.add_option('-m', '--mac', default='00:00:00:00:00:00',
+        help="MAC-address of the replaying adapter [default: %default]")
+    options, args = parser.parse_args()
+    if not args:
+        parser.error("no capture files given")
+
+    mgr = ReplayScanManager(ReplayMain(options.config or os.path.join(
+        options.output, 'gyrid.conf')), options.output)
+    mgr.init()
+    if options.speed > 0:
+        scan_logger = logger.ScanLogger(mgr, options.mac)
+        # Don't let the pool checker keep us from exiting.
+        scan_logger.poolchecker.daemon = True
+    else:
+        scan_logger = ReplayScanLogger(mgr, options.mac)
+    d = ReplayDiscoverer(mgr, scan_logger, logger.RSSILogger(mgr,
+        options.mac), logger.InquiryLogger(mgr, options.mac), args,
+        options.speed, options.mac)
+
+    d.init()
+    scan_logger.start()
+    started = time.time()
+    end = d.find()
+    duration = time.time() - started
+    scan_logger.stop()
+
+    events = d.events or 1
+    sys.stdout.write("%i events, %i inquiries in %0.3f s: %0.0f events/s%s\n"
+        % (d.events, d.inquiries, duration, d.events / duration, end))
+    for stage in ('read', 'handle'):
+        sys.stdout.write("%-8s %8.3f s %8.2f us/event\n" % (stage,
+            d.times[stage], d.times[stage] * 1e6 / events))
+    for path in (mgr.get_scan_log_location(options.mac),
+            mgr.get_rssi_log_location(options.mac),
+            mgr.get_inquiry_log_location(options.mac)):
+        lines = 0
+        if os.path.isfile(path):
+            lines = sum(1 for line in open(path))
+        sys.stdout.write("%s: %i lines\n" % (path, lines))
+
+if __name__ == '__main__':
+    main()
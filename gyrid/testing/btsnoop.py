@@ -0,0 +1,143 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module reading HCI packets from btsnoop, hcidump and pcap capture files, as
+written by e.g. btmon, Android's HCI snoop log, hcidump -w and Wireshark.
+"""
+
+import struct
+
+from gyrid.testing import pcap
+
+BTSNOOP_MAGIC = 'btsnoop\0'
+BTSNOOP_HEADER = struct.Struct('>8sII')
+BTSNOOP_RECORD = struct.Struct('>IIIIq')
+# Microseconds between 0000-01-01 AD and the UNIX epoch.
+BTSNOOP_EPOCH = 0x00dcddb30f2f8000
+
+# Datalink types: unencapsulated HCI (H1), and HCI UART (H4) as used by
+# Android's btsnoop_hci.log, which includes the HCI packet type.
+DATALINK_HCI = 1001
+DATALINK_H4 = 1002
+
+FLAG_RECEIVED = 0x01
+FLAG_COMMAND_EVENT = 0x02
+
+HCIDUMP_HEADER = struct.Struct('<HBxII')
+
+LINKTYPE_BLUETOOTH_HCI_H4 = 187
+LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR = 201
+PHDR_DIRECTION = struct.Struct('>I')
+
+HCI_COMMAND_PKT = 0x01
+HCI_ACLDATA_PKT = 0x02
+HCI_EVENT_PKT = 0x04
+
+def read(filename):
+    """
+    Read the HCI packets from the given capture file.
+
+    @param   filename   The path of the capture file.
+    @return             Generator yielding (timestamp, received, data)
+                          tuples. The data starts with the HCI packet type,
+                          like packets received from an HCI socket. Received
+                          is True for packets sent by the controller.
+    """
+    f = open(filename, 'rb')
+    try:
+        magic = f.read(BTSNOOP_HEADER.size)
+    finally:
+        f.close()
+
+    if magic.startswith(BTSNOOP_MAGIC):
+        packets = _read_btsnoop(filename)
+    elif len(magic) >= 4 and (struct.unpack('<I', magic[:4])[0] in (
+            pcap.PCAP_MAGIC, pcap.PCAP_MAGIC_NS, pcap.PCAPNG_SHB) or
+            struct.unpack('>I', magic[:4])[0] in (pcap.PCAP_MAGIC,
+            pcap.PCAP_MAGIC_NS)):
+        packets = _read_pcap(filename)
+    else:
+        packets = _read_hcidump(filename)
+    for packet in packets:
+        yield packet
+
+def _read_btsnoop(filename):
+    """
+    Read the packets from a btsnoop file.
+    """
+    f = open(filename, 'rb')
+    try:
+        magic, version, datalink = BTSNOOP_HEADER.unpack(f.read(
+            BTSNOOP_HEADER.size))
+        if datalink not in (DATALINK_H4, DATALINK_HCI):
+            raise ValueError("Unsupported btsnoop datalink type %i" % datalink)
+        while True:
+            header = f.read(BTSNOOP_RECORD.size)
+            if len(header) < BTSNOOP_RECORD.size:
+                return
+            length, included, flags, drops, ts = BTSNOOP_RECORD.unpack(header)
+            data = f.read(included)
+            if len(data) < included:
+                return
+            received = flags & FLAG_RECEIVED == FLAG_RECEIVED
+            if datalink == DATALINK_HCI:
+                if not flags & FLAG_COMMAND_EVENT:
+                    ptype = HCI_ACLDATA_PKT
+                elif received:
+                    ptype = HCI_EVENT_PKT
+                else:
+                    ptype = HCI_COMMAND_PKT
+                data = chr(ptype) + data
+            yield (ts - BTSNOOP_EPOCH) / 1e6, received, data
+    finally:
+        f.close()
+
+def _read_hcidump(filename):
+    """
+    Read the packets from a file written by hcidump -w.
+    """
+    f = open(filename, 'rb')
+    try:
+        while True:
+            header = f.read(HCIDUMP_HEADER.size)
+            if len(header) < HCIDUMP_HEADER.size:
+                return
+            length, received, sec, usec = HCIDUMP_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield sec + usec / 1e6, received != 0, data
+    finally:
+        f.close()
+
+def _read_pcap(filename):
+    """
+    Read the HCI packets from a pcap or pcapng file.
+    """
+    for ts, linktype, data in pcap.read(filename):
+        if linktype == LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR:
+            received = PHDR_DIRECTION.unpack_from(data)[0] == 1
+            data = data[PHDR_DIRECTION.size:]
+        elif linktype == LINKTYPE_BLUETOOTH_HCI_H4:
+            received = ord(data[0]) == HCI_EVENT_PKT
+        else:
+            continue
+        yield ts, received, data
@@ -32,9 +32,10 @@ class Discoverer(gyrid.discoverer.Discoverer):
 
     The logfile should be an existing file, residing in /var/tmp/rssi.log
 
-    Used for stresstesting.
+    Used for stresstesting. See bluetooth_replay to replay HCI traces.
     """
-    def __init__(self, mgr, logger, logger_rssi, device_id, mac):
+    def __init__(self, mgr, logger, logger_rssi, logger_inquiry, device_id,
+            mac):
         """
         Initialisation of the Discoverer. Store the reference to the loggers and
         query the necessary configuration options.
@@ -43,11 +44,13 @@ class Discoverer(gyrid.discoverer.Discoverer):
         @param  logger       Reference to a Logger instance.
         @param  logger_rssi  Reference to a logger instance which records
                                the RSSI values.
+        @param  logger_inquiry  Reference to a logger instance which records
+                                  the inquiry status.
         @param  device_id    The ID of the Bluetooth device used for scanning.
         @param  mac          The MAC address of the Bluetooth scanning device.
         """
         gyrid.discoverer.Discoverer.__init__(self, mgr, logger, logger_rssi,
-            device_id, mac)
+            logger_inquiry, device_id, mac)
 
     def init(self):
         """
@@ -77,7 +80,8 @@ class Discoverer(gyrid.discoverer.Discoverer):
                 macprevious = macline
                 rssiprevious = rssiline
             else:
-                self.device_discovered(macprevious, 0, rssiprevious)
+                self.device_discovered(time.time(), macprevious, 0, None,
+                    rssiprevious)
                 time.sleep((tline - tprevious) * 1.0)
 
             linecount += 1
@@ -0,0 +1,226 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark comparing the number of HCI inquiry events per second that can be
+decoded by the event decoder table and by the former inline decoding of the
+Discoverer, and the cost of decoding all extended inquiry response fields.
+
+The former decoding read inquiry results containing several responses with
+an interleaved layout, so these events are left out of the comparison with
+it. The eir benchmark decodes all events.
+
+Usage: python -m gyrid.testing.hci_benchmark [number of events | capture file]
+
+A btsnoop, hcidump or pcap capture file can be given to benchmark the events
+received in it instead of generated events.
+"""
+
+import os
+import random
+import struct
+import sys
+import time
+
+from gyrid import hci
+from gyrid.testing import btsnoop
+
+try:
+    import bluetooth._bluetooth as bluez
+    ba2str = bluez.ba2str
+except ImportError:
+    def ba2str(addr):
+        return hci.ADDRESS_FORMAT % struct.unpack('6B', addr)[::-1]
+
+def random_address():
+    """
+    Generate a random Bluetooth device address.
+    """
+    return ''.join(chr(random.randint(0, 255)) for i in range(6))
+
+def event(code, params):
+    """
+    Build an HCI event packet as received from the HCI socket.
+    """
+    return struct.pack('<BBB', hci.HCI_EVENT_PKT, code, len(params)) + params
+
+def inquiry_result_with_rssi(responses):
+    """
+    Build an inquiry result with RSSI event containing the given responses,
+    as consecutive records.
+
+    @param   responses   List of (address, device class, RSSI) tuples.
+    """
+    return event(hci.EVT_INQUIRY_RESULT_WITH_RSSI, struct.pack('<B',
+        len(responses)) + ''.join(struct.pack('<6sBB3sHb', r[0], 1, 0,
+        struct.pack('<I', r[1])[:3], 0x1234, r[2]) for r in responses))
+
+def extended_inquiry_result(address, devclass, rssi, name, tx_power):
+    """
+    Build an extended inquiry result event, with EIR data containing flags,
+    a complete name, a 16 bit UUID list and the TX power level.
+    """
+    eir = struct.pack('<BBB', 2, 0x01, 0x1a) + \
+        struct.pack('<BB', len(name) + 1, 0x09) + name + \
+        struct.pack('<BBHH', 5, 0x03, 0x110a, 0x111f) + \
+        struct.pack('<BBb', 2, 0x0a, tx_power)
+    eir = eir + '\0' * (240 - len(eir))
+    return event(hci.EVT_EXTENDED_INQUIRY_RESULT, struct.pack(
+        '<B6sBB3sHb', 1, address, 1, 0, struct.pack('<I', devclass)[:3],
+        0x1234, rssi) + eir)
+
+def generate(count):
+    """
+    Generate a stream of inquiries, each started by a command status event,
+    followed by inquiry results and an inquiry complete event. Some inquiry
+    results with RSSI contain multiple responses.
+
+    @param   count   The number of events to generate.
+    @return          List of raw events.
+    """
+    devices = [(random_address(), random.choice([0x5a020c, 0x7a020c,
+        0x240404, 0x1f00])) for i in range(200)]
+    events = []
+    while len(events) < count:
+        events.append(event(hci.EVT_CMD_STATUS, struct.pack('<BBH', 0, 1,
+            0x0401)))
+        for i in range(random.randint(10, 40)):
+            address, devclass = random.choice(devices)
+            rssi = random.randint(-95, -40)
+            r = random.random()
+            if r < 0.4:
+                events.append(inquiry_result_with_rssi([(address, devclass,
+                    rssi)]))
+            elif r < 0.5:
+                events.append(inquiry_result_with_rssi([random.choice(
+                    devices) + (random.randint(-95, -40),) for j in range(
+                    random.randint(2, 4))]))
+            else:
+                events.append(extended_inquiry_result(address, devclass,
+                    rssi, 'Gyrid %i' % devclass, random.randint(-10, 10)))
+        events.append(event(hci.EVT_INQUIRY_COMPLETE, '\0'))
+    return events[:count]
+
+def legacy_decode(pkt, eir_datatypes):
+    """
+    Decode the event the way Discoverer did before the event decoder table
+    was introduced. Inquiry results with more than one response are decoded
+    incorrectly, see batched.
+    """
+    ptype, event, plen = struct.unpack("BBB", pkt[:3])
+    if event == hci.EVT_INQUIRY_RESULT_WITH_RSSI:
+        pkt = pkt[3:]
+        nrsp = struct.unpack("B", pkt[0])[0]
+        result = []
+        for i in range(nrsp):
+            addr = ba2str(pkt[1+6*i:1+6*i+6])
+            rssi = struct.unpack("b", pkt[1+13*nrsp+i])[0]
+            devclass_raw = pkt[1+8*nrsp+3*i:1+8*nrsp+3*i+3]
+            devclass = struct.unpack ("I", "%s\0" % devclass_raw)[0]
+            result.append((addr, devclass, None, rssi))
+        return event, result
+    elif event == 0x2f:
+        pkt = pkt[3:]
+        addr = ba2str(pkt[1:1+6])
+        rssi = struct.unpack("b", pkt[14])[0]
+        devclass_raw = pkt[9:9+3]
+        devclass = struct.unpack ("I", "%s\0" % devclass_raw)[0]
+        eir_data = {}
+
+        eir = pkt[15:]
+        eir_idx = 0
+        while eir_idx < len(eir):
+            l = struct.unpack("B", eir[eir_idx])[0]
+            eir_idx += 1
+            if l > 0:
+                data_type = struct.unpack("B", eir[eir_idx])[0]
+                eir_idx += 1
+                if data_type in eir_datatypes:
+                    dt = eir_datatypes[data_type]
+                    eir_data[dt[0]] = dt[2](struct.unpack("%i%s" % ((l-1),
+                        dt[1]), eir[eir_idx:eir_idx+l-1]))
+                eir_idx += (l-1)
+        return event, [(addr, devclass, eir_data.get('tx_power_level', None),
+            rssi)]
+    elif event == hci.EVT_CMD_STATUS:
+        return event, struct.unpack("BBH", pkt[3:7])
+    return event, None
+
+def batched(pkt):
+    """
+    Check whether the given event is an inquiry result containing more than
+    one response.
+    """
+    return ord(pkt[1]) in (hci.EVT_INQUIRY_RESULT,
+        hci.EVT_INQUIRY_RESULT_WITH_RSSI) and ord(pkt[3]) > 1
+
+def bench_legacy(events):
+    """
+    Decode all events with the former inline decoding.
+    """
+    eir_datatypes = {
+        0x0a: ('tx_power_level', 'b', lambda x: x.__getitem__(0))
+    }
+    for pkt in events:
+        legacy_decode(pkt, eir_datatypes)
+
+def bench_table(events):
+    """
+    Decode all events with the event decoder table.
+    """
+    for pkt in events:
+        hci.decode(pkt)
+
+def bench_eir(events):
+    """
+    Decode all events with the event decoder table and decode every field of
+    the extended inquiry responses.
+    """
+    for pkt in events:
+        event, data = hci.decode(pkt)
+        if event == hci.EVT_EXTENDED_INQUIRY_RESULT:
+            eir = data[0][4]
+            for name in eir.names():
+                eir.get(name)
+
+def run(name, fn, events):
+    """
+    Time the given benchmark function and print the number of events/s.
+    """
+    start = time.time()
+    fn(events)
+    duration = time.time() - start
+    sys.stdout.write("%-8s %8i events in %6.3f s: %10.0f events/s\n" % (
+        name, len(events), duration, len(events) / duration))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and os.path.isfile(sys.argv[1]):
+        events = [data for (ts, received, data) in btsnoop.read(sys.argv[1])
+            if received and ord(data[0]) == hci.HCI_EVENT_PKT]
+    else:
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+        events = generate(count)
+
+    single = [pkt for pkt in events if not batched(pkt)]
+    sys.stdout.write("%i of %i events contain a single response or none\n" % (
+        len(single), len(events)))
+    run('legacy', bench_legacy, single)
+    run('table', bench_table, single)
+    run('eir', bench_eir, events)
@@ -0,0 +1,198 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Regression check for the decoding of inquiry result events, decoding a set of
+synthetic events and comparing the result with the responses expected for
+each of them. Each event is also passed to a Discoverer, which should update
+the pool once per event with all devices in it.
+
+Responses are consecutive records, like the Linux kernel reads them. Inquiry
+results with RSSI are checked with 1 to 4 responses, with records including
+the page scan mode and with a truncated record.
+
+Usage: python -m gyrid.testing.hci_regression
+"""
+
+import struct
+import sys
+
+from gyrid import discoverer, hci
+from gyrid.testing import hci_benchmark
+
+ADDRESSES = ['\x01\x00\x00\x00\x00\x0a', '\x02\x00\x00\x00\x00\x0a',
+    '\x03\x00\x00\x00\x00\x0a', '\x04\x00\x00\x00\x00\x0a']
+CLASSES = [0x5a020c, 0x7a020c, 0x240404, 0x1f00]
+RSSIS = [-40, -60, -80, -100]
+
+def with_rssi(count):
+    """
+    Build the parameters of an inquiry result with RSSI event containing the
+    given number of responses.
+    """
+    return struct.pack('<B', count) + ''.join(struct.pack('<6sBB3sHb',
+        ADDRESSES[i], 1, 0, struct.pack('<I', CLASSES[i])[:3], 0x1234,
+        RSSIS[i]) for i in range(count))
+
+def with_rssi_pscan(count):
+    """
+    Build the parameters of an inquiry result with RSSI event containing the
+    given number of responses, including the page scan mode like some
+    controllers do.
+    """
+    return struct.pack('<B', count) + ''.join(struct.pack('<6sBBB3sHb',
+        ADDRESSES[i], 1, 0, 0, struct.pack('<I', CLASSES[i])[:3], 0x1234,
+        RSSIS[i]) for i in range(count))
+
+def without_rssi(count):
+    """
+    Build the parameters of an inquiry result event containing the given
+    number of responses.
+    """
+    return struct.pack('<B', count) + ''.join(struct.pack('<6sBBB3sH',
+        ADDRESSES[i], 1, 0, 0, struct.pack('<I', CLASSES[i])[:3], 0x1234)
+        for i in range(count))
+
+# Expected responses, as (address, device class, TX power, RSSI, EIR).
+RESPONSES = [
+    ('0A:00:00:00:00:01', 0x5a020c, None, -40, None),
+    ('0A:00:00:00:00:02', 0x7a020c, None, -60, None),
+    ('0A:00:00:00:00:03', 0x240404, None, -80, None),
+    ('0A:00:00:00:00:04', 0x1f00, None, -100, None),
+]
+
+def without(response, index):
+    """
+    Leave the value at the given index out of a response.
+    """
+    return response[:index] + (None,) + response[index + 1:]
+
+# Tuples of a description, the event code, its parameters and the expected
+# responses.
+EVENTS = [
+    ("with RSSI, 1 response", hci.EVT_INQUIRY_RESULT_WITH_RSSI,
+     with_rssi(1), RESPONSES[:1]),
+    ("with RSSI, 2 responses", hci.EVT_INQUIRY_RESULT_WITH_RSSI,
+     with_rssi(2), RESPONSES[:2]),
+    ("with RSSI, 3 responses", hci.EVT_INQUIRY_RESULT_WITH_RSSI,
+     with_rssi(3), RESPONSES[:3]),
+    ("with RSSI, 4 responses", hci.EVT_INQUIRY_RESULT_WITH_RSSI,
+     with_rssi(4), RESPONSES[:4]),
+    ("with RSSI and page scan mode, 1 response",
+     hci.EVT_INQUIRY_RESULT_WITH_RSSI, with_rssi_pscan(1), RESPONSES[:1]),
+    ("with RSSI and page scan mode, 3 responses",
+     hci.EVT_INQUIRY_RESULT_WITH_RSSI, with_rssi_pscan(3), RESPONSES[:3]),
+    ("with RSSI, 3 responses, last one truncated",
+     hci.EVT_INQUIRY_RESULT_WITH_RSSI, with_rssi(3)[:-5], RESPONSES[:2]),
+    ("without RSSI, 1 response", hci.EVT_INQUIRY_RESULT, without_rssi(1),
+     [without(r, 3) for r in RESPONSES[:1]]),
+    ("without RSSI, 3 responses", hci.EVT_INQUIRY_RESULT, without_rssi(3),
+     [without(r, 3) for r in RESPONSES[:3]]),
+]
+
+class RegressionConfig(object):
+    """
+    Stand-in for the configuration, using the default values.
+    """
+    values = {'buffer_size': 10.24, 'raw_aggregation_window': 0,
+        'bluetooth_inquiry_mode': 'fixed', 'bluetooth_min_inquiry_time': 2.56,
+        'bluetooth_max_inquiry_time': 15.36}
+
+    def get_value(self, name):
+        return self.values.get(name)
+
+class RegressionBlacklist(object):
+    """
+    Stand-in for an empty blacklist.
+    """
+    def match(self, address):
+        return False
+
+class RegressionManager(object):
+    """
+    Stand-in for the ScanManager, without hashing.
+    """
+    config = RegressionConfig()
+    blacklist = RegressionBlacklist()
+    debug_mode = False
+
+    def debug(self, message, force=False):
+        pass
+
+    def privacy_process(self, string, force=False):
+        return string
+
+class RegressionLogger(object):
+    """
+    Stand-in for the loggers, recording the pool updates and records.
+    """
+    def __init__(self):
+        self.updates = []
+        self.records = []
+
+    def update_devices(self, timestamp, devices):
+        self.updates.append((timestamp, devices))
+
+    def write(self, record):
+        self.records.append(record)
+
+def check_decode(description, code, params, expected):
+    """
+    Decode the given event and compare the responses with the expected ones.
+
+    @return   True when the event was decoded correctly, False otherwise.
+    """
+    event, responses = hci.decode(hci_benchmark.event(code, params))
+    if event == code and responses == expected:
+        return True
+    sys.stdout.write("FAIL decode %s\n  expected %r\n  decoded  %r\n" % (
+        description, expected, responses))
+    return False
+
+def check_discoverer(description, code, params, expected):
+    """
+    Pass the given event to a Discoverer and check it updates the pool once
+    with the expected devices.
+
+    @return   True when the pool was updated correctly, False otherwise.
+    """
+    pool = RegressionLogger()
+    d = discoverer.Discoverer(RegressionManager(), pool, RegressionLogger(),
+        None, -1, '00:00:00:00:00:00')
+    d.cnt_responses = 0
+    d.handle_event(hci_benchmark.event(code, params), 1500000000.0)
+    devices = [(r[0].replace(':', ''), r[1]) for r in expected]
+    if pool.updates == [(1500000000.0, devices)] and \
+        d.cnt_responses == len(expected):
+        return True
+    sys.stdout.write("FAIL discoverer %s\n  expected %r\n  updated  %r\n" % (
+        description, [(1500000000.0, devices)], pool.updates))
+    return False
+
+if __name__ == '__main__':
+    failures = 0
+    for description, code, params, expected in EVENTS:
+        if not check_decode(description, code, params, expected):
+            failures += 1
+        if not check_discoverer(description, code, params, expected):
+            failures += 1
+    sys.stdout.write("%i events, %i failures\n" % (len(EVENTS), failures))
+    sys.exit(1 if failures else 0)
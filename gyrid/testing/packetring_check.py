@@ -0,0 +1,171 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Check of the TPACKET_V3 receive ring, injecting frames on one end of a veth
+pair and reading them from a ring attached to the other end.
+
+Usage: python -m gyrid.testing.packetring_check [number of frames]
+
+Two checks are made, 500 frames each by default. First all frames should be
+read in order from a ring of the default size, without drops. Then the frames
+are injected in a ring that is too small to hold them and isn't read in the
+meantime: the frames read and the drops should add up to the frames injected.
+The statistics are compared with the frames actually read in both checks.
+
+Needs root privileges and the ip command from iproute2. Linux only.
+"""
+
+import mmap
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+from gyrid.scanners import packetring
+
+ETH_P_ALL = 0x0003
+ETH_P_TEST = 0x88b5
+
+INJECT = 'gyrtest0'
+CAPTURE = 'gyrtest1'
+
+FRAME = struct.Struct('!6s6sHI')
+FRAME_LENGTH = 128
+DESTINATION = '\x02\x00\x00\x00\x00\x01'
+SOURCE = '\x02\x00\x00\x00\x00\x02'
+
+def link(*args):
+    """
+    Run 'ip link' with the given arguments.
+    """
+    subprocess.check_call(('ip', 'link') + args)
+
+def create_pair():
+    """
+    Create the veth pair and bring it up, without IPv6 to keep the kernel
+    from sending frames of its own.
+    """
+    link('add', INJECT, 'type', 'veth', 'peer', 'name', CAPTURE)
+    for iface in (INJECT, CAPTURE):
+        path = '/proc/sys/net/ipv6/conf/%s/disable_ipv6' % iface
+        if os.path.exists(path):
+            f = open(path, 'w')
+            f.write('1')
+            f.close()
+        link('set', iface, 'up')
+
+def delete_pair():
+    """
+    Delete the veth pair.
+    """
+    link('del', INJECT)
+
+def inject(count):
+    """
+    Send the given number of test frames, numbered from 0.
+
+    @param   count   The number of frames to send.
+    """
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+    sock.bind((INJECT, 0))
+    for i in xrange(count):
+        sock.send(FRAME.pack(DESTINATION, SOURCE, ETH_P_TEST, i).ljust(
+            FRAME_LENGTH, '\0'))
+        if i % 100 == 99:
+            # Keep within the backlog of the receiving interface.
+            time.sleep(0.01)
+    sock.close()
+
+def drain(ring, timeout=1):
+    """
+    Read all frames from the ring, until no block is handed over anymore.
+
+    @param   ring      The PacketRing to read from.
+    @param   timeout   The time to wait for a block, in seconds.
+    @return            List of the sequence numbers of the test frames read.
+    """
+    numbers = []
+    while True:
+        frames = ring.read(timeout)
+        if frames == None:
+            return numbers
+        for data, timestamp in frames:
+            if len(data) != FRAME_LENGTH:
+                sys.stdout.write("  frame of %i bytes read\n" % len(data))
+                continue
+            eth_type, number = FRAME.unpack_from(data)[2:]
+            if eth_type == ETH_P_TEST:
+                numbers.append(number)
+        ring.release()
+
+def check(name, count, dropping, **ring_args):
+    """
+    Inject frames on the veth pair and read them from a ring.
+
+    @param   name        The name of the check.
+    @param   count       The number of frames to inject.
+    @param   dropping    Whether frames should be dropped.
+    @param   ring_args   Arguments for the PacketRing.
+    @return              True when the check passed, False otherwise.
+    """
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+        socket.htons(ETH_P_ALL))
+    sock.bind((CAPTURE, ETH_P_ALL))
+    ring = packetring.PacketRing(sock, **ring_args)
+    try:
+        inject(count)
+        numbers = drain(ring)
+        packets, drops, freezes, losing = ring.statistics()
+    finally:
+        ring.close()
+        sock.close()
+
+    sys.stdout.write("%-6s %i injected, %i read, statistics: %i packets, " \
+        "%i drops, %i freezes, %i losing blocks\n" % (name, count,
+        len(numbers), packets, drops, freezes, losing))
+
+    ok = True
+    if numbers != sorted(numbers) or len(set(numbers)) != len(numbers):
+        sys.stdout.write("  frames read out of order or twice\n")
+        ok = False
+    if packets != count or packets - drops != len(numbers):
+        sys.stdout.write("  statistics don't match the frames read\n")
+        ok = False
+    if (drops > 0) != dropping:
+        sys.stdout.write("  frames %s dropped\n" % ('weren\'t' if dropping
+            else 'were'))
+        ok = False
+    return ok
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    create_pair()
+    try:
+        ok = check('read', count, dropping=False)
+        ok = check('drops', count, dropping=True, block_size=mmap.PAGESIZE,
+            block_nr=2, frame_size=1024, timeout=10) and ok
+    finally:
+        delete_pair()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,160 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module reading packets from pcap and pcapng capture files.
+"""
+
+import struct
+
+LINKTYPE_IEEE802_11 = 105
+LINKTYPE_IEEE802_11_RADIOTAP = 127
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER = 0x1a2b3c4d
+
+PCAPNG_IDB = 0x00000001
+PCAPNG_PB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+
+IF_TSRESOL = 9
+
+def read(filename):
+    """
+    Read the packets from the given pcap or pcapng file.
+
+    @param   filename   The path of the capture file.
+    @return             Generator yielding (timestamp, linktype, data)
+                          tuples. The timestamp is None for pcapng simple
+                          packet blocks.
+    """
+    f = open(filename, 'rb')
+    try:
+        magic = f.read(4)
+        if len(magic) < 4:
+            return
+        if struct.unpack('<I', magic)[0] == PCAPNG_SHB:
+            packets = _read_pcapng(f, magic)
+        else:
+            packets = _read_pcap(f, magic)
+        for packet in packets:
+            yield packet
+    finally:
+        f.close()
+
+def _read_pcap(f, magic):
+    """
+    Read the packets from a classic pcap file.
+    """
+    for order in '<>':
+        value = struct.unpack(order + 'I', magic)[0]
+        if value in (PCAP_MAGIC, PCAP_MAGIC_NS):
+            break
+    else:
+        raise ValueError("Not a pcap or pcapng file")
+
+    resolution = 1e-9 if value == PCAP_MAGIC_NS else 1e-6
+    linktype = struct.unpack(order + 'HHiIII', f.read(20))[5]
+    record = struct.Struct(order + 'IIII')
+    while True:
+        header = f.read(record.size)
+        if len(header) < record.size:
+            return
+        sec, frac, caplen, length = record.unpack(header)
+        data = f.read(caplen)
+        if len(data) < caplen:
+            return
+        yield sec + frac * resolution, linktype, data
+
+def _read_pcapng(f, magic):
+    """
+    Read the packets from a pcapng file, from all its sections.
+    """
+    order = '<'
+    interfaces = []
+    block_type = PCAPNG_SHB
+    while True:
+        if block_type == PCAPNG_SHB:
+            body = f.read(8)
+            if len(body) < 8:
+                return
+            order = '<' if struct.unpack('<I', body[4:])[0] == \
+                PCAPNG_BYTE_ORDER else '>'
+            length = struct.unpack(order + 'I', body[:4])[0]
+            f.read(length - 12)
+            interfaces = []
+        else:
+            body = f.read(4)
+            if len(body) < 4:
+                return
+            length = struct.unpack(order + 'I', body)[0]
+            body = f.read(length - 8)
+            if len(body) < length - 8:
+                return
+            body = body[:-4]
+
+            if block_type == PCAPNG_IDB:
+                interfaces.append(_read_interface(body, order))
+            elif block_type == PCAPNG_EPB:
+                interface, high, low, caplen = struct.unpack_from(
+                    order + 'IIII', body)
+                linktype, resolution = interfaces[interface]
+                yield ((high << 32) | low) * resolution, linktype, \
+                    body[20:20 + caplen]
+            elif block_type == PCAPNG_PB:
+                interface, drops, high, low, caplen = struct.unpack_from(
+                    order + 'HHIII', body)
+                linktype, resolution = interfaces[interface]
+                yield ((high << 32) | low) * resolution, linktype, \
+                    body[20:20 + caplen]
+            elif block_type == PCAPNG_SPB:
+                linktype, resolution = interfaces[0]
+                length = struct.unpack_from(order + 'I', body)[0]
+                yield None, linktype, body[4:4 + length]
+
+        header = f.read(4)
+        if len(header) < 4:
+            return
+        block_type = struct.unpack(order + 'I', header)[0]
+
+def _read_interface(body, order):
+    """
+    Parse the body of an interface description block.
+
+    @return   Tuple of the linktype and the timestamp resolution.
+    """
+    linktype = struct.unpack_from(order + 'H', body)[0]
+    resolution = 1e-6
+    position = 8
+    while position + 4 <= len(body):
+        code, length = struct.unpack_from(order + 'HH', body, position)
+        if code == 0:
+            break
+        if code == IF_TSRESOL and length >= 1:
+            value = ord(body[position + 4])
+            if value & 0x80:
+                resolution = 2.0 ** -(value & 0x7f)
+            else:
+                resolution = 10.0 ** -value
+        position += 4 + ((length + 3) & ~3)
+    return linktype, resolution
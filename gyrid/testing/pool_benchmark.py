@@ -0,0 +1,212 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Stress benchmark of the device pool updates of a ScanLogger, with many
+producer threads updating the pool while another thread keeps taking the
+lock, like the pool checker does. The pending update queue is compared with
+the former temporary pool fallback, on the time spent per update and on the
+accuracy of the resulting 'in' events and pool.
+
+Usage: python -m gyrid.testing.pool_benchmark [producers] [updates] [hold]
+
+There are 8 producers by default, each making 20000 updates on its own
+devices. The lock is held for hold milliseconds at a time, default 1.
+"""
+
+import logging
+import random
+import sys
+import threading
+import time
+
+from gyrid import logger
+
+DEVICES = 2000
+
+class BenchmarkConfig(object):
+    """
+    Stand-in for the configuration, using the default values.
+    """
+    values = {'time_format': '%Y%m%d-%H%M%S%Z', 'enable_rssi_log': True,
+        'alix_led_support': False, 'buffer_size': 10.24}
+
+    def get_value(self, name):
+        return self.values.get(name)
+
+class BenchmarkManager(object):
+    """
+    Stand-in for the ScanManager.
+    """
+    config = BenchmarkConfig()
+
+    def debug(self, message, force=False):
+        pass
+
+class BenchmarkLogger(logger.ScanLogger):
+    """
+    ScanLogger keeping the events it writes in memory.
+    """
+    def __init__(self, mgr, mac):
+        logger.ScanLogger.__init__(self, mgr, mac)
+        self.events = []
+
+    def _get_log_location(self):
+        return None
+
+    def _get_logger(self):
+        return logging.getLogger('pool-benchmark')
+
+    def write(self, timestamp, hwid, device_class, moving):
+        self.events.append((timestamp, hwid, device_class, moving))
+
+class LegacyLogger(BenchmarkLogger):
+    """
+    BenchmarkLogger using the former temporary pool fallback.
+    """
+    def __init__(self, mgr, mac):
+        BenchmarkLogger.__init__(self, mgr, mac)
+        self.temp_pool = {}
+
+    def update_devices(self, timestamp, devices):
+        if not self.lock.acquire(False):
+            #Failed to lock
+            for hwid, device_class in devices:
+                self.temp_pool[hwid] = [timestamp, device_class]
+        else:
+            try:
+                if len(self.temp_pool) > 0:
+                    device_class = devices[0][1]
+                    for id in self.temp_pool:
+                        if id not in self.pool:
+                            self.write(timestamp, id, device_class, 'in')
+                    self.pool.update(self.temp_pool)
+                    self.temp_pool.clear()
+                self.switch_led(3)
+
+                for hwid, device_class in devices:
+                    if hwid not in self.pool:
+                        self.write(timestamp, hwid, device_class, 'in')
+
+                    self.pool[hwid] = [timestamp, device_class]
+            finally:
+                self.lock.release()
+
+    def process_pending(self):
+        pass
+
+def produce(scan_logger, producer, updates, expected, latencies, errors):
+    """
+    Update the pool with random detections of the devices of the producer.
+    The first and last detection of each device, the time spent per update
+    and the number of failed updates are recorded.
+    """
+    first = {}
+    last = {}
+    spent = []
+    for i in xrange(updates):
+        timestamp = 1000000000.0 + i * 0.001
+        hwid = '%02x%06x' % (producer, random.randint(0, DEVICES - 1))
+        device_class = random.randint(0, 0xffffff)
+        if hwid not in first:
+            first[hwid] = (timestamp, device_class)
+        last[hwid] = (timestamp, device_class)
+
+        start = time.time()
+        try:
+            scan_logger.update_devices(timestamp, [(hwid, device_class)])
+        except RuntimeError:
+            errors.append(hwid)
+        spent.append(time.time() - start)
+    expected.append((first, last))
+    latencies.extend(spent)
+
+def hold(scan_logger, duration, running):
+    """
+    Keep taking the lock for the given duration, like the pool checker.
+    """
+    while running:
+        scan_logger.lock.acquire()
+        try:
+            scan_logger.apply_pending()
+            time.sleep(duration)
+        finally:
+            scan_logger.lock.release()
+        scan_logger.process_pending()
+        time.sleep(duration)
+
+def run(name, cls, producers, updates, duration):
+    """
+    Run the benchmark with the given ScanLogger class and print the results.
+    """
+    scan_logger = cls(BenchmarkManager(), 'benchmark')
+    expected = []
+    latencies = []
+    errors = []
+    running = [True]
+    holder = threading.Thread(target=hold, args=(scan_logger, duration,
+        running))
+    threads = [threading.Thread(target=produce, args=(scan_logger, p,
+        updates, expected, latencies, errors)) for p in range(producers)]
+
+    start = time.time()
+    holder.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    running.pop()
+    holder.join()
+    scan_logger.process_pending()
+
+    ins = dict((hwid, (timestamp, device_class)) for (timestamp, hwid,
+        device_class, moving) in scan_logger.events if moving == 'in')
+    wrong = missing = stale = 0
+    for first, last in expected:
+        for hwid in first:
+            if hwid not in ins:
+                missing += 1
+            elif ins[hwid] != first[hwid]:
+                wrong += 1
+            if tuple(scan_logger.pool.get(hwid, ())) != last[hwid]:
+                stale += 1
+
+    total = producers * updates
+    latencies.sort()
+    sys.stdout.write("%s: %i updates in %0.3f s, %0.0f updates/s\n" % (name,
+        total, elapsed, total / elapsed))
+    sys.stdout.write("  ms/update: median %0.3f, 99%% %0.3f, max %0.3f\n" % (
+        latencies[total / 2] * 1000, latencies[total * 99 / 100] * 1000,
+        latencies[-1] * 1000))
+    sys.stdout.write("  %i failed updates, %i wrong and %i missing 'in' " % (
+        len(errors), wrong, missing) + "events, %i stale pool entries\n" % (
+        stale))
+
+if __name__ == '__main__':
+    producers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    duration = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.001
+
+    random.seed(0)
+    run('temp_pool', LegacyLogger, producers, updates, duration)
+    random.seed(0)
+    run('pending', BenchmarkLogger, producers, updates, duration)
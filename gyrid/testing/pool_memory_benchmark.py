@@ -0,0 +1,90 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Benchmark comparing the memory used by a device pool kept as a dictionary
+of [timestamp, device class] lists, as the ScanLogger used to, and by the
+array-backed DevicePool.
+
+Usage: python -m gyrid.testing.pool_memory_benchmark [number of devices ...]
+
+Each pool is built in a child process and its size is measured as the growth
+of the resident set size, excluding the device ids themselves. The device ids
+are hashed, i.e. 64 character hex strings. Linux only.
+"""
+
+import hashlib
+import os
+import random
+import resource
+import sys
+
+from gyrid import devicepool
+
+def rss():
+    """
+    Get the resident set size of this process, in bytes.
+    """
+    return int(open('/proc/self/statm').read().split()[1]) * \
+        resource.getpagesize()
+
+def build_dict(devices):
+    pool = {}
+    for i, hwid in enumerate(devices):
+        pool[hwid] = [1000000000.0 + i * 0.01, random.randint(0, 0xffffff)]
+    return pool
+
+def build_pool(devices):
+    pool = devicepool.DevicePool(True)
+    for i, hwid in enumerate(devices):
+        pool[hwid] = [1000000000.0 + i * 0.01, random.randint(0, 0xffffff)]
+    return pool
+
+def measure(build, count):
+    """
+    Build a pool of the given number of devices in a child process.
+
+    @return   The memory used by the pool, in bytes.
+    """
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        devices = [hashlib.sha256(str(i)).hexdigest() for i in xrange(count)]
+        before = rss()
+        pool = build(devices)
+        os.write(write, str(rss() - before))
+        os._exit(0)
+
+    os.close(write)
+    result = os.read(read, 64)
+    os.close(read)
+    os.waitpid(pid, 0)
+    return int(result)
+
+if __name__ == '__main__':
+    counts = [int(i) for i in sys.argv[1:]] or [10000, 100000, 1000000]
+
+    for count in counts:
+        for name, build in (('dict', build_dict), ('pool', build_pool)):
+            size = measure(build, count)
+            sys.stdout.write("%-5s %8i devices: %8.1f MiB, %6.1f bytes/device\n"
+                % (name, count, size / 1048576.0, float(size) / count))
@@ -0,0 +1,100 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Regression check for the radiotap decoder, decoding a set of radiotap headers
+and comparing the result with the values expected for each of them.
+
+The headers are laid out the way common drivers emit them, covering extended
+present bitmasks, radiotap and vendor namespaces and field alignment.
+
+Usage: python -m gyrid.testing.radiotap_regression
+"""
+
+import binascii
+import sys
+
+from gyrid.scanners import dot11
+
+# Tuples of a description, the header as hex and the expected values.
+HEADERS = [
+    ("mac80211, single antenna",
+     '00001000' '2e080000' '10026c09a000ce01',
+     {'flags': 0x10, 'rate': 2, 'channel_freq': 2412, 'channel_type': 0xa0,
+      'ant_signal_dbm': -50, 'antenna': 1}),
+
+    ("mac80211, two antennas in radiotap namespaces",
+     '00002600' '2f4000a0' '200800a0' '20080000'
+     '7856341200000000' '100c' '3c144001' 'c3' '00' '0000' 'c100' 'c001',
+     {'tsft': 0x12345678, 'flags': 0x10, 'rate': 12, 'channel_freq': 5180,
+      'channel_type': 0x140, 'ant_signal_dbm': -61, 'rx_flags': 0,
+      'antenna': 0}),
+
+    ("vendor namespace, followed by a radiotap namespace",
+     '00002100' '0e0000c0' '000000a0' '20000000'
+     '0002' '8509a000' '001374' '01' '0400' 'deadbeef' 'd8',
+     {'flags': 0, 'rate': 2, 'channel_freq': 2437, 'channel_type': 0xa0}),
+
+    ("TSFT aligned after an extended bitmask",
+     '00001900' '03000080' '00000000' '00000000' '8877665544332211' '02',
+     {'tsft': 0x1122334455667788, 'flags': 2}),
+
+    ("XChannel, MCS and A-MPDU status alignment",
+     '00002000' '20001c00' 'b5' '000000' '40010000' '6c09' '01' '14'
+     '070007' '00' '2a000000' '0000' '0000',
+     {'ant_signal_dbm': -75, 'xchannel_flags': 0x140, 'xchannel_freq': 2412,
+      'xchannel_channel': 1, 'xchannel_maxpower': 20, 'mcs_known': 7,
+      'mcs_flags': 0, 'mcs': 7, 'ampdu_reference': 42, 'ampdu_flags': 0}),
+
+    ("unknown field, ending the decoded fields",
+     '00001600' '22008000' '00' 'c4' '000000000000000000000000',
+     {'flags': 0, 'ant_signal_dbm': -60}),
+
+    ("header length shorter than its fields",
+     '00000c00' '2e080000' '10026c09a000ce01',
+     {}),
+]
+
+def check(radiotap):
+    """
+    Decode all headers with the given decoder, twice to use cached layouts.
+
+    @param   radiotap   The RadiotapDecoder to use.
+    @return             The number of headers that were decoded incorrectly.
+    """
+    failures = 0
+    for description, header, expected in HEADERS * 2:
+        data = binascii.unhexlify(header)
+        version, length, present = dot11.RADIOTAP_HEADER.unpack_from(data)
+        values = radiotap.decode(data, present, length)
+        if values != expected:
+            failures += 1
+            sys.stdout.write("FAIL %s\n  expected %r\n  decoded  %r\n" % (
+                description, sorted(expected.items()),
+                sorted(values.items())))
+    return failures
+
+if __name__ == '__main__':
+    failures = check(dot11.RadiotapDecoder())
+    failures += check(dot11.RadiotapDecoder(size=1))
+    sys.stdout.write("%i headers, %i failures\n" % (len(HEADERS) * 4,
+        failures))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,125 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark comparing the number of WiFi frames per second that can be decoded
+natively and through scapy.
+
+Usage: python -m gyrid.testing.wifi_benchmark [number of frames]
+"""
+
+import random
+import struct
+import sys
+import time
+
+from gyrid.scanners import dot11
+
+def random_mac():
+    """
+    Generate a random unicast, globally unique MAC address.
+    """
+    return chr(random.randint(0, 63) << 2) + ''.join(chr(random.randint(0,
+        255)) for i in range(5))
+
+def radiotap(frequency, ssi):
+    """
+    Build a radiotap header containing flags, rate, channel, antenna signal
+    and antenna, like most mac80211 drivers produce.
+    """
+    present = 2**1 | 2**2 | 2**3 | 2**5 | 2**11
+    return struct.pack('<BxHIBBHHbB', 0, 16, present, 0x10, 2, frequency,
+        0x00a0, ssi, 1)
+
+def frame(type, subtype, flags, addr1, addr2, body=''):
+    """
+    Build an 802.11 frame with a radiotap header and a dummy FCS.
+    """
+    fc = (subtype << 4) | (type << 2)
+    return radiotap(random.choice([2412, 2437, 2462]), random.randint(-95,
+        -30)) + struct.pack('<BBH6s6s6sH', fc, flags, 0, addr1, addr2,
+        addr2, 0) + body + '\0\0\0\0'
+
+def generate(count):
+    """
+    Generate a mix of beacons, probe requests and data frames.
+
+    @param   count   The number of frames to generate.
+    @return          List of raw frames.
+    """
+    aps = [random_mac() for i in range(20)]
+    devices = [random_mac() for i in range(200)]
+    bcast = '\xff' * 6
+
+    frames = []
+    for i in range(count):
+        r = random.random()
+        if r < 0.2:
+            frames.append(frame(0, 8, 0, bcast, random.choice(aps),
+                struct.pack('<QHH', 0, 100, 0x0001) + '\x00\x04gyrid'))
+        elif r < 0.3:
+            frames.append(frame(0, 4, 0, bcast, random.choice(devices),
+                '\x00\x04gyrid\x01\x04\x82\x84\x8b\x96'))
+        elif r < 0.9:
+            frames.append(frame(2, 0, random.choice([1, 2, 0x11]),
+                random.choice(aps), random.choice(devices), '\xaa' * 64))
+        else:
+            frames.append(frame(1, 10, 0, random.choice(aps),
+                random.choice(devices)))
+    return frames
+
+def bench_native(frames):
+    """
+    Decode all frames with the native decoder.
+    """
+    radiotap = dot11.RadiotapDecoder()
+    for data in frames:
+        dot11.decode(data, radiotap)
+
+def bench_scapy(frames):
+    """
+    Dissect all frames with scapy.
+    """
+    import scapy.all
+    radiotap = dot11.RadiotapDecoder()
+    for data in frames:
+        dot11.from_scapy(scapy.all.RadioTap(data), radiotap)
+
+def run(name, fn, frames):
+    """
+    Time the given benchmark function and print the number of frames/s.
+    """
+    start = time.time()
+    fn(frames)
+    duration = time.time() - start
+    sys.stdout.write("%-8s %8i frames in %6.3f s: %10.0f frames/s\n" % (
+        name, len(frames), duration, len(frames) / duration))
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    frames = generate(count)
+
+    run('native', bench_native, frames)
+    try:
+        import scapy.all
+    except ImportError:
+        sys.stdout.write("scapy   not available, skipped\n")
+    else:
+        run('scapy', bench_scapy, frames)
@@ -0,0 +1,245 @@
+#-*- coding: utf-8 -*-
+#
+# This file belongs to Gyrid.
+#
+# Gyrid is a mobile device scanner.
+# Copyright (C) 2014  Roel Huybrechts
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Replay WiFi frames from pcap or pcapng files through the WiFi processing
+pipeline, without a monitor mode adapter, NetworkManager or DBus. Neither
+scapy, PyBluez nor the wigy extension need to be installed. Used for
+benchmarking and regression testing.
+
+Frames should have a radiotap header, plain 802.11 frames get an empty one.
+When replaying as fast as possible, the original timestamps are used so the
+resulting wifi-RAW, wifi-DRW, wifi-DEV and wifi-ACP logs can be diffed between
+runs. As these timestamps don't follow the clock, the pools are then not
+checked for disappeared devices.
+
+Usage: python -m gyrid.testing.wifi_replay [options] file [file ...]
+"""
+
+import optparse
+import os
+import sys
+import time
+
+from gyrid import core, hashing, logger, scanmanager
+from gyrid.scanners import dot11, wifi
+from gyrid.testing import pcap
+
+RADIOTAP_EMPTY = '\x00\x00\x08\x00\x00\x00\x00\x00'
+
+class ReplayMain(object):
+    """
+    Stand-in for the Gyrid main object.
+    """
+    def __init__(self, configfile):
+        self.configfile = configfile
+        self.stopping = False
+
+    def log_error(self, level, message):
+        sys.stderr.write("%s: %s\n" % (level, message))
+
+class ReplayScanManager(scanmanager.DefaultScanManager):
+    """
+    Scanmanager writing its logs to the given directory, without DBus,
+    network connection or scanning hardware.
+    """
+    def __init__(self, main, location):
+        self.base_location = os.path.join(location, '')
+        self.makedirs(self.base_location)
+        scanmanager.ScanManager.__init__(self, main)
+
+    def init(self):
+        self.hashing = hashing.Hashing(self)
+        self.read_blacklist()
+
+class ReplayProtocol(wifi.WiFi):
+    """
+    WiFi protocol without hardware detection.
+    """
+    def __init__(self, mgr):
+        core.ScanProtocol.__init__(self, mgr)
+        self.frequencies = []
+        self.scanners = {}
+        self.loggers = {}
+
+class ReplayWiFiLogger(logger.WiFiLogger):
+    """
+    WiFi pool logger that doesn't check for disappeared devices.
+    """
+    def start(self):
+        self.pool.clear()
+        self.pending.clear()
+
+    def stop(self):
+        pass
+
+class ReplayScanner(wifi.WiFiScanner):
+    """
+    WiFi scanner reading its frames from capture files. Frames are processed
+    in the capture thread, and the time spent reading, decoding and
+    processing them is measured.
+    """
+    def __init__(self, mgr, protocol, filenames, speed=0,
+            mac='00:00:00:00:00:00'):
+        """
+        Initialisation.
+
+        @param   mgr         Reference to ScanManager instance.
+        @param   protocol    Reference to WiFi ScanProtocol.
+        @param   filenames   List of capture files to replay, in order.
+        @param   speed       Replay speed relative to real time, 0 to replay
+                               as fast as possible.
+        @param   mac         The MAC-address to log the frames for.
+        """
+        core.Scanner.__init__(self, mgr, protocol)
+        self.v = self.protocol.valid
+
+        self.mac = mac
+        self.iface = 'replay'
+        self.init_capture()
+        self.capture_mode = 'native'
+        self.capture_process = False
+        self.queue_size = 0
+
+        self.filenames = filenames
+        self.speed = speed
+        # Frames keep their original timestamps when replaying as fast as
+        # possible, so windows can only be closed by newer frames.
+        self.expire_aggregates = speed > 0
+        self.frames = 0
+        self.logged = 0
+        self.times = {'read': 0.0, 'decode': 0.0, 'process': 0.0}
+
+        if self.speed > 0:
+            pool = logger.WiFiLogger
+        else:
+            pool = ReplayWiFiLogger
+        loggers = (logger.WiFiRawLogger(self.mgr, self.mac),
+            logger.WiFiDevRawLogger(self.mgr, self.mac),
+            pool(self.mgr, self.mac, 'DEV'), pool(self.mgr, self.mac, 'ACP'),
+            logger.FrequencyLogger(self.mgr, self.mac))
+        for l in loggers[2:4]:
+            # Don't let the pool checkers keep us from exiting.
+            l.poolchecker.daemon = True
+        self.protocol.loggers[self.mac] = loggers
+
+    def replay(self):
+        """
+        Replay all capture files and wait until they are processed.
+
+        @return   The duration of the replay, in seconds.
+        """
+        started = time.time()
+        self.start_scanning().join()
+        return time.time() - started
+
+    def interface_down(self):
+        pass
+
+    def capture(self, process):
+        """
+        Read the frames from the capture files, pacing them according to the
+        replay speed.
+
+        @param   process   Function to call with each decoded frame and its
+                             timestamp.
+        @return            True when all frames are replayed.
+        """
+        clock = time.time
+        times = self.times
+        first = None
+        timestamp = 0
+        for filename in self.filenames:
+            packets = pcap.read(filename)
+            while not self.mgr.main.stopping:
+                t0 = clock()
+                try:
+                    ts, linktype, data = packets.next()
+                except StopIteration:
+                    break
+                t1 = clock()
+                times['read'] += t1 - t0
+
+                if linktype == pcap.LINKTYPE_IEEE802_11:
+                    data = RADIOTAP_EMPTY + data
+                elif linktype != pcap.LINKTYPE_IEEE802_11_RADIOTAP:
+                    continue
+                if ts is not None:
+                    timestamp = ts
+
+                if self.speed > 0:
+                    if first is None:
+                        first = timestamp
+                        started = t1
+                    timestamp = started + (timestamp - first) / self.speed
+                    delay = timestamp - clock()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                t2 = clock()
+                frame = dot11.decode(data, self.radiotap)
+                t3 = clock()
+                if frame is not None and process(frame, timestamp):
+                    self.logged += 1
+                t4 = clock()
+                times['decode'] += t3 - t2
+                times['process'] += t4 - t3
+                self.frames += 1
+        return True
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] file [file ...]")
+    parser.add_option('-o', '--output', default='/tmp/gyrid-replay',
+        help="directory to write the logs to [default: %default]")
+    parser.add_option('-c', '--config', help="configuration file to use " +
+        "[default: gyrid.conf in the output directory]")
+    parser.add_option('-s', '--speed', type='float', default=0,
+        help="replay speed relative to real time, 0 for as fast as " + \
+            "possible [default: %default]")
+    parser.add_option('-m', '--mac', default='00:00:00:00:00:00',
+        help="MAC-address of the replaying adapter [default: %default]")
+    options, args = parser.parse_args()
+    if not args:
+        parser.error("no capture files given")
+
+    mgr = ReplayScanManager(ReplayMain(options.config or os.path.join(
+        options.output, 'gyrid.conf')), options.output)
+    mgr.init()
+    scanner = ReplayScanner(mgr, ReplayProtocol(mgr), args, options.speed,
+        options.mac)
+    duration = scanner.replay()
+
+    frames = scanner.frames or 1
+    sys.stdout.write("%i frames in %0.3f s: %0.0f frames/s, %i logged\n" % (
+        scanner.frames, duration, scanner.frames / duration, scanner.logged))
+    for stage in ('read', 'decode', 'process'):
+        sys.stdout.write("%-8s %8.3f s %8.2f us/frame\n" % (stage,
+            scanner.times[stage], scanner.times[stage] * 1e6 / frames))
+    for path in (mgr.get_wifiraw_log_location(options.mac),
+            mgr.get_wifidevraw_log_location(options.mac),
+            mgr.get_wifi_log_location(options.mac, 'DEV'),
+            mgr.get_wifi_log_location(options.mac, 'ACP')):
+        lines = 0
+        if os.path.isfile(path):
+            lines = sum(1 for line in open(path))
+        sys.stdout.write("%s: %i lines\n" % (path, lines))
+
+if __name__ == '__main__':
+    main()
@@ -33,15 +33,20 @@ class CompressingRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
     """
     Subclassing TimedRotatingFileHandler to add bzipping on rollover.
     """
-    def __init__(self, mgr, filename):
+    def __init__(self, mgr, filename, header=None):
         """
         Initialisation.
 
         @param  mgr         Reference to ScanManager instance.
         @param  filename    Filename to write to.
+        @param  header      Line written each time the file is opened, so
+                              at the start of every new file, None for no
+                              header.
         """
         self.mgr = mgr
+        self.header = header
         logging.handlers.BaseRotatingHandler.__init__(self, filename, 'a')
+        self.write_header()
         self.backupCount = 0
         currentTime = int(time.time())
 
@@ -93,8 +98,17 @@ class CompressingRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
             self.stream = codecs.open(self.baseFilename, 'w', self.encoding)
         else:
             self.stream = open(self.baseFilename, 'w')
+        self.write_header()
         newRolloverAt = self.rolloverAt + self.interval
         currentTime = int(time.time())
         while newRolloverAt <= currentTime:
             newRolloverAt = newRolloverAt + self.interval
         self.rolloverAt = newRolloverAt
+
+    def write_header(self):
+        """
+        Write the header line to the stream, if any.
+        """
+        if self.header is not None:
+            self.stream.write('%s\n' % self.header)
+            self.stream.flush()
@@ -433,6 +433,9 @@ class InetClient(Int16StringReceiver):
         self.factory.ackmap.startChecker()
         self.factory.set_led(2, 1)
 
+        for line in self.factory.state.values():
+            self.sendLine(line)
+
     def connectionLost(self, reason):
         """
         Called when the connection has been lost.
@@ -486,6 +489,11 @@ class InetClient(Int16StringReceiver):
 
         @param   line   The line to send.
         """
+        if line.startswith('STATE') and ('raw_sampling' in line):
+            self.factory.state[line.split(',')[2], 'raw_sampling'] = line
+        elif line.startswith('STATE') and ('stopped_scanning' in line):
+            self.factory.state.pop((line.split(',')[2], 'raw_sampling'), None)
+
         msg = self.factory.buildMsg(line)
         if msg:
             self.sendMsg(msg)
@@ -727,6 +735,7 @@ class InetClientFactory(ReconnectingClientFactory):
             '/sys/class/leds/alix:%i' % i) for i in [2, 3]])
 
         self.connections = set()
+        self.state = {}
         self.cache_full = False
         self.cache_file = '/var/tmp/gyrid-network.cache'
         self.cache_maxsize = self.network.config.get_value('network_cache_limit')
@@ -804,12 +813,18 @@ class InetClientFactory(ReconnectingClientFactory):
             d = m.bluetooth_dataRaw
             if data.startswith('C'): m.cached = True
             data = dict(zip(['type', 'sensor_mac', 'timestamp', 'mac', 'deviceclass',
-                'tx_power', 'rssi'], data.split(',')))
+                'tx_power', 'rssi', 'count', 'rssi_min', 'rssi_max', 'last'],
+                data.split(',')))
             d.timestamp = float(data['timestamp'])
             d.hwid = procHwid(data['mac'])
             d.deviceclass = int(data['deviceclass'])
             d.rssi = int(data['rssi'])
             if data['tx_power'] != '': d.tx_power = int(data['tx_power'])
+            if 'count' in data:
+                d.count = int(data['count'])
+                if data['rssi_min'] != '': d.rssi_min = int(data['rssi_min'])
+                if data['rssi_max'] != '': d.rssi_max = int(data['rssi_max'])
+                d.timestamp_last = float(data['last'])
             if c['enable_sensor_mac']: d.sensorMac = procHwid(data['sensor_mac'])
             return m
 
@@ -836,11 +851,17 @@ class InetClientFactory(ReconnectingClientFactory):
             m.type = m.Type_WIFI_DATADEVRAW
             w = m.wifi_dataDevRaw
             if data.startswith('C'): m.cached = True
-            data = dict(zip(['type', 'timestamp', 'sensor_mac', 'hwid', 'freq', 'ssi'], data.split(',')))
+            data = dict(zip(['type', 'timestamp', 'sensor_mac', 'hwid', 'freq', 'ssi',
+                'count', 'ssi_min', 'ssi_max', 'last'], data.split(',')))
             w.timestamp = float(data['timestamp'])
             w.hwid = procHwid(data['hwid'])
             w.ssi = int(data['ssi'])
             w.frequency = int(data['freq'])
+            if 'count' in data:
+                w.count = int(data['count'])
+                if data['ssi_min'] != '': w.ssi_min = int(data['ssi_min'])
+                if data['ssi_max'] != '': w.ssi_max = int(data['ssi_max'])
+                w.timestamp_last = float(data['last'])
             if c['enable_sensor_mac']: w.sensorMac = procHwid(data['sensor_mac'])
             return m
 
@@ -925,6 +946,25 @@ class InetClientFactory(ReconnectingClientFactory):
                 d.frequency.append(int(f))
             return m
 
+        elif data.startswith('STATE') and ('raw_sampling' in data):
+            data = dict(zip(['type', 'hwType', 'sensor_mac', 'timestamp', 'subtype', 'rates'],
+                data.split(',')))
+            m = proto.Msg()
+            m.type = m.Type_WIFI_STATE_RAWSAMPLING
+            d = m.wifi_stateRawSampling
+            d.timestamp = float(data['timestamp'])
+            if c['enable_sensor_mac']: d.sensorMac = procHwid(data['sensor_mac'])
+            frametypes = {'data': proto.WiFi_DataRaw.FrameType_DATA,
+                          'ctrl': proto.WiFi_DataRaw.FrameType_CTRL,
+                          'mgmt': proto.WiFi_DataRaw.FrameType_MGMT}
+            for r in data['rates'].split(';'):
+                ftype, rate = r.split(':')
+                if ftype in frametypes:
+                    i = d.rate.add()
+                    i.frameType = frametypes[ftype]
+                    i.rate = float(rate)
+            return m
+
         elif data.startswith('STATE') and ('frequency,' in data) and \
             self.config['enable_state_frequency']:
             data = dict(zip(['type', 'hwType', 'sensor_mac', 'timestamp', 'subtype', 'frequency', 'duration'],